@@ -0,0 +1,99 @@
+"""Measure the detail-page crawl against a local catalogue mirror at rising concurrency.
+
+Serves --pages listing pages (20 books each, every book linked from its
+image and its title, with a detail page per book) from the CatalogueServer
+stand-in with --latency seconds per request. For each --levels value it
+runs crawler.crawl_books and reports pages/sec, detail pages fetched and
+how many requests the frontier's dedup saved. A final run is interrupted
+half way through and resumed from a checkpoint to count refetched pages.
+
+    python benchmarks/bench_crawl.py --pages 50 --latency 0.05 --levels 1,4,16
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from stand_ins import ROOT, CatalogueServer
+
+sys.path.insert(0, os.path.join(ROOT, 'extract_function'))
+
+import crawler  # noqa: E402
+from page_cache import open_store  # noqa: E402
+
+
+def listing_urls(catalogue, pages):
+    return [f"{catalogue.base_url}/page-{page}.html" for page in range(1, pages + 1)]
+
+
+def crawl(args, concurrency):
+    stats = {}
+    with CatalogueServer(num_pages=args.pages, latency=args.latency) as catalogue:
+        start = time.perf_counter()
+        records = sum(1 for _ in crawler.crawl_books(listing_urls(catalogue, args.pages), concurrency=concurrency,
+                                                     rate_limit=args.rate_limit, stats=stats))
+        elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'records': records,
+        'requests': catalogue.hits,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(catalogue.hits / elapsed, 1),
+        'links': stats['links'],
+        'duplicate_links': stats['duplicate_links'],
+        'dedup_savings': round(stats['duplicate_links'] / stats['links'], 3) if stats['links'] else 0.0,
+    }
+
+
+def resume(args, concurrency):
+    """Stop a checkpointed crawl half way, resume it and count pages requested twice"""
+    with tempfile.TemporaryDirectory() as directory, \
+            CatalogueServer(num_pages=args.pages, latency=args.latency) as catalogue:
+        location = os.path.join(directory, 'crawl.json')
+        urls = listing_urls(catalogue, args.pages)
+        first = crawler.crawl_books(urls, concurrency=concurrency, rate_limit=args.rate_limit,
+                                    checkpoint=crawler.CrawlCheckpoint(open_store(location), every=args.every))
+        for _ in range(catalogue.num_pages * catalogue.books_per_page // 2):
+            next(first)
+        first.close()
+        interrupted_at = catalogue.hits
+        stats = {}
+        records = sum(1 for _ in crawler.crawl_books(urls, concurrency=concurrency, rate_limit=args.rate_limit,
+                                                     stats=stats,
+                                                     checkpoint=crawler.CrawlCheckpoint(open_store(location))))
+        expected = catalogue.num_pages * (catalogue.books_per_page + 1)
+    return {
+        'concurrency': concurrency,
+        'records': records,
+        'requests_before_interrupt': interrupted_at,
+        'requests_after_resume': catalogue.hits - interrupted_at,
+        'resumed_records': stats['resumed'],
+        'refetched_pages': catalogue.hits - expected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds the mirror waits per request")
+    parser.add_argument('--levels', default='1,4,16', help="Comma-separated worker pool sizes")
+    parser.add_argument('--rate-limit', type=float, default=None, help="Requests per second per host")
+    parser.add_argument('--every', type=int, default=crawler.DEFAULT_CHECKPOINT_EVERY,
+                        help="Detail pages between checkpoint saves")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',')]
+    results = []
+    for level in levels:
+        result = crawl(args, level)
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    print(json.dumps({'pages': args.pages, 'latency': args.latency, 'rate_limit': args.rate_limit,
+                      'results': results, 'resume': resume(args, levels[-1])}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
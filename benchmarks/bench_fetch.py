@@ -0,0 +1,36 @@
+"""Benchmark concurrent catalogue fetching in extract_function.scrape_books.
+
+Serves synthetic catalogue pages from a local HTTP stand-in with a fixed
+per-request latency and reports pages/sec at several concurrency levels.
+
+    python benchmarks/bench_fetch.py --pages 50 --latency 0.05
+"""
+import argparse
+import time
+
+from stand_ins import CatalogueServer, load_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds of delay per request")
+    parser.add_argument('--levels', default='1,2,4,8,16', help="Comma-separated concurrency levels")
+    args = parser.parse_args()
+
+    extract = load_module('extract_function/main.py', 'extract_main')
+
+    with CatalogueServer(num_pages=args.pages, latency=args.latency) as server:
+        baseline = None
+        print(f"{'concurrency':>11}  {'seconds':>8}  {'pages/sec':>9}  {'same output':>11}")
+        for level in [int(value) for value in args.levels.split(',')]:
+            start = time.perf_counter()
+            books = extract.scrape_books(max_pages=args.pages, concurrency=level, base_url=server.base_url)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = books
+            print(f"{level:>11}  {elapsed:>8.2f}  {args.pages / elapsed:>9.1f}  {str(books == baseline):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare CSV, Parquet and Avro output of extract_function/writers.py.
+
+Encodes synthetic book records with each writer and reports bytes written,
+encode time and decode time. CSV decoding includes converting price and
+scraped_date back to typed values, which Parquet and Avro get for free.
+
+    python benchmarks/bench_formats.py --rows 1000000
+"""
+import argparse
+import csv
+import datetime
+import io
+import os
+import sys
+import time
+
+from stand_ins import ROOT, book_for
+
+sys.path.insert(0, os.path.join(ROOT, 'extract_function'))
+
+import writers  # noqa: E402
+
+
+def synthetic_records(rows):
+    for index in range(rows):
+        book = book_for(index)
+        yield {
+            'title': book['title'],
+            'price': book['price'],
+            'rating': book['rating'],
+            'scraped_date': '2024-01-15',
+        }
+
+
+def decode_csv(data):
+    rows = 0
+    for row in csv.DictReader(io.StringIO(data.decode('utf-8'))):
+        float(row['price'])
+        datetime.date.fromisoformat(row['scraped_date'])
+        rows += 1
+    return rows
+
+
+def decode_parquet(data):
+    return writers.pyarrow.parquet.read_table(io.BytesIO(data)).num_rows
+
+
+def decode_avro(data):
+    return sum(1 for _ in writers.fastavro.reader(io.BytesIO(data)))
+
+
+DECODERS = {'csv': decode_csv, 'parquet': decode_parquet, 'avro': decode_avro}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    formats = ['csv']
+    if writers.pyarrow is not None:
+        formats.append('parquet')
+    if writers.fastavro is not None:
+        formats.append('avro')
+
+    print(f"{args.rows} rows")
+    print(f"{'format':>8}  {'MB':>8}  {'vs csv':>6}  {'encode s':>8}  {'decode s':>8}")
+    csv_size = None
+    for output_format in formats:
+        start = time.perf_counter()
+        data = b''.join(writers.iter_chunks(synthetic_records(args.rows), output_format))
+        encode_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decoded = DECODERS[output_format](data)
+        decode_seconds = time.perf_counter() - start
+        assert decoded == args.rows, f"{output_format} decoded {decoded} rows"
+
+        csv_size = csv_size or len(data)
+        print(f"{output_format:>8}  {len(data) / 2 ** 20:>8.2f}  {len(data) / csv_size:>6.2f}  "
+              f"{encode_seconds:>8.2f}  {decode_seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare peak memory of the buffered and streaming extract-to-GCS paths.
+
+The buffered path is scrape_books() + save_to_gcs(): every record is kept in a
+list and the whole CSV is rendered into a StringIO before upload. The
+streaming path is iter_books() + stream_to_gcs(). Each run happens in a fresh
+subprocess against a local catalogue stand-in and a fake storage backend so
+peak RSS reflects only that path.
+
+    python benchmarks/bench_memory.py --pages 10,100,1000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from stand_ins import CatalogueServer, FakeStorageClient, load_module
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def run_child(path, pages, base_url, concurrency):
+    extract = load_module('extract_function/main.py', 'extract_main')
+    storage_client = FakeStorageClient(keep_data=False)
+    baseline_mb = current_rss_mb()
+    start = time.perf_counter()
+
+    if path == 'buffered':
+        books = extract.scrape_books(max_pages=pages, concurrency=concurrency, base_url=base_url)
+        extract.save_to_gcs(books, 'bench', 'books.csv', storage_client=storage_client)
+        rows = len(books)
+    else:
+        books = extract.iter_books(max_pages=pages, concurrency=concurrency, base_url=base_url)
+        _, rows = extract.stream_to_gcs(books, 'bench', 'books.csv', storage_client=storage_client)
+
+    print(json.dumps({
+        'rows': rows,
+        'bytes': storage_client.sizes[('bench', 'books.csv')],
+        'seconds': time.perf_counter() - start,
+        'baseline_mb': baseline_mb,
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', default='10,100,1000', help="Comma-separated page counts")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--child', choices=['buffered', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, int(args.pages), args.base_url, args.concurrency)
+        return
+
+    page_counts = [int(value) for value in args.pages.split(',')]
+    with CatalogueServer(num_pages=max(page_counts)) as server:
+        print(f"{'pages':>6}  {'path':>9}  {'rows':>7}  {'MB written':>10}  {'seconds':>7}  {'peak RSS MB':>11}  {'over baseline':>13}")
+        for pages in page_counts:
+            for path in ('buffered', 'streaming'):
+                output = subprocess.run(
+                    [sys.executable, __file__, '--child', path, '--pages', str(pages),
+                     '--base-url', server.base_url, '--concurrency', str(args.concurrency)],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{pages:>6}  {path:>9}  {result['rows']:>7}  {result['bytes'] / 2 ** 20:>10.2f}  "
+                      f"{result['seconds']:>7.2f}  {result['peak_mb']:>11.1f}  "
+                      f"{result['peak_mb'] - result['baseline_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Measure what the shared metrics module costs per recorded value.
+
+Times counter increments, histogram observations and the `time()` context
+manager against an empty loop, single-threaded and from several threads at
+once, then routes feedback through the sentiment router (fake clients with
+no latency, so instrumentation is as large a share of the work as it can
+be) with metrics on and off.
+
+    python benchmarks/bench_metrics.py --ops 200000 --threads 8
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+from stand_ins import ROOT, FakeLanguageClient, FakeSecretClient, FakeSlack
+
+sys.path.insert(0, os.path.join(ROOT, 'functions', 'shared'))
+
+import metrics  # noqa: E402
+from sentiment_cache import SentimentCache  # noqa: E402
+from sentiment_router import DEFAULT_SINKS, SentimentRouter, build_sinks, make_analyzer  # noqa: E402
+from token_cache import TokenCache, secret_fetcher  # noqa: E402
+
+MESSAGES = [
+    "I love the new dashboard, great work",
+    "The app is broken again and support is slow",
+    "Delivery arrived on Tuesday",
+]
+
+
+def per_op_ns(operation, ops, threads):
+    """Wall-clock nanoseconds per call of `operation`, split over `threads` threads"""
+    per_thread = ops // threads
+
+    def loop():
+        for _ in range(per_thread):
+            operation()
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) * 1e9 / (per_thread * threads)
+
+
+def micro(args):
+    registry = metrics.Registry()
+    counter = registry.counter('bench_total', 'Bench counter')
+    labelled = registry.counter('bench_labelled_total', 'Bench counter', labels=('outcome',))
+    histogram = registry.histogram('bench_seconds', 'Bench histogram', labels=('stage',))
+
+    def timed():
+        with histogram.time(stage='parse'):
+            pass
+
+    operations = [
+        ('empty loop', lambda: None),
+        ('counter.inc()', counter.inc),
+        ('counter.inc(outcome=...)', lambda: labelled.inc(outcome='ok')),
+        ('histogram.observe()', lambda: histogram.observe(0.012, stage='fetch')),
+        ('with histogram.time()', timed),
+    ]
+    print(f"{'operation':<28}{'threads':>8}{'ns/op':>10}{'overhead':>10}")
+    for threads in sorted({1, args.threads}):
+        baseline = None
+        for name, operation in operations:
+            ns = per_op_ns(operation, args.ops, threads)
+            baseline = ns if baseline is None else baseline
+            print(f"{name:<28}{threads:>8}{ns:>10.0f}{ns - baseline:>10.0f}")
+    print(f"Rendered {len(registry.render().splitlines())} exposition lines")
+
+
+def route_throughput(messages):
+    secret_client = FakeSecretClient()
+    token_cache = TokenCache(secret_fetcher(secret_client, 'bench-project', 'SLACK_TOKEN'))
+    sinks = build_sinks(DEFAULT_SINKS, token_cache=token_cache)
+    slack = FakeSlack()
+    for sentiment_sinks in sinks.values():
+        for sink in sentiment_sinks:
+            sink.post = slack
+    # No cache, so every message goes through the (instrumented) NL API call
+    router = SentimentRouter(make_analyzer(FakeLanguageClient(), SentimentCache(max_entries=0)), sinks)
+    feedback = [{'user_id': f'user-{index}', 'message': MESSAGES[index % len(MESSAGES)]}
+                for index in range(messages)]
+    start = time.perf_counter()
+    for item in feedback:
+        router.route(item)
+    return messages / (time.perf_counter() - start)
+
+
+def end_to_end(args):
+    logging.disable(logging.CRITICAL)
+    results = {}
+    for enabled in (False, True, False, True):
+        metrics.ENABLED = enabled
+        results.setdefault(enabled, []).append(route_throughput(args.messages))
+    metrics.ENABLED = True
+    off, on = max(results[False]), max(results[True])
+    print(f"Router with metrics off: {off:,.0f} msg/s")
+    print(f"Router with metrics on:  {on:,.0f} msg/s ({(off - on) / off:.1%} slower, "
+          f"{(1 / on - 1 / off) * 1e6:.1f} us per message)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=200000, help="Calls per micro-benchmark")
+    parser.add_argument('--threads', type=int, default=8, help="Threads for the contended run")
+    parser.add_argument('--messages', type=int, default=5000, help="Messages routed per end-to-end run")
+    args = parser.parse_args()
+    micro(args)
+    print()
+    end_to_end(args)
+
+
+if __name__ == "__main__":
+    main()
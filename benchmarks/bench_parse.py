@@ -0,0 +1,58 @@
+"""Micro-benchmark the HTML parser backends in extract_function/parsers.py.
+
+Parses the saved fixture page (test/fixtures) plus synthetic catalogue pages
+with every available backend, checks that each produces the same records as
+the BeautifulSoup reference, and reports parse time per page.
+
+    python benchmarks/bench_parse.py --pages 50 --repeat 5
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from stand_ins import ROOT, render_catalogue_page
+
+sys.path.insert(0, os.path.join(ROOT, 'extract_function'))
+
+import parsers  # noqa: E402
+
+
+def load_pages(synthetic_pages):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'test', 'fixtures', 'catalogue_page-*.html'))):
+        with open(path, 'rb') as fixture:
+            pages.append(fixture.read())
+    pages.extend(render_catalogue_page(page, synthetic_pages) for page in range(1, synthetic_pages + 1))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50, help="Synthetic pages in addition to the fixtures")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    reference = [parsers.parse_books_soup(page) for page in pages]
+
+    print(f"{len(pages)} pages, {sum(len(records) for records in reference)} records")
+    print(f"{'backend':>8}  {'ms/page':>8}  {'pages/sec':>9}  {'speedup':>7}  {'same records':>12}")
+    baseline = None
+    for name in parsers.available_parsers():
+        parse = parsers.PARSERS[name]
+        same = [parse(page) for page in pages] == reference
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for page in pages:
+                parse(page)
+            best = min(best, time.perf_counter() - start)
+        per_page = best / len(pages)
+        baseline = baseline or per_page
+        print(f"{name:>8}  {per_page * 1000:>8.2f}  {1 / per_page:>9.0f}  {baseline / per_page:>6.1f}x  {str(same):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Run the whole pipeline in-process and report per-stage metrics as JSON.
+
+Drives the real entry points against local stand-ins, feeding each stage
+the output of the one before:
+
+1. extract: extract_function.extract_to_gcs scrapes a local catalogue server
+   into fake GCS.
+2. load: load_function.gcs_to_bigquery loads those objects into fake
+   BigQuery.
+3. receiver: POST / on functions/feedback-receiver publishes feedback to a
+   fake Pub/Sub publisher.
+4. sentiment: the published messages are pushed to functions/sentiment-router,
+   which uses a fake NL API and fake Slack.
+
+For each stage it reports latency percentiles, throughput and peak RSS. Peak
+RSS is reset between stages through /proc/self/clear_refs where the kernel
+allows it. Use --output to save a run and --baseline to compare with an
+earlier one.
+
+    python benchmarks/bench_pipeline.py --pages 20 --feedback 2000 --output run.json
+    python benchmarks/bench_pipeline.py --baseline run.json
+"""
+import argparse
+import base64
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stand_ins import (ROOT, CatalogueServer, FakeBigQueryClient, FakeLanguageClient, FakePublisherClient,
+                       FakeSecretClient, FakeSlack, FakeStorageClient, load_module)
+
+FEEDBACK = [
+    "I love the new release, great work",
+    "Checkout is broken again and support is slow",
+    "My order arrived on Tuesday",
+    "Excellent service, thank you",
+    "Terrible experience, I want a refund",
+]
+
+
+class Request:
+    """Just enough of flask.Request for the Cloud Function entry points"""
+
+    def __init__(self, body):
+        self.body = body
+
+    def get_json(self, silent=False):
+        return self.body
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            return int(re.search(r'VmHWM:\s+(\d+)', status.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(latencies, items, elapsed, unit, peak_mb, **extra):
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return dict({
+        'requests': len(latencies),
+        'items': items,
+        'seconds': elapsed,
+        'throughput': {'value': items / elapsed if elapsed else 0.0, 'unit': unit},
+        'latency_ms': {
+            'p50': percentile(0.50),
+            'p90': percentile(0.90),
+            'p99': percentile(0.99),
+            'max': ordered[-1] * 1000,
+            'mean': statistics.mean(latencies) * 1000,
+        },
+        'peak_rss_mb': peak_mb,
+    }, **extra)
+
+
+def run_concurrently(call, work, concurrency):
+    """Run call(item) over work on a thread pool; returns (latencies, results, elapsed)"""
+    def timed(item):
+        start = time.perf_counter()
+        result = call(item)
+        return time.perf_counter() - start, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, work))
+    elapsed = time.perf_counter() - start
+    return [latency for latency, _ in outcomes], [result for _, result in outcomes], elapsed
+
+
+def stage(name):
+    """Reset peak RSS before the stage and keep the services' prints off stdout"""
+    def decorator(function):
+        def wrapper(args, *rest):
+            reset_peak_rss()
+            print(f"running {name}...", file=sys.stderr)
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(sys.stderr if args.verbose else devnull):
+                    return function(args, *rest)
+        return wrapper
+    return decorator
+
+
+@stage('extract')
+def run_extract(args, storage_client):
+    from google.cloud import storage
+    storage.Client = lambda *a, **k: storage_client
+    extract = load_module('extract_function/main.py', 'pipeline_extract')
+
+    uris, books = [], 0
+    latencies = []
+    with CatalogueServer(args.pages, latency=args.page_latency) as server:
+        os.environ['CATALOGUE_BASE_URL'] = server.base_url
+        start = time.perf_counter()
+        for _ in range(args.extract_runs):
+            run_start = time.perf_counter()
+            result = extract.extract_to_gcs(Request({'max_pages': args.pages, 'concurrency': args.fetch_concurrency,
+                                                     'format': args.format}))
+            latencies.append(time.perf_counter() - run_start)
+            body = json.loads(result if isinstance(result, str) else result[0])
+            assert body['status'] == 'success', body
+            uris.append(body['gcs_uri'])
+            books += int(body['message'].split()[1])
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, books, elapsed, 'books/s', peak_rss_mb(), pages=args.pages * args.extract_runs), uris
+
+
+@stage('load')
+def run_load(args, uris, storage_client):
+    from google.cloud import bigquery
+    client = FakeBigQueryClient(rows_per_load=args.pages * 20, job_latency=args.job_latency)
+    bigquery.Client = lambda *a, **k: client
+    load = load_module('load_function/main.py', 'pipeline_load')
+    load._clients[('storage', None)] = storage_client
+
+    work = [uris[index % len(uris)] for index in range(args.load_requests)]
+
+    def call(uri):
+        result = load.gcs_to_bigquery(Request({'gcs_uri': uri, 'dedup_on': 'title'}))
+        body = json.loads(result[0] if isinstance(result, tuple) else result)
+        assert body['status'] == 'success', body
+        return body['rows_loaded']
+
+    latencies, rows, elapsed = run_concurrently(call, work, args.concurrency)
+    return summarize(latencies, sum(rows), elapsed, 'rows/s', peak_rss_mb(), jobs=len(client.loads))
+
+
+@stage('receiver')
+def run_receiver(args):
+    from google.cloud import pubsub_v1
+    publisher = FakePublisherClient(rpc_latency=args.rpc_latency)
+    pubsub_v1.PublisherClient = lambda *a, **k: publisher
+    receiver = load_module('functions/feedback-receiver/app.py', 'pipeline_receiver')
+    receiver.logger.setLevel('WARNING')
+    receiver.PUBLISH_MODE = args.publish_mode
+    local = threading.local()
+
+    def call(index):
+        if not hasattr(local, 'client'):
+            local.client = receiver.app.test_client()
+        body = {'user_id': f"user{index}@example.com", 'message': f"{FEEDBACK[index % len(FEEDBACK)]} #{index}"}
+        response = local.client.post('/', json=body)
+        assert response.status_code in (200, 202), response.get_data(as_text=True)
+        return 1
+
+    latencies, _, elapsed = run_concurrently(call, range(args.feedback), args.concurrency)
+    while len(publisher.published) < args.feedback:
+        time.sleep(0.01)
+    return summarize(latencies, args.feedback, elapsed, 'messages/s', peak_rss_mb(),
+                     publish_rpcs=publisher.batches), publisher.published
+
+
+@stage('sentiment')
+def run_sentiment(args, published):
+    from google.cloud import language_v1, secretmanager
+    language_client = FakeLanguageClient(latency=args.nl_latency)
+    language_v1.LanguageServiceClient = lambda *a, **k: language_client
+    secretmanager.SecretManagerServiceClient = lambda *a, **k: FakeSecretClient()
+    os.environ.setdefault('SLACK_DIGEST_WINDOW', '1')
+    router = load_module('functions/sentiment-router/main.py', 'pipeline_router')
+    slack = FakeSlack(latency=args.slack_latency)
+    if router.slack_dispatcher is not None:
+        router.slack_dispatcher.session = slack
+    else:
+        for sinks in router.router.sinks.values():
+            for sink in sinks:
+                sink.post = slack
+    local = threading.local()
+
+    def call(message):
+        if not hasattr(local, 'client'):
+            local.client = router.app.test_client()
+        envelope = {'message': {'data': base64.b64encode(message['data']).decode('ascii'),
+                                'messageId': message['message_id']}}
+        response = local.client.post('/', json=envelope)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return 1
+
+    latencies, _, elapsed = run_concurrently(call, published, args.concurrency)
+    drain_start = time.perf_counter()
+    if router.slack_dispatcher is not None:
+        router.slack_dispatcher.close()
+    drain = time.perf_counter() - drain_start
+    return summarize(latencies, len(published), elapsed, 'messages/s', peak_rss_mb(),
+                     nl_calls=len(language_client.calls), slack_posts=len(slack.posts), slack_drain_seconds=drain)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    print(f"{'stage':>10}  {'throughput':>22}  {'p50 ms':>18}  {'p99 ms':>18}  {'peak MB':>16}", file=sys.stderr)
+    for name, current in report['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is None:
+            continue
+
+        def delta(now, before):
+            change = (now - before) / before * 100 if before else 0.0
+            return f"{now:>9.1f} ({change:+6.1f}%)"
+        print(f"{name:>10}  {delta(current['throughput']['value'], previous['throughput']['value']):>22}  "
+              f"{delta(current['latency_ms']['p50'], previous['latency_ms']['p50']):>18}  "
+              f"{delta(current['latency_ms']['p99'], previous['latency_ms']['p99']):>18}  "
+              f"{delta(current['peak_rss_mb'], previous['peak_rss_mb']):>16}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help="Catalogue pages per extract run")
+    parser.add_argument('--extract-runs', type=int, default=3)
+    parser.add_argument('--fetch-concurrency', type=int, default=8)
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'avro'])
+    parser.add_argument('--load-requests', type=int, default=50)
+    parser.add_argument('--feedback', type=int, default=2000, help="Feedback messages sent to the receiver")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent callers for request stages")
+    parser.add_argument('--publish-mode', default='sync', choices=['sync', 'async'])
+    parser.add_argument('--page-latency', type=float, default=0.02, help="Catalogue server latency in seconds")
+    parser.add_argument('--job-latency', type=float, default=0.05, help="Fake BigQuery job latency")
+    parser.add_argument('--rpc-latency', type=float, default=0.02, help="Fake Publish RPC latency")
+    parser.add_argument('--nl-latency', type=float, default=0.05, help="Fake NL API latency")
+    parser.add_argument('--slack-latency', type=float, default=0.02, help="Fake Slack API latency")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Earlier JSON report to compare against")
+    parser.add_argument('--verbose', action='store_true', help="Show the services' own output")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    storage_client = FakeStorageClient(keep_data=False)
+    stages = {}
+    stages['extract'], uris = run_extract(args, storage_client)
+    stages['load'] = run_load(args, uris, storage_client)
+    stages['receiver'], published = run_receiver(args)
+    stages['sentiment'] = run_sentiment(args, published)
+
+    report = {
+        'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'peak_rss_per_stage': reset_peak_rss(),
+        'config': vars(args),
+        'stages': stages,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+        print(f"wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(report, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
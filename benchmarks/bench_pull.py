@@ -0,0 +1,144 @@
+"""Compare push and pull-mode throughput of the sentiment router.
+
+The push path mirrors the deployed service: one HTTP request per message,
+with a base64 envelope, handled by a Flask app on a fixed number of request
+threads (the gunicorn `--threads 8` of the Dockerfile). The pull path
+streams the same messages through BatchWorker from a subscriber with flow
+control. Both route through functions/shared with fake NL and Slack APIs.
+Pass --emulator to pull from the Pub/Sub emulator at PUBSUB_EMULATOR_HOST.
+
+    python benchmarks/bench_pull.py --messages 2000 --nl-latency 0.05
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, request
+
+from stand_ins import ROOT, FakeLanguageClient, FakeSecretClient, FakeSlack, FakeSubscriberClient
+
+sys.path.insert(0, os.path.join(ROOT, 'functions', 'shared'))
+
+from pull_worker import BatchWorker, run_subscriber  # noqa: E402
+from sentiment_cache import SentimentCache  # noqa: E402
+from sentiment_router import DEFAULT_SINKS, SentimentRouter, build_sinks, handle_pulled, handle_push, make_analyzer  # noqa: E402
+from token_cache import TokenCache, secret_fetcher  # noqa: E402
+
+
+def build_router(args):
+    token_cache = TokenCache(secret_fetcher(FakeSecretClient(), 'bench-project', 'SLACK_TOKEN'))
+    sinks = build_sinks(DEFAULT_SINKS, token_cache=token_cache)
+    slack = FakeSlack(latency=args.slack_latency)
+    for sentiment_sinks in sinks.values():
+        for sink in sentiment_sinks:
+            sink.post = slack
+    language_client = FakeLanguageClient(latency=args.nl_latency)
+    # No cache reuse: every message is distinct
+    return SentimentRouter(make_analyzer(language_client, SentimentCache(max_entries=0)), sinks)
+
+
+def payloads(count):
+    messages = ["I love the new release", "Checkout is broken again", "Order arrived today"]
+    return [json.dumps({'user_id': f"user{index}@example.com",
+                        'message': f"{messages[index % len(messages)]} #{index}"}).encode('utf-8')
+            for index in range(count)]
+
+
+def run_push(args, data):
+    router = build_router(args)
+    app = Flask(__name__)
+
+    @app.route('/', methods=['POST'])
+    def process_pubsub_message():
+        return handle_push(request.get_json(), router)
+
+    local = threading.local()
+
+    def deliver(payload):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        envelope = {'message': {'data': base64.b64encode(payload).decode('ascii'), 'messageId': '1'}}
+        return local.client.post('/', json=envelope).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.push_threads) as executor:
+        statuses = list(executor.map(deliver, data))
+    elapsed = time.perf_counter() - start
+    assert set(statuses) == {200}, statuses
+    return elapsed
+
+
+def run_pull(args, data):
+    router = build_router(args)
+    if args.emulator:
+        from google.cloud import pubsub_v1
+        publisher = pubsub_v1.PublisherClient()
+        subscriber = pubsub_v1.SubscriberClient()
+        topic = publisher.topic_path('bench-project', 'bench-feedback')
+        subscription = subscriber.subscription_path('bench-project', 'bench-pull')
+        publisher.create_topic(name=topic)
+        subscriber.create_subscription(name=subscription, topic=topic)
+        for future in [publisher.publish(topic, payload) for payload in data]:
+            future.result()
+    else:
+        subscriber = FakeSubscriberClient()
+        subscription = subscriber.subscription_path('bench-project', 'bench-pull')
+        for payload in data:
+            subscriber.enqueue(payload)
+
+    done = threading.Event()
+    acked = [0]
+    lock = threading.Lock()
+
+    def handle(message):
+        ok = handle_pulled(message, router)
+        with lock:
+            acked[0] += 1
+            if acked[0] >= len(data):
+                done.set()
+        return ok
+
+    worker = BatchWorker(handle, max_batch_size=args.batch_size, max_batch_latency=args.batch_latency,
+                         max_workers=args.pull_workers)
+    start = time.perf_counter()
+    runner = threading.Thread(target=run_subscriber, args=(subscriber, subscription, worker),
+                              kwargs={'max_messages': args.max_outstanding, 'stop_event': done})
+    runner.start()
+    done.wait()
+    elapsed = time.perf_counter() - start
+    runner.join()
+    return elapsed, worker.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--nl-latency', type=float, default=0.05, help="Fake NL API latency in seconds")
+    parser.add_argument('--slack-latency', type=float, default=0.02, help="Fake Slack API latency")
+    parser.add_argument('--push-threads', type=int, default=8, help="Request threads of one push instance")
+    parser.add_argument('--pull-workers', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--batch-latency', type=float, default=0.5)
+    parser.add_argument('--max-outstanding', type=int, default=1000)
+    parser.add_argument('--emulator', action='store_true', help="Pull from the emulator at PUBSUB_EMULATOR_HOST")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    data = payloads(args.messages)
+    print(f"{args.messages} messages, NL API {args.nl_latency * 1000:.0f} ms, Slack {args.slack_latency * 1000:.0f} ms")
+    print(f"{'path':>5}  {'seconds':>7}  {'msg/s':>7}  details")
+    elapsed = run_push(args, data)
+    print(f"{'push':>5}  {elapsed:>7.2f}  {args.messages / elapsed:>7.0f}  {args.push_threads} request threads")
+    elapsed, stats = run_pull(args, data)
+    print(f"{'pull':>5}  {elapsed:>7.2f}  {args.messages / elapsed:>7.0f}  {args.pull_workers} workers, "
+          f"{stats['batches']} batches, {stats['nacked']} nacked")
+
+
+if __name__ == "__main__":
+    main()
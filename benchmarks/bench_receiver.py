@@ -0,0 +1,85 @@
+"""Load-test the feedback receiver's publish modes.
+
+Drives functions/feedback-receiver/app.py in-process through Flask's test
+client from a pool of concurrent callers and reports p50/p99 latency and
+requests/sec for the synchronous and asynchronous publish modes. Publishing
+goes to an in-process fake with a configurable Publish RPC latency, or to
+the Pub/Sub emulator when PUBSUB_EMULATOR_HOST is set and --emulator given.
+
+    python benchmarks/bench_receiver.py --requests 2000 --concurrency 32
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stand_ins import FakePublisherClient, load_module
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(receiver, mode, requests, concurrency):
+    receiver.PUBLISH_MODE = mode
+    local = threading.local()
+    body = json.dumps({'user_id': 'bench@example.com', 'message': 'The checkout page keeps timing out.'})
+
+    def call(_):
+        if not hasattr(local, 'client'):
+            local.client = receiver.app.test_client()
+        start = time.perf_counter()
+        response = local.client.post('/', data=body, content_type='application/json')
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'mode': mode,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'rps': requests / elapsed,
+        'statuses': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rpc-latency', type=float, default=0.02, help="Fake Publish RPC latency in seconds")
+    parser.add_argument('--emulator', action='store_true', help="Publish to the emulator at PUBSUB_EMULATOR_HOST")
+    args = parser.parse_args()
+
+    receiver = load_module('functions/feedback-receiver/app.py', 'feedback_receiver')
+    receiver.logger.setLevel('WARNING')
+    if args.emulator:
+        receiver.publisher.create_topic(name=receiver.topic_path)
+    else:
+        receiver.publisher = FakePublisherClient(rpc_latency=args.rpc_latency)
+        receiver.topic_path = receiver.publisher.topic_path('bench-project', 'feedback-topic')
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent callers")
+    print(f"{'mode':>6}  {'p50 ms':>7}  {'p99 ms':>7}  {'req/s':>7}  statuses")
+    for mode in ('sync', 'async'):
+        result = run(receiver, mode, args.requests, args.concurrency)
+        print(f"{mode:>6}  {result['p50_ms']:>7.2f}  {result['p99_ms']:>7.2f}  {result['rps']:>7.0f}  {result['statuses']}")
+    if not args.emulator:
+        time.sleep(args.rpc_latency * 5)
+        published = len(receiver.publisher.published)
+        print(f"published {published} messages in {receiver.publisher.batches} Publish RPCs")
+
+
+if __name__ == "__main__":
+    main()
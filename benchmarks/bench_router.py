@@ -0,0 +1,105 @@
+"""Compare the sentiment router with the two legacy subscriber services.
+
+Every feedback message is pushed to both positive-sentiment and
+negative-sentiment, so each one analyzes the same text. The router analyzes
+it once and dispatches by sentiment. Both layouts are built from
+functions/shared with fake Natural Language, Secret Manager and Slack
+clients, and the benchmark reports API calls and per-message latency.
+
+    python benchmarks/bench_router.py --messages 500 --nl-latency 0.05
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+from stand_ins import ROOT, FakeLanguageClient, FakeSecretClient, FakeSlack
+
+sys.path.insert(0, os.path.join(ROOT, 'functions', 'shared'))
+
+from sentiment_cache import SentimentCache  # noqa: E402
+from sentiment_router import DEFAULT_SINKS, SentimentRouter, build_sinks, handle_push, make_analyzer  # noqa: E402
+from token_cache import TokenCache, secret_fetcher  # noqa: E402
+
+MESSAGES = [
+    "I love the new dashboard, great work",
+    "The app is broken again and support is slow",
+    "Delivery arrived on Tuesday",
+    "Excellent and fast checkout",
+    "Worst update ever, I want a refund",
+]
+
+
+def build_service(sinks_config, language_client, secret_client, slack, cache_size):
+    token_cache = TokenCache(secret_fetcher(secret_client, 'bench-project', 'SLACK_TOKEN'))
+    sinks = build_sinks(sinks_config, token_cache=token_cache)
+    for sentiment_sinks in sinks.values():
+        for sink in sentiment_sinks:
+            sink.post = slack
+    return SentimentRouter(make_analyzer(language_client, SentimentCache(max_entries=cache_size)), sinks)
+
+
+def run(layout, envelopes, args):
+    language_client = FakeLanguageClient(latency=args.nl_latency)
+    secret_client = FakeSecretClient(latency=args.secret_latency)
+    slack = FakeSlack(latency=args.slack_latency)
+    if layout == 'legacy':
+        # One service per sentiment, each subscribed to every message
+        services = [build_service({sentiment: DEFAULT_SINKS[sentiment]}, language_client, secret_client,
+                                  slack, args.cache_size)
+                    for sentiment in ('positive', 'negative')]
+    else:
+        services = [build_service(DEFAULT_SINKS, language_client, secret_client, slack, args.cache_size)]
+
+    latencies = []
+    for envelope in envelopes:
+        start = time.perf_counter()
+        for service in services:
+            body, status = handle_push(envelope, service)
+            assert status == 200, body
+        latencies.append(time.perf_counter() - start)
+    return {
+        'layout': layout,
+        'nl_calls': len(language_client.calls),
+        'secret_reads': len(secret_client.accesses),
+        'slack_posts': len(slack.posts),
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'total_s': sum(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--nl-latency', type=float, default=0.05, help="Fake NL API latency in seconds")
+    parser.add_argument('--secret-latency', type=float, default=0.03, help="Fake Secret Manager latency")
+    parser.add_argument('--slack-latency', type=float, default=0.02, help="Fake Slack API latency")
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help="Sentiment cache entries per service (0 disables reuse of repeats)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    rng = random.Random(7)
+    envelopes = []
+    for index in range(args.messages):
+        # Make each message distinct so the cache does not hide the duplicate analysis
+        feedback = {'user_id': f"user{index}@example.com", 'message': f"{rng.choice(MESSAGES)} #{index}"}
+        data = base64.b64encode(json.dumps(feedback).encode('utf-8')).decode('ascii')
+        envelopes.append({'message': {'data': data}})
+
+    print(f"{args.messages} messages, NL API {args.nl_latency * 1000:.0f} ms")
+    print(f"{'layout':>7}  {'NL calls':>8}  {'secrets':>7}  {'slack':>5}  {'ms/msg':>7}  {'total s':>7}")
+    for layout in ('legacy', 'router'):
+        result = run(layout, envelopes, args)
+        print(f"{layout:>7}  {result['nl_calls']:>8}  {result['secret_reads']:>7}  {result['slack_posts']:>5}  "
+              f"{result['mean_ms']:>7.1f}  {result['total_s']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
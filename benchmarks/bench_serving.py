@@ -0,0 +1,169 @@
+"""Compare the feedback receiver's Flask and ASGI serving modes at rising concurrency.
+
+Each mode runs in its own process the way it is deployed: Flask under
+gunicorn with one gthread worker and 8 threads (the Dockerfile's command),
+ASGI under uvicorn. Publishing goes to the in-process fake publisher with a
+configurable Publish RPC latency. A keep-alive HTTP/1.1 load generator holds
+--levels open connections, each sending requests back to back for
+--duration seconds, and reports requests/sec, p50/p99 latency and status
+counts per mode and level.
+
+    python benchmarks/bench_serving.py --levels 16,64,256,1024 --rpc-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BODY = json.dumps({'user_id': 'bench@example.com', 'message': 'The checkout page keeps timing out.'}).encode('utf-8')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def serve(mode, port, rpc_latency, publish_mode):
+    """Runs in the server process: load the receiver with the fake publisher and serve until killed"""
+    from stand_ins import FakePublisherClient, load_module
+
+    asgi = load_module('functions/feedback-receiver/asgi.py', 'serving_asgi')
+    receiver = asgi.receiver
+    receiver.publisher = FakePublisherClient(rpc_latency=rpc_latency)
+    receiver.topic_path = 'projects/bench/topics/feedback'
+    receiver.PUBLISH_MODE = publish_mode
+
+    if mode == 'asgi':
+        import uvicorn
+        server = uvicorn.Server(uvicorn.Config(asgi.app, host='127.0.0.1', port=port, log_level='warning',
+                                               access_log=False, backlog=4096))
+        server.run()
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class Gunicorn(BaseApplication):
+        def load_config(self):
+            for key, value in {'bind': f'127.0.0.1:{port}', 'workers': 1, 'threads': 8,
+                               'worker_class': 'gthread', 'backlog': 4096, 'loglevel': 'warning'}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return receiver.app
+
+    Gunicorn().run()
+
+
+async def request(reader, writer, port):
+    writer.write(b'POST / HTTP/1.1\r\nHost: 127.0.0.1:%d\r\nContent-Type: application/json\r\n'
+                 b'Content-Length: %d\r\n\r\n%s' % (port, len(BODY), BODY))
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+    await reader.readexactly(length)
+    return int(status_line.split()[1]), keep_alive
+
+
+async def connection(port, deadline, latencies, statuses):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await request(reader, writer, port)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+            keep_alive = False
+            status = None
+        if status is not None:
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, concurrency, duration):
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(port, start + duration, latencies, statuses) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'statuses': {str(key): value for key, value in statuses.items()},
+    }
+
+
+def start_server(mode, args):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(args.port),
+               '--rpc-latency', str(args.rpc_latency), '--publish-mode', args.publish_mode]
+    process = subprocess.Popen(command, cwd=ROOT, env=dict(os.environ, LOG_LEVEL='WARNING'))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{mode} server exited with {process.returncode}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{args.port}/health', timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit(f"{mode} server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='flask,asgi', help="Comma-separated serving modes to compare")
+    parser.add_argument('--levels', default='16,64,256,1024', help="Comma-separated concurrent connection counts")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds of load per level")
+    parser.add_argument('--rpc-latency', type=float, default=0.05, help="Seconds per fake Publish RPC")
+    parser.add_argument('--publish-mode', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--serve', choices=['flask', 'asgi'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.rpc_latency, args.publish_mode)
+        return
+
+    results = []
+    for mode in args.modes.split(','):
+        process = start_server(mode, args)
+        try:
+            for level in (int(level) for level in args.levels.split(',')):
+                result = asyncio.run(load(args.port, level, args.duration))
+                result['mode'] = mode
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(json.dumps({'rpc_latency': args.rpc_latency, 'publish_mode': args.publish_mode, 'results': results},
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Measure cold-start cost of each HTTP service: import time and time to first response.
+
+Every measurement runs in a fresh interpreter, like a new Cloud Run
+instance. The real Google client libraries are imported and their clients
+constructed (with anonymous credentials); only the RPCs they would send are
+answered by the stand-ins. For each service this reports:
+
+- import: loading the service module
+- first request: the first message on a cold instance, including any
+  client the request has to load
+- warm-up / after warm-up: GET /warmup, then the first message
+
+Use --profile-imports to list the slowest top-level imports of one service,
+and --output/--baseline to catch regressions between runs:
+
+    python benchmarks/bench_startup.py --runs 5 --output startup.json
+    python benchmarks/bench_startup.py --runs 5 --baseline startup.json
+    python benchmarks/bench_startup.py --profile-imports feedback-receiver
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# stand_ins is imported only once a service is loaded: it pulls in grpc and
+# google.api_core, which would otherwise hide part of the import cost
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    'feedback-receiver': 'functions/feedback-receiver/app.py',
+    'sentiment-router': 'functions/sentiment-router/main.py',
+    'positive-sentiment': 'functions/positive-sentiment/main.py',
+    'negative-sentiment': 'functions/negative-sentiment/main.py',
+}
+
+# A message each service acts on: an alert-worthy sentiment for the shims
+FEEDBACK = {
+    'feedback-receiver': "I love the new release",
+    'sentiment-router': "I love the new release",
+    'positive-sentiment': "I love the new release",
+    'negative-sentiment': "Checkout is broken and support is terrible",
+}
+
+
+def first_message(service):
+    feedback = {'user_id': 'bench-user', 'message': FEEDBACK[service]}
+    if service == 'feedback-receiver':
+        return feedback
+    data = base64.b64encode(json.dumps(feedback).encode('utf-8')).decode('ascii')
+    return {'message': {'messageId': '1', 'data': data}}
+
+
+def stub_rpcs(module):
+    """Keep the real clients but answer their API calls in-process"""
+    import google.auth
+    from google.auth.credentials import AnonymousCredentials
+    from stand_ins import FakeLanguageClient, FakePublisherClient, FakeSecretClient, FakeSlack
+    google.auth.default = lambda *a, **k: (AnonymousCredentials(), 'bench-project')
+
+    stubs = {
+        'pubsub_publisher': lambda client: setattr(client, 'publish', FakePublisherClient(rpc_latency=0).publish),
+        'language': lambda client: setattr(client, 'analyze_sentiment', FakeLanguageClient().analyze_sentiment),
+        'secret_manager': lambda client: setattr(client, 'access_secret_version',
+                                                 FakeSecretClient().access_secret_version),
+    }
+    for attribute in ('publisher', 'language_client', 'secret_client'):
+        lazy = getattr(module, attribute, None)
+        if lazy is None:
+            continue
+
+        def build(factory=lazy._factory, stub=stubs[lazy.name]):
+            client = factory()
+            stub(client)
+            return client
+        lazy._factory = build
+
+    slack = FakeSlack()
+    if getattr(module, 'slack_dispatcher', None) is not None:
+        module.slack_dispatcher.session = slack
+    router = getattr(module, 'router', None)
+    for sinks in (router.sinks.values() if router is not None else []):
+        for sink in sinks:
+            if hasattr(sink, 'post'):
+                sink.post = slack
+
+
+def child(service, warm):
+    """Runs in the fresh interpreter: time the import and the first requests"""
+    os.environ.setdefault('METRICS_ENABLED', 'true')
+    path = os.path.join(ROOT, SERVICES[service])
+    sys.path.insert(0, os.path.dirname(path))
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('startup_' + service.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - started) * 1000
+
+    stub_rpcs(module)
+    client = module.app.test_client()
+    result = {'import_ms': import_ms}
+    if warm:
+        started = time.perf_counter()
+        response = client.get('/warmup')
+        result['warmup_ms'] = (time.perf_counter() - started) * 1000
+        assert response.status_code == 200, response.get_data(as_text=True)
+    for key in ('first_ms', 'second_ms'):
+        started = time.perf_counter()
+        response = client.post('/', json=first_message(service))
+        result[key] = (time.perf_counter() - started) * 1000
+        assert response.status_code == 200, response.get_data(as_text=True)
+    print(json.dumps(result), flush=True)
+    # Skip the services' atexit drains; nothing is left to flush
+    os._exit(0)
+
+
+def spawn(service, warm, verbose, python_flags=()):
+    command = [sys.executable, *python_flags, os.path.abspath(__file__), '--child', service]
+    if warm:
+        command.append('--warm')
+    started = time.perf_counter()
+    process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True,
+                             env=dict(os.environ, LOG_LEVEL='WARNING'))
+    elapsed = (time.perf_counter() - started) * 1000
+    if verbose or process.returncode:
+        sys.stderr.write(process.stderr)
+    if process.returncode:
+        raise SystemExit(f"{service} failed to start (exit {process.returncode})")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['process_ms'] = elapsed
+    return result, process.stderr
+
+
+def measure(services, runs, verbose):
+    report = {}
+    for service in services:
+        cold = [spawn(service, False, verbose)[0] for _ in range(runs)]
+        warmed = [spawn(service, True, verbose)[0] for _ in range(runs)]
+
+        def median(results, key):
+            return round(statistics.median(result[key] for result in results), 1)
+        report[service] = {
+            'import_ms': median(cold + warmed, 'import_ms'),
+            'first_request_ms': median(cold, 'first_ms'),
+            'second_request_ms': median(cold, 'second_ms'),
+            'warmup_ms': median(warmed, 'warmup_ms'),
+            'first_request_after_warmup_ms': median(warmed, 'first_ms'),
+            'process_ms': median(cold, 'process_ms'),
+        }
+    return report
+
+
+def profile_imports(service, top):
+    """Print the slowest top-level imports of one service (python -X importtime)"""
+    _, stderr = spawn(service, False, False, python_flags=('-X', 'importtime'))
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        # Nested imports are indented; keep the ones the service asked for directly
+        if not name.startswith(' ') and not line.split('|')[2].startswith('  '):
+            imports.append((int(cumulative), name))
+    print(f"{'module':<40}{'cumulative ms':>14}")
+    for cumulative, name in sorted(imports, reverse=True)[:top]:
+        print(f"{name:<40}{cumulative / 1000:>14.1f}")
+
+
+def compare(report, baseline):
+    print(f"{'service':<20}{'metric':<32}{'now':>10}{'before':>10}{'change':>10}", file=sys.stderr)
+    for service, current in report.items():
+        for metric, value in current.items():
+            before = baseline.get(service, {}).get(metric)
+            if before:
+                print(f"{service:<20}{metric:<32}{value:>10.1f}{before:>10.1f}{(value - before) / before:>+10.1%}",
+                      file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--services', default=','.join(SERVICES), help="Comma-separated services to measure")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh processes per service and mode (median is kept)")
+    parser.add_argument('--profile-imports', metavar='SERVICE', help="List the slowest imports of one service")
+    parser.add_argument('--top', type=int, default=15, help="Imports listed by --profile-imports")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Earlier JSON report to compare against")
+    parser.add_argument('--verbose', action='store_true', help="Show the services' own output")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--warm', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.warm)
+    if args.profile_imports:
+        profile_imports(args.profile_imports, args.top)
+        return
+
+    report = measure(args.services.split(','), args.runs, args.verbose)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+        print(f"wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(report, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
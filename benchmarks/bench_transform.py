@@ -0,0 +1,120 @@
+"""Compare the per-row and columnar (Arrow) transform stages of extract_function.
+
+Builds synthetic raw records as the parsers return them (price text such as
+'£51.77', rating class) with a small share of bad values, then times three
+paths over them:
+
+- inline: the conversion the scrape loop used to do for each book
+  (float(price.replace('£', '')), raw rating, a datetime.now() per row),
+  with no validation
+- rows: transform.transform_batch_rows, validating one record at a time
+- arrow: transform.transform_batch_arrow, validating whole batches
+
+Each path is timed on its own and followed by CSV and Parquet encoding
+(writers.iter_chunks for dicts, writers.iter_table_chunks for tables).
+
+    python benchmarks/bench_transform.py --rows 1000000
+"""
+import argparse
+import datetime
+import gc
+import os
+import sys
+import time
+
+from stand_ins import ROOT, book_for
+
+sys.path.insert(0, os.path.join(ROOT, 'extract_function'))
+
+import transform  # noqa: E402
+import writers  # noqa: E402
+
+BAD_VALUES = [
+    ('price', 'Â£12.50'),
+    ('price', None),
+    ('price', '£99999'),
+    ('rating', 'Six'),
+    ('title', ''),
+]
+
+
+def synthetic_raw_records(rows, bad_every):
+    records = []
+    for index in range(rows):
+        book = book_for(index)
+        record = {'title': book['title'], 'price': f"£{book['price']:.2f}", 'rating': book['rating']}
+        if bad_every and index % bad_every == bad_every - 1:
+            field, value = BAD_VALUES[(index // bad_every) % len(BAD_VALUES)]
+            record[field] = value
+        records.append(record)
+    return records
+
+
+def inline_path(records, batch_rows):
+    """The old per-book conversion; bad prices raise, so callers pass only parseable ones"""
+    for batch in transform._batches(records, batch_rows):
+        yield [{'title': record['title'], 'price': float(record['price'].replace('£', '')),
+                'rating': record['rating'], 'scraped_date': datetime.datetime.now().strftime('%Y-%m-%d')}
+               for record in batch]
+
+
+def transform_path(name):
+    def run(records, batch_rows):
+        return transform.iter_transformed(records, name, batch_rows=batch_rows, rejects=[])
+    return run
+
+
+def drain(batches, output_format, columnar):
+    """Consume the batches, encoding them when output_format is set; returns the row count"""
+    counted = {'rows': 0}
+
+    def counting():
+        for batch in batches:
+            counted['rows'] += batch.num_rows if columnar else len(batch)
+            yield batch
+
+    if output_format is None:
+        for _ in counting():
+            pass
+    elif columnar:
+        for _ in writers.iter_table_chunks(counting(), output_format):
+            pass
+    else:
+        for _ in writers.iter_chunks((row for batch in counting() for row in batch), output_format):
+            pass
+    return counted['rows']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-rows', type=int, default=10000)
+    parser.add_argument('--bad-every', type=int, default=1000, help="Make every Nth record invalid (0 for none)")
+    args = parser.parse_args()
+
+    records = synthetic_raw_records(args.rows, args.bad_every)
+    # The inline path has no validation and would raise on the bad rows
+    parseable = [record for record in records if transform.check_row(record)[0] is None]
+
+    paths = [('inline', inline_path, parseable, False), ('rows', transform_path('rows'), records, False)]
+    if transform.pyarrow is not None:
+        paths.append(('arrow', transform_path('arrow'), records, True))
+    outputs = [None, 'csv'] + (['parquet'] if writers.pyarrow is not None else [])
+
+    print(f"{args.rows} rows, batches of {args.batch_rows}, {len(records) - len(parseable)} invalid")
+    print(f"{'path':>8}  {'output':>8}  {'rows out':>9}  {'seconds':>8}  {'rows/s':>10}  {'vs inline':>9}")
+    baseline = {}
+    for name, run, inputs, columnar in paths:
+        for output_format in outputs:
+            gc.collect()
+            start = time.perf_counter()
+            rows = drain(run(inputs, args.batch_rows), output_format, columnar)
+            seconds = time.perf_counter() - start
+            label = output_format or 'none'
+            baseline.setdefault(label, seconds)
+            print(f"{name:>8}  {label:>8}  {rows:>9}  {seconds:>8.3f}  {len(inputs) / seconds:>10.0f}  "
+                  f"{baseline[label] / seconds:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Evaluate the local lexicon scorer against Natural Language API labels.
+
+Reads a JSONL corpus of {"message", "score", "sentiment"} rows, where score
+and sentiment are what the NL API returned, and reports for each confidence
+band how many messages the hybrid engine keeps local (API calls avoided),
+how often its labels agree with the API, and how fast the local scorer runs.
+The bundled test/fixtures/sentiment_corpus.jsonl has hand-assigned reference
+labels; pass --record with GCP credentials to replace them with live API
+labels.
+
+    python benchmarks/eval_sentiment.py --bands 0.1,0.2,0.3,0.4 --throughput-rows 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from stand_ins import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'functions', 'shared'))
+
+from sentiment_engine import LexiconScorer, SentimentEngine, categorize  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, 'test', 'fixtures', 'sentiment_corpus.jsonl')
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def record_labels(path, rows):
+    """Re-label the corpus with the live Natural Language API"""
+    from google.cloud import language_v1
+    client = language_v1.LanguageServiceClient()
+    with open(path, 'w', encoding='utf-8') as corpus_file:
+        for row in rows:
+            document = language_v1.Document(content=row['message'], type_=language_v1.Document.Type.PLAIN_TEXT)
+            score = client.analyze_sentiment(request={"document": document}).document_sentiment.score
+            corpus_file.write(json.dumps({'message': row['message'], 'score': score,
+                                          'sentiment': categorize(score)}) + '\n')
+    print(f"recorded {len(rows)} API labels to {path}")
+
+
+def evaluate(rows, mode, band):
+    labels = {row['message']: row['score'] for row in rows}
+    engine = SentimentEngine(remote=labels.__getitem__, mode=mode, band=band)
+    scores = engine.score_batch([row['message'] for row in rows])
+    agree = sum(categorize(score) == row['sentiment'] for score, row in zip(scores, rows))
+    stats = engine.stats()
+    return agree / len(rows), stats['api_calls_avoided']
+
+
+def local_precision(rows, band):
+    """Agreement with the API on just the messages the hybrid engine keeps local"""
+    engine = SentimentEngine(remote=lambda text: None, mode='hybrid', band=band)
+    scores, hits = engine.scorer.score_batch([row['message'] for row in rows])
+    kept = [(score, row) for score, hit_count, row in zip(scores.tolist(), hits.tolist(), rows)
+            if engine.is_confident(score, hit_count)]
+    if not kept:
+        return None
+    return sum(categorize(score) == row['sentiment'] for score, row in kept) / len(kept)
+
+
+def throughput(rows, total):
+    scorer = LexiconScorer()
+    texts = [rows[index % len(rows)]['message'] for index in range(total)]
+    start = time.perf_counter()
+    scorer.score_batch(texts)
+    batch_rate = total / (time.perf_counter() - start)
+
+    single = min(total, 20000)
+    start = time.perf_counter()
+    for text in texts[:single]:
+        scorer.score(text)
+    single_rate = single / (time.perf_counter() - start)
+    return batch_rate, single_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--bands', default='0.1,0.2,0.3,0.4,0.5')
+    parser.add_argument('--throughput-rows', type=int, default=200000)
+    parser.add_argument('--record', action='store_true', help="Re-label the corpus with the live NL API first")
+    args = parser.parse_args()
+
+    rows = load_corpus(args.corpus)
+    if args.record:
+        record_labels(args.corpus, rows)
+        rows = load_corpus(args.corpus)
+
+    print(f"{len(rows)} labelled messages from {os.path.relpath(args.corpus, ROOT)}")
+    agreement, _ = evaluate(rows, 'lexicon', 0)
+    print(f"lexicon only: {agreement:.1%} agreement with API labels, 100% API calls avoided")
+    print(f"{'band':>5}  {'avoided':>8}  {'local agree':>11}  {'overall agree':>13}")
+    for band in [float(value) for value in args.bands.split(',')]:
+        agreement, avoided = evaluate(rows, 'hybrid', band)
+        precision = local_precision(rows, band)
+        precision_text = f"{precision:.1%}" if precision is not None else '-'
+        print(f"{band:>5.2f}  {avoided:>8.1%}  {precision_text:>11}  {agreement:>13.1%}")
+
+    batch_rate, single_rate = throughput(rows, args.throughput_rows)
+    print(f"local scorer: {batch_rate:,.0f} msg/s vectorized batch, {single_rate:,.0f} msg/s one at a time")
+
+
+if __name__ == "__main__":
+    main()
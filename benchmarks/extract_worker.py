@@ -0,0 +1,55 @@
+"""Run extract_to_gcs as a local HTTP worker for sharded extraction.
+
+Cloud Storage is replaced by files under --storage-dir, so several workers
+(and the coordinator) started with the same directory share one fake bucket.
+Point the workers at a catalogue with CATALOGUE_BASE_URL, start one process
+per worker and pass their URLs to the coordinator as `worker_urls`:
+
+    python benchmarks/extract_worker.py --storage-dir /tmp/gcs --port 8081 &
+    python benchmarks/extract_worker.py --storage-dir /tmp/gcs --port 8082 &
+
+The first line printed is `listening on <url>`; with --port 0 the operating
+system picks a free port.
+"""
+import argparse
+import sys
+
+import flask
+from werkzeug.serving import make_server
+
+from stand_ins import FakeStorageClient, load_module
+
+
+def create_worker(storage_dir):
+    """WSGI app serving extract_to_gcs against a disk-backed fake bucket"""
+    from google.cloud import storage
+    storage.Client = lambda *a, **k: FakeStorageClient(root=storage_dir)
+    extract = load_module('extract_function/main.py', 'worker_extract')
+
+    app = flask.Flask(__name__)
+
+    @app.route('/', methods=['GET', 'POST'])
+    def handle():
+        return extract.extract_to_gcs(flask.request)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--storage-dir', required=True, help="Directory standing in for Cloud Storage")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help="0 picks a free port")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, create_worker(args.storage_dir), threaded=True)
+    print(f"listening on http://{args.host}:{server.server_port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
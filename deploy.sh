@@ -30,6 +30,24 @@ gcloud projects add-iam-policy-binding $PROJECT_ID \
     --member="serviceAccount:$SA_EMAIL" \
     --role="roles/languageservice.user"
 
+# The services import modules (metrics, and the sentiment code) from
+# functions/shared; copy them next to each service so they are uploaded with
+# its source, and clean up after
+SHARED_SERVICES="functions/feedback-receiver functions/sentiment-router functions/positive-sentiment functions/negative-sentiment"
+SHARED_MODULES=$(cd functions/shared && ls *.py)
+stage_shared() {
+    for service in $SHARED_SERVICES; do
+        cp functions/shared/*.py "$service"/
+    done
+}
+unstage_shared() {
+    for service in $SHARED_SERVICES; do
+        (cd $service && rm -f $SHARED_MODULES)
+    done
+}
+trap unstage_shared EXIT
+stage_shared
+
 # Deploy the HTTP receiver function
 echo "Deploying HTTP receiver function..."
 gcloud functions deploy http-receiver \
@@ -46,29 +64,46 @@ gcloud functions deploy http-receiver \
 HTTP_URL=$(gcloud functions describe http-receiver --region=$REGION --gen2 --format="value(serviceConfig.uri)")
 echo "HTTP Receiver function deployed at: $HTTP_URL"
 
-# Deploy the positive sentiment analyzer function
-echo "Deploying positive sentiment analyzer function..."
-gcloud functions deploy positive-sentiment \
+# Deploy the sentiment router, which analyzes each message once and routes it
+# to the sinks for its sentiment
+echo "Deploying sentiment router function..."
+gcloud functions deploy sentiment-router \
     --gen2 \
     --runtime=python310 \
     --region=$REGION \
-    --source=./functions/positive-sentiment \
+    --source=./functions/sentiment-router \
     --entry-point=process_pubsub_message \
-    --set-env-vars="SLACK_CHANNEL=#followup,PROJECT_ID=$PROJECT_ID" \
+    --set-env-vars="PROJECT_ID=$PROJECT_ID" \
     --trigger-topic=feedback-topic \
     --service-account=$SA_EMAIL
 
-# Deploy the negative sentiment analyzer function
-echo "Deploying negative sentiment analyzer function..."
-gcloud functions deploy negative-sentiment \
-    --gen2 \
-    --runtime=python310 \
-    --region=$REGION \
-    --source=./functions/negative-sentiment \
-    --set-env-vars="SLACK_CHANNEL=#support,PROJECT_ID=$PROJECT_ID" \
-    --entry-point=process_pubsub_message \
-    --trigger-topic=feedback-topic \
-    --service-account=$SA_EMAIL
+# The separate positive/negative services are kept as compatibility shims.
+# Deploying them alongside the router would alert twice, so they are opt-in.
+if [ "$DEPLOY_LEGACY_SENTIMENT" = "true" ]; then
+    # Deploy the positive sentiment analyzer function
+    echo "Deploying positive sentiment analyzer function..."
+    gcloud functions deploy positive-sentiment \
+        --gen2 \
+        --runtime=python310 \
+        --region=$REGION \
+        --source=./functions/positive-sentiment \
+        --entry-point=process_pubsub_message \
+        --set-env-vars="SLACK_CHANNEL=#followup,PROJECT_ID=$PROJECT_ID" \
+        --trigger-topic=feedback-topic \
+        --service-account=$SA_EMAIL
+
+    # Deploy the negative sentiment analyzer function
+    echo "Deploying negative sentiment analyzer function..."
+    gcloud functions deploy negative-sentiment \
+        --gen2 \
+        --runtime=python310 \
+        --region=$REGION \
+        --source=./functions/negative-sentiment \
+        --set-env-vars="SLACK_CHANNEL=#support,PROJECT_ID=$PROJECT_ID" \
+        --entry-point=process_pubsub_message \
+        --trigger-topic=feedback-topic \
+        --service-account=$SA_EMAIL
+fi
 
 echo "All functions deployed successfully!"
 echo "You can now send test messages to: $HTTP_URL"
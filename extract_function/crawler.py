@@ -0,0 +1,241 @@
+"""Detail-page crawl: follow every product link from the listing pages
+
+Listing pages only show title, price and rating. Each book's detail page
+adds its UPC, availability (with the stock count) and category. The crawl
+reads the listing pages, queues every product link it finds in a
+deduplicating frontier, and fetches the detail pages through a bounded
+thread pool under the same per-host rate limit as the listing fetches.
+
+With a CrawlCheckpoint, progress is saved every few pages. A crawl that is
+interrupted then resumes where it stopped: listing pages already read and
+detail pages already fetched are not requested again.
+"""
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urldefrag
+
+from fetcher import DEFAULT_TIMEOUT, HostRateLimiter, make_session
+from parsers import get_detail_parsers
+
+# Bump when the checkpoint layout changes so old checkpoints are ignored
+CHECKPOINT_VERSION = 1
+DEFAULT_CHECKPOINT_EVERY = 100
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+
+# Statuses worth asking again for; anything else (e.g. 404) fails the page at once
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class UrlFrontier:
+    """Queue of URLs still to fetch that accepts each URL only once
+
+    URLs are compared without their #fragment. Detail pages are handed out
+    before listing pages, so the queue of discovered links stays short.
+    """
+
+    def __init__(self):
+        self._queues = {'detail': deque(), 'listing': deque()}
+        self._seen = set()
+
+    @staticmethod
+    def normalize(url):
+        return urldefrag(url)[0]
+
+    def add(self, url, kind):
+        """Queue `url` unless it was seen before; returns whether it was queued"""
+        url = self.normalize(url)
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        self._queues[kind].append(url)
+        return True
+
+    def mark_seen(self, url):
+        self._seen.add(self.normalize(url))
+
+    def retry(self, url, kind):
+        """Queue a seen URL again after a failed attempt"""
+        self._queues[kind].append(url)
+
+    def pop(self):
+        """Next (url, kind), or None when nothing is queued"""
+        for kind, queue in self._queues.items():
+            if queue:
+                return queue.popleft(), kind
+        return None
+
+    def queued(self, kind):
+        return list(self._queues[kind])
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+
+class CrawlCheckpoint:
+    """Progress of a detail crawl, kept in a page_cache store (local file or gs:// object)
+
+    Holds the listing pages already read, the detail URLs discovered but not
+    fetched yet, and the record of every detail page fetched. A checkpoint
+    that was marked complete is ignored, so the next run crawls afresh.
+    """
+
+    def __init__(self, store, every=DEFAULT_CHECKPOINT_EVERY):
+        self.store = store
+        self.every = every
+        payload = store.load() or {}
+        if payload.get('version') != CHECKPOINT_VERSION or payload.get('complete'):
+            payload = {}
+        self.listings = set(payload.get('listings', []))
+        self.queued = list(payload.get('queued', []))
+        self.done = dict(payload.get('done', {}))
+        self._unsaved = 0
+
+    def listing_done(self, url):
+        self.listings.add(url)
+
+    def detail_done(self, url, record, queued):
+        """Record a fetched page; saves once `every` pages are unsaved. `queued` is called only then"""
+        self.done[url] = record
+        self._unsaved += 1
+        if self._unsaved >= self.every:
+            self.save(queued())
+
+    def save(self, queued, complete=False):
+        self.queued = list(queued)
+        self.store.save({
+            'version': CHECKPOINT_VERSION,
+            'complete': complete,
+            'listings': sorted(self.listings),
+            'queued': self.queued,
+            'done': self.done,
+        })
+        self._unsaved = 0
+
+
+def crawl_books(listing_urls, concurrency=4, rate_limit=None, parser='auto', checkpoint=None,
+                max_attempts=DEFAULT_MAX_ATTEMPTS, retry_backoff=DEFAULT_RETRY_BACKOFF, session=None,
+                timeout=DEFAULT_TIMEOUT, stats=None):
+    """Yield one raw record per product detail page linked from `listing_urls`
+
+    Records have the listing fields (title, price text, rating) plus upc,
+    availability, category and the page's url, ready for
+    transform.iter_transformed(..., detail=True). They come in completion
+    order. Records restored from `checkpoint` are yielded first, without
+    fetching their pages again.
+
+    At most `concurrency` requests are in flight, and `rate_limit` caps
+    requests per second per host. Timeouts and 429/5xx answers are retried
+    up to `max_attempts` times, with exponential backoff from
+    `retry_backoff` seconds; a page that cannot be parsed fails on its own
+    without stopping the crawl. Counts are kept in `stats`: listing and detail
+    pages fetched, product links found, duplicate links skipped, pages
+    resumed from the checkpoint, retries and failures.
+    """
+    parse_links, parse_detail = get_detail_parsers(parser)
+    stats = stats if stats is not None else {}
+    for key in ('listing_pages', 'detail_pages', 'links', 'duplicate_links', 'resumed', 'retried', 'failed'):
+        stats.setdefault(key, 0)
+    concurrency = max(1, int(concurrency))
+    limiter = HostRateLimiter(rate_limit)
+    owns_session = session is None
+    if owns_session:
+        session = make_session(concurrency)
+
+    frontier = UrlFrontier()
+    failed = []
+    if checkpoint:
+        for url, record in checkpoint.done.items():
+            frontier.mark_seen(url)
+            stats['resumed'] += 1
+            yield record
+        for url in checkpoint.listings:
+            frontier.mark_seen(url)
+        for url in checkpoint.queued:
+            frontier.add(url, 'detail')
+    for url in listing_urls:
+        frontier.add(url, 'listing')
+
+    def fetch(url, kind, attempt):
+        if attempt:
+            time.sleep(retry_backoff * 2 ** (attempt - 1))
+        limiter.wait(url)
+        response = session.get(url, timeout=timeout)
+        if response.status_code != 200:
+            return response.status_code, None
+        if kind == 'listing':
+            return 200, parse_links(response.content, response.url or url)
+        return 200, dict(parse_detail(response.content), url=url)
+
+    in_flight = {}
+    attempts = {}
+
+    def queued_details():
+        return frontier.queued('detail') + [url for url, kind in in_flight.values() if kind == 'detail'] + failed
+
+    def give_up(url, kind, reason):
+        print(f"Failed to fetch {url}: {reason}")
+        stats['failed'] += 1
+        if kind == 'detail':
+            failed.append(url)
+
+    finished = False
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        while frontier or in_flight:
+            while frontier and len(in_flight) < concurrency:
+                url, kind = frontier.pop()
+                in_flight[executor.submit(fetch, url, kind, attempts.get(url, 0))] = (url, kind)
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, kind = in_flight.pop(future)
+                try:
+                    status, result = future.result()
+                except OSError as e:  # requests' connection errors and timeouts are OSErrors
+                    status, result = None, e
+                except Exception as e:
+                    # A page the parser cannot read would fail the same way again, so it is not retried
+                    give_up(url, kind, f"unparsable page ({type(e).__name__}: {e})")
+                    continue
+                if status != 200:
+                    attempts[url] = attempts.get(url, 0) + 1
+                    if status in (None,) + RETRY_STATUSES and attempts[url] < max_attempts:
+                        stats['retried'] += 1
+                        frontier.retry(url, kind)
+                    else:
+                        give_up(url, kind, result if status is None else status)
+                    continue
+
+                if kind == 'listing':
+                    stats['listing_pages'] += 1
+                    for link in result:
+                        stats['links'] += 1
+                        if not frontier.add(link, 'detail'):
+                            stats['duplicate_links'] += 1
+                    if checkpoint:
+                        checkpoint.listing_done(url)
+                else:
+                    stats['detail_pages'] += 1
+                    if checkpoint:
+                        checkpoint.detail_done(url, result, queued_details)
+                    yield result
+        finished = True
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if checkpoint:
+            # Pages that finished after the consumer stopped are kept for the next run
+            for future, (url, kind) in list(in_flight.items()):
+                if future.cancelled() or future.exception() is not None or future.result()[0] != 200:
+                    continue
+                del in_flight[future]
+                if kind == 'listing':
+                    checkpoint.listing_done(url)
+                    for link in future.result()[1]:
+                        frontier.add(link, 'detail')
+                else:
+                    checkpoint.done[url] = future.result()[1]
+            # Failed pages stay queued, so a later run retries only those
+            checkpoint.save(queued_details(), complete=finished and not failed)
+        if owns_session:
+            session.close()
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 30
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host so concurrent fetches stay polite"""
+
+    def __init__(self, requests_per_second=None):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        """Block until the host of `url` may be hit again"""
+        if not self.min_interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=10):
+    """Create a keep-alive session whose connection pool fits `pool_size` threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_pages(urls, concurrency=1, rate_limit=None, session=None, timeout=DEFAULT_TIMEOUT,
+                headers_for=None):
+    """Fetch URLs with a bounded thread pool
+
+    Yields (url, response) pairs in the same order as `urls`, regardless of
+    which request finishes first. At most `concurrency * 2` responses are held
+    in flight so memory stays bounded for long page ranges.
+
+    Args:
+        urls: Iterable of URLs to fetch
+        concurrency: Maximum number of requests in flight
+        rate_limit: Maximum requests per second per host (None for unlimited)
+        session: Optional requests.Session to reuse; one is created otherwise
+        timeout: Per-request timeout in seconds
+        headers_for: Optional callable returning extra request headers for a URL
+    """
+    concurrency = max(1, int(concurrency))
+    limiter = HostRateLimiter(rate_limit)
+    owns_session = session is None
+    if owns_session:
+        session = make_session(concurrency)
+
+    def fetch(url):
+        limiter.wait(url)
+        headers = headers_for(url) if headers_for else None
+        return session.get(url, timeout=timeout, headers=headers)
+
+    try:
+        if concurrency == 1:
+            for url in urls:
+                yield url, fetch(url)
+            return
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = deque()
+            for url in urls:
+                pending.append((url, executor.submit(fetch, url)))
+                if len(pending) >= concurrency * 2:
+                    done_url, future = pending.popleft()
+                    yield done_url, future.result()
+            while pending:
+                done_url, future = pending.popleft()
+                yield done_url, future.result()
+    finally:
+        if owns_session:
+            session.close()
@@ -1,52 +1,127 @@
-import requests
-from bs4 import BeautifulSoup
 import csv
 import io
 import os
 import datetime
+import itertools
 import json
+import sys
+import time
+import uuid
 import functions_framework
 from google.cloud import storage
 
+from crawler import CrawlCheckpoint, crawl_books
+from fetcher import fetch_pages
+from page_cache import PageCache, content_hash, open_store
+from parsers import get_parser
+from shards import (DEFAULT_MAX_ATTEMPTS, DEFAULT_MAX_WORKERS, DEFAULT_RETRY_BACKOFF, build_manifest, http_invoker, plan_shards,
+                    run_shards, shard_blob_name, write_manifest)
+from transform import DEFAULT_BATCH_ROWS, TRANSFORMS, iter_transformed, resolve_transform
+from writers import FORMATS, stream_tables_to_gcs, stream_to_gcs, write_rejects
 
-def scrape_books(page_num=1, max_pages=5):
-    """Scrape book data from multiple pages"""
-    all_book_data = []
+# metrics.py lives in functions/shared; the Cloud Build config copies it next
+# to main.py, so the local copy wins when present
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions', 'shared'))
+import metrics  # noqa: E402
+
+BASE_URL = "https://books.toscrape.com/catalogue"
+BUCKET_NAME = "giorgi"
+TRANSFORM_BATCH_ROWS = int(os.environ.get('TRANSFORM_BATCH_ROWS', DEFAULT_BATCH_ROWS))
+CRAWL_MODES = ('listing', 'details')
+
+STAGE_SECONDS = metrics.histogram('extract_stage_seconds', 'Time spent per extract stage (fetch and parse per page, '
+                                  'upload per run)', labels=('stage',))
+PAGES = metrics.counter('extract_pages_total', 'Catalogue pages by outcome', labels=('outcome',))
+BOOKS = metrics.counter('extract_books_total', 'Book records written to Cloud Storage')
+RUNS = metrics.counter('extract_runs_total', 'Extract requests by status', labels=('status',))
+ROWS = metrics.counter('extract_rows_total', 'Scraped rows by transform outcome (valid or the reject reason)',
+                       labels=('outcome',))
+
+
+def iter_raw_books(page_num=1, max_pages=5, concurrency=1, rate_limit=None, base_url=BASE_URL, parser='auto',
+                   cache=None, stats=None):
+    """Yield raw book records from pages page_num..max_pages as they are scraped
+
+    Pages are fetched through a pooled keep-alive session. With `concurrency`
+    above 1 they are downloaded in parallel, but parsed in page order so the
+    output is the same as a sequential run. `parser` selects the HTML backend
+    (see parsers.get_parser).
+
+    With a PageCache, requests are conditional and pages that come back
+    304 Not Modified or with an unchanged body reuse their cached records
+    instead of being parsed again. Page counts are accumulated in `stats`,
+    and fetch and parse times are recorded in extract_stage_seconds.
+    Prices are left as scraped text; transform.py converts and validates them.
+    The cache is not saved here: the caller calls cache.save() once the
+    records are stored, so a failed upload never marks pages as unchanged.
+    """
+    parse_books = get_parser(parser, raw=True)
+    stats = stats if stats is not None else {}
+    for key in ('fetched', 'not_modified', 'unchanged', 'reparsed', 'failed'):
+        stats.setdefault(key, 0)
+    urls = [f"{base_url}/page-{page}.html" for page in range(page_num, max_pages + 1)]
+    headers_for = cache.conditional_headers if cache else None
     
-    for page in range(1, max_pages + 1):
-        url = f"https://books.toscrape.com/catalogue/page-{page}.html"
-        response = requests.get(url)
+    for page, (url, response) in enumerate(fetch_pages(urls, concurrency, rate_limit, headers_for=headers_for),
+                                           start=page_num):
+        entry = cache.get(url) if cache else None
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is not None:
+            STAGE_SECONDS.observe(elapsed.total_seconds(), stage='fetch')
         
-        if response.status_code != 200:
+        if response.status_code == 304 and entry:
+            stats['not_modified'] += 1
+            PAGES.inc(outcome='not_modified')
+            records = entry['records']
+        elif response.status_code != 200:
             print(f"Failed to fetch page {page}")
+            stats['failed'] += 1
+            PAGES.inc(outcome='failed')
             continue
-            
-        soup = BeautifulSoup(response.content, 'html.parser')
-        books = soup.find_all('article', class_='product_pod')
+        else:
+            stats['fetched'] += 1
+            digest = content_hash(response.content) if cache else None
+            if entry and entry['hash'] == digest:
+                stats['unchanged'] += 1
+                PAGES.inc(outcome='unchanged')
+                records = entry['records']
+            else:
+                stats['reparsed'] += 1
+                PAGES.inc(outcome='parsed')
+                with STAGE_SECONDS.time(stage='parse'):
+                    records = parse_books(response.content)
+            if cache:
+                cache.put(url, response, digest, records)
         
-        for book in books:
-            # Title
-            title = book.h3.a['title']
-            
-            # Price
-            price_text = book.find('p', class_='price_color').text.strip()
-            # Convert price to numeric format (remove £ and convert to float)
-            price = float(price_text.replace('£', ''))
-            
-            # Rating
-            rating = book.p['class'][1]
-            
-            # Add to list
-            all_book_data.append({
-                'title': title,
-                'price': price,
-                'rating': rating,
-                'scraped_date': datetime.datetime.now().strftime('%Y-%m-%d')
-            })
+        yield from records
+
+def record_batch_quality(stats):
+    """Count one transformed batch's rows and log its data-quality stats"""
+    ROWS.inc(stats['valid'], outcome='valid')
+    for reason, count in stats['reasons'].items():
+        ROWS.inc(count, outcome=reason)
+    STAGE_SECONDS.observe(stats['transform_ms'] / 1000, stage='transform')
+    metrics.log_event('extract_batch_quality', **stats)
+
+def iter_books(page_num=1, max_pages=5, concurrency=1, rate_limit=None, base_url=BASE_URL, parser='auto',
+               cache=None, stats=None, rejects=None, quality=None):
+    """Yield validated book records from pages page_num..max_pages
     
-    return all_book_data
+    Raw records from iter_raw_books go through the per-row transform a batch
+    at a time. Rows that fail validation are left out; pass a list as
+    `rejects` to collect them and a dict as `quality` for the run's totals.
+    """
+    books = iter_raw_books(page_num, max_pages, concurrency, rate_limit, base_url, parser, cache, stats)
+    for rows in iter_transformed(books, 'rows', batch_rows=TRANSFORM_BATCH_ROWS, rejects=rejects, quality=quality,
+                                 on_batch=record_batch_quality):
+        yield from rows
+
+def scrape_books(page_num=1, max_pages=5, concurrency=1, rate_limit=None, base_url=BASE_URL, parser='auto',
+                 cache=None, stats=None):
+    """Scrape book data from multiple pages"""
+    return list(iter_books(page_num, max_pages, concurrency, rate_limit, base_url, parser, cache, stats))
 
-def save_to_gcs(data, bucket_name, blob_name):
+def save_to_gcs(data, bucket_name, blob_name, storage_client=None):
     """Save data to Google Cloud Storage"""
     # Create CSV in memory
     csv_file = io.StringIO()
@@ -56,45 +131,231 @@ def save_to_gcs(data, bucket_name, blob_name):
     
     # Upload to GCS
     # No need for explicit credentials, Cloud Build will use service account
-    storage_client = storage.Client()
+    storage_client = storage_client or storage.Client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
     blob.upload_from_string(csv_file.getvalue(), content_type='text/csv')
     
     return f"gs://{bucket_name}/{blob_name}"
 
+def extract_pages(first_page, last_page, blob_name, output_format='csv', concurrency=1, rate_limit=None,
+                  base_url=BASE_URL, parser='auto', cache=None, transform='auto', crawl='listing', checkpoint=None):
+    """Scrape pages first_page..last_page, validate the records and stream them to one GCS object
+    
+    `transform` is 'arrow' (columnar batches, the default when pyarrow is
+    installed) or 'rows'. Rejected rows go to a `<blob_name>.rejects.jsonl`
+    side object, only written when there are any.
+    With crawl='details' every book's detail page is fetched too (see
+    crawler.crawl_books) and the upc, availability, stock and category
+    columns are written; `checkpoint` is a CrawlCheckpoint to resume from.
+    The page cache only applies to listing crawls.
+    Returns (gcs_uri, book_count, page_stats, timings, quality).
+    """
+    page_stats = {}
+    timings = {}
+    quality = {}
+    rejects = []
+    detail = crawl == 'details'
+    if detail:
+        urls = [f"{base_url}/page-{page}.html" for page in range(first_page, last_page + 1)]
+        books = crawl_books(urls, concurrency=concurrency, rate_limit=rate_limit, parser=parser,
+                            checkpoint=checkpoint, stats=page_stats)
+    else:
+        books = iter_raw_books(first_page, last_page, concurrency=concurrency, rate_limit=rate_limit,
+                               base_url=base_url, parser=parser, cache=cache, stats=page_stats)
+    batches = iter_transformed(books, transform, batch_rows=TRANSFORM_BATCH_ROWS, rejects=rejects, quality=quality,
+                               on_batch=record_batch_quality, detail=detail)
+    if resolve_transform(transform) == 'arrow':
+        gcs_uri, book_count = stream_tables_to_gcs(batches, BUCKET_NAME, blob_name, output_format=output_format,
+                                                   timings=timings, detail=detail)
+    else:
+        gcs_uri, book_count = stream_to_gcs(itertools.chain.from_iterable(batches), BUCKET_NAME, blob_name,
+                                            output_format=output_format, timings=timings, detail=detail)
+    STAGE_SECONDS.observe(timings['upload'] / 1000, stage='upload')
+    BOOKS.inc(book_count)
+    if cache:
+        cache.save()
+    if rejects:
+        quality['rejects_uri'] = write_rejects(rejects, BUCKET_NAME, f"{blob_name}.rejects.jsonl")
+        print(f"Rejected {len(rejects)} rows ({quality['reasons']}): {quality['rejects_uri']}")
+    return gcs_uri, book_count, page_stats, timings, quality
+
+def extract_shard(request_json, output_format, concurrency, rate_limit, base_url, parser, cache_location, transform,
+                  crawl, checkpoint_location, started):
+    """Worker mode: scrape one shard's page range into its own object"""
+    shard = int(request_json['shard'])
+    shard_count = int(request_json['shard_count'])
+    start_page = int(request_json['start_page'])
+    end_page = int(request_json['end_page'])
+    blob_name = shard_blob_name(request_json['run_id'], shard, shard_count, FORMATS[output_format][0])
+    # Shards run concurrently, so each keeps its own page cache object
+    cache = PageCache(open_store(f"{cache_location}.pages-{start_page}-{end_page}")) if cache_location else None
+    checkpoint = (CrawlCheckpoint(open_store(f"{checkpoint_location}.pages-{start_page}-{end_page}"))
+                  if checkpoint_location and crawl == 'details' else None)
+    
+    print(f"Extracting shard {shard + 1}/{shard_count} (pages {start_page}-{end_page})...")
+    gcs_uri, book_count, page_stats, timings, quality = extract_pages(
+        start_page, end_page, blob_name, output_format, concurrency, rate_limit, base_url, parser, cache, transform,
+        crawl, checkpoint)
+    RUNS.inc(status='shard')
+    metrics.log_event('extract_shard_complete', run_id=request_json['run_id'], shard=shard, books=book_count,
+                      pages=page_stats, rejected=quality.get('rejected', 0),
+                      duration_ms=round((time.perf_counter() - started) * 1000, 3))
+    return json.dumps({
+        'status': 'success',
+        'message': f"Extracted {book_count} books from pages {start_page}-{end_page}",
+        'gcs_uri': gcs_uri,
+        'books': book_count,
+        'pages': page_stats,
+        'quality': quality
+    })
+
+def coordinate_shards(max_pages, shard_count, worker_urls, output_format, options, started):
+    """Coordinator mode: split the crawl into shards, run them on workers and write a manifest
+    
+    At most SHARD_MAX_WORKERS shards (default 16) run at once, and
+    `rate_limit` is split evenly between them so the site sees the same
+    per-host rate as an unsharded run. Every shard is retried on its own
+    (SHARD_MAX_ATTEMPTS, default 3, with SHARD_RETRY_BACKOFF seconds of
+    exponential backoff). The manifest lists each shard's object and status;
+    pass its URI to gcs_to_bigquery as `manifest_uri` to load all shards in
+    one job.
+    """
+    run_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    plan = plan_shards(1, max_pages, shard_count)
+    invoke = http_invoker(worker_urls)
+    max_workers = int(os.environ.get('SHARD_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    base = dict(options, run_id=run_id, shard_count=len(plan), format=output_format)
+    if base.get('rate_limit'):
+        base['rate_limit'] = base['rate_limit'] / min(len(plan), max_workers)
+    
+    print(f"Extracting {max_pages} pages in {len(plan)} shards (run {run_id})...")
+    results = run_shards(plan, lambda shard, attempt: invoke(dict(base, **shard), attempt),
+                         max_attempts=int(os.environ.get('SHARD_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)),
+                         max_workers=max_workers,
+                         backoff=float(os.environ.get('SHARD_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF)))
+    manifest = build_manifest(run_id, output_format, results)
+    manifest_uri = write_manifest(manifest, BUCKET_NAME)
+    
+    failed = [result['shard'] for result in results if result['status'] != 'success']
+    status = 'success' if not failed else ('partial' if len(failed) < len(results) else 'error')
+    RUNS.inc(status=f"coordinator_{status}")
+    print(f"Extracted {manifest['books']} books in {len(results) - len(failed)}/{len(results)} shards; "
+          f"manifest: {manifest_uri}")
+    metrics.log_event('extract_sharded_complete', run_id=run_id, status=status, shards=len(results),
+                      failed_shards=failed, books=manifest['books'],
+                      duration_ms=round((time.perf_counter() - started) * 1000, 3))
+    return json.dumps({
+        'status': status,
+        'message': f"Extracted {manifest['books']} books in {len(results) - len(failed)} of {len(results)} shards",
+        'manifest_uri': manifest_uri,
+        'shards': results
+    }), (500 if status == 'error' else 200)
+
 @functions_framework.http
 def extract_to_gcs(request):
     """Cloud Function 1: Extract data and save to GCS"""
+    if getattr(request, 'path', '/') == '/metrics':
+        return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+    started = time.perf_counter()
     try:
         # Parse request parameters (if any)
         request_json = request.get_json(silent=True)
         max_pages = 5  # Default value
+        concurrency = int(os.environ.get('FETCH_CONCURRENCY', 1))
+        rate_limit = os.environ.get('FETCH_RATE_LIMIT')  # Requests per second per host
+        parser = os.environ.get('HTML_PARSER', 'auto')  # auto, lxml or bs4
+        cache_location = os.environ.get('PAGE_CACHE')  # Local path or gs://bucket/object
+        output_format = os.environ.get('OUTPUT_FORMAT', 'csv')  # csv, parquet or avro
+        transform = os.environ.get('EXTRACT_TRANSFORM', 'auto')  # auto, arrow or rows
+        crawl = os.environ.get('EXTRACT_CRAWL', 'listing')  # listing or details
+        checkpoint_location = os.environ.get('CRAWL_CHECKPOINT')  # Local path or gs://bucket/object
+        base_url = os.environ.get('CATALOGUE_BASE_URL', BASE_URL)  # e.g. a local stand-in
         
         if request_json and 'max_pages' in request_json:
             max_pages = int(request_json['max_pages'])
+        if request_json and 'concurrency' in request_json:
+            concurrency = int(request_json['concurrency'])
+        if request_json and 'rate_limit' in request_json:
+            rate_limit = request_json['rate_limit']
+        if request_json and 'parser' in request_json:
+            parser = request_json['parser']
+        if request_json and 'cache' in request_json:
+            cache_location = request_json['cache']
+        if request_json and 'format' in request_json:
+            output_format = request_json['format'].lower()
+        if request_json and 'transform' in request_json:
+            transform = request_json['transform']
+        if request_json and 'crawl' in request_json:
+            crawl = request_json['crawl']
+        if request_json and 'checkpoint' in request_json:
+            checkpoint_location = request_json['checkpoint']
+        if output_format not in FORMATS:
+            return json.dumps({
+                'status': 'error',
+                'message': f"Unsupported format '{output_format}', expected one of: {', '.join(FORMATS)}"
+            }), 400
+        if transform not in ('auto', *TRANSFORMS):
+            return json.dumps({
+                'status': 'error',
+                'message': f"Unsupported transform '{transform}', expected one of: auto, {', '.join(TRANSFORMS)}"
+            }), 400
+        if crawl not in CRAWL_MODES:
+            return json.dumps({
+                'status': 'error',
+                'message': f"Unsupported crawl '{crawl}', expected one of: {', '.join(CRAWL_MODES)}"
+            }), 400
+        rate_limit = float(rate_limit) if rate_limit else None
+        
+        # Worker mode: scrape one shard of a coordinated run
+        if request_json and 'shard' in request_json:
+            return extract_shard(request_json, output_format, concurrency, rate_limit, base_url, parser,
+                                 cache_location, transform, crawl, checkpoint_location, started)
         
-        # Extract
-        print("Starting data extraction...")
-        book_data = scrape_books(max_pages=max_pages)
-        print(f"Extracted {len(book_data)} book records")
+        # Coordinator mode: fan page ranges out to worker invocations
+        shard_count = int((request_json or {}).get('shards', os.environ.get('EXTRACT_SHARDS', 1)))
+        if shard_count > 1:
+            worker_urls = (request_json or {}).get('worker_urls', os.environ.get('EXTRACT_WORKER_URLS'))
+            if not worker_urls:
+                return json.dumps({
+                    'status': 'error',
+                    'message': "Sharded extraction needs 'worker_urls' or EXTRACT_WORKER_URLS"
+                }), 400
+            options = {'concurrency': concurrency, 'rate_limit': rate_limit, 'parser': parser, 'transform': transform,
+                       'crawl': crawl}
+            return coordinate_shards(max_pages, shard_count, worker_urls, output_format, options, started)
         
-        # Save to GCS
+        cache = PageCache(open_store(cache_location)) if cache_location else None
+        checkpoint = (CrawlCheckpoint(open_store(checkpoint_location))
+                      if checkpoint_location and crawl == 'details' else None)
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        bucket_name = "giorgi"
-        blob_name = f"books_{timestamp}.csv"
+        blob_name = f"books_{timestamp}.{FORMATS[output_format][0]}"
         
-        gcs_uri = save_to_gcs(book_data, bucket_name, blob_name)
+        # Extract and stream to GCS; the upload runs while pages are still being scraped
+        print(f"Starting data extraction (crawl={crawl}, concurrency={concurrency})...")
+        gcs_uri, book_count, page_stats, timings, quality = extract_pages(
+            1, max_pages, blob_name, output_format, concurrency, rate_limit, base_url, parser, cache, transform,
+            crawl, checkpoint)
+        RUNS.inc(status='success')
+        print(f"Extracted {book_count} book records (pages: {page_stats})")
         print(f"Data saved to Cloud Storage: {gcs_uri}")
+        metrics.log_event('extract_complete', books=book_count, pages=page_stats, output_format=output_format,
+                          rejected=quality.get('rejected', 0), upload_ms=round(timings['upload'], 3),
+                          duration_ms=round((time.perf_counter() - started) * 1000, 3))
         
         # Return success response with GCS URI
         return json.dumps({
             'status': 'success',
-            'message': f"Extracted {len(book_data)} books and saved to GCS",
-            'gcs_uri': gcs_uri
+            'message': f"Extracted {book_count} books and saved to GCS",
+            'gcs_uri': gcs_uri,
+            'pages': page_stats,
+            'quality': quality
         })
     except Exception as e:
         print(f"Error in extract_to_gcs: {str(e)}")
+        RUNS.inc(status='error')
+        metrics.log_event('extract_failed', severity='ERROR', error=str(e),
+                          duration_ms=round((time.perf_counter() - started) * 1000, 3))
         return json.dumps({
             'status': 'error',
             'message': str(e)
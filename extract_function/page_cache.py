@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from google.cloud import storage
+from google.api_core.exceptions import NotFound
+
+# Bump when the shape of cached records changes so stale entries are ignored
+CACHE_VERSION = 2
+
+
+def content_hash(content):
+    """Stable fingerprint of a page body"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class LocalFileStore:
+    """Keeps the cache as a JSON file on local disk"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, payload):
+        # Write to a temp file first so a crash never leaves a truncated cache
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(payload, tmp_file)
+        os.replace(tmp_path, self.path)
+
+    def __str__(self):
+        return self.path
+
+
+class GCSStore:
+    """Keeps the cache as a JSON object in Cloud Storage"""
+
+    def __init__(self, bucket_name, blob_name, storage_client=None):
+        self.bucket_name = bucket_name
+        self.blob_name = blob_name
+        self._storage_client = storage_client
+
+    def _blob(self):
+        self._storage_client = self._storage_client or storage.Client()
+        return self._storage_client.bucket(self.bucket_name).blob(self.blob_name)
+
+    def load(self):
+        try:
+            return json.loads(self._blob().download_as_bytes())
+        except NotFound:
+            return None
+
+    def save(self, payload):
+        self._blob().upload_from_string(json.dumps(payload), content_type='application/json')
+
+    def __str__(self):
+        return f"gs://{self.bucket_name}/{self.blob_name}"
+
+
+def open_store(location, storage_client=None):
+    """Build a cache store from a local path or a gs://bucket/object URI"""
+    if location.startswith('gs://'):
+        bucket_name, _, blob_name = location[len('gs://'):].partition('/')
+        if not bucket_name or not blob_name:
+            raise ValueError(f"Invalid GCS cache location: {location}")
+        return GCSStore(bucket_name, blob_name, storage_client)
+    return LocalFileStore(location)
+
+
+class PageCache:
+    """Per-URL HTTP validators, content hash and parsed records
+
+    Entries let a run send conditional requests (If-None-Match /
+    If-Modified-Since) and reuse the records of pages that come back
+    304 Not Modified or with an unchanged body, instead of parsing them again.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        payload = store.load() or {}
+        if payload.get('version') == CACHE_VERSION:
+            self.entries = payload.get('pages', {})
+        else:
+            self.entries = {}
+        self.dirty = False
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def conditional_headers(self, url):
+        """Request headers that let the server answer 304 for an unchanged page"""
+        entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, response, digest, records):
+        self.entries[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'hash': digest,
+            'records': records,
+        }
+        self.dirty = True
+
+    def save(self):
+        if self.dirty:
+            self.store.save({'version': CACHE_VERSION, 'pages': self.entries})
+            self.dirty = False
@@ -0,0 +1,156 @@
+import functools
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional; parse_books falls back to BeautifulSoup
+    lxml_html = None
+
+_PRODUCT_POD = "//article[contains(concat(' ', normalize-space(@class), ' '), ' product_pod ')]"
+_PRICE = ".//p[contains(concat(' ', normalize-space(@class), ' '), ' price_color ')]"
+_PRODUCT_MAIN = "//div[contains(concat(' ', normalize-space(@class), ' '), ' product_main ')]"
+_RATING = ".//p[contains(concat(' ', normalize-space(@class), ' '), ' star-rating ')]/@class"
+_BREADCRUMB = "//ul[contains(concat(' ', normalize-space(@class), ' '), ' breadcrumb ')]/li"
+
+
+def parse_books_soup(content, raw=False):
+    """Parse product_pod listings with BeautifulSoup (reference implementation)
+
+    With raw=True the price is left as the scraped text (e.g. '£51.77') for
+    transform.py to convert and validate in batches.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    records = []
+    for book in soup.find_all('article', class_='product_pod'):
+        # Title
+        title = book.h3.a['title']
+
+        # Price
+        price_text = book.find('p', class_='price_color').text.strip()
+        # Convert price to numeric format (remove £ and convert to float)
+        price = price_text if raw else float(price_text.replace('£', ''))
+
+        # Rating
+        rating = book.p['class'][1]
+
+        records.append({'title': title, 'price': price, 'rating': rating})
+
+    # Break the parse tree's reference cycles so memory is freed page by page
+    soup.decompose()
+    return records
+
+
+def parse_books_lxml(content, raw=False):
+    """Parse product_pod listings with lxml, visiting only the title, price and rating nodes"""
+    tree = lxml_html.fromstring(content)
+    records = []
+    for book in tree.xpath(_PRODUCT_POD):
+        title = book.xpath('.//h3/a/@title')[0]
+        price_text = book.xpath(_PRICE)[0].text_content().strip()
+        price = price_text if raw else float(price_text.replace('£', ''))
+        rating = book.xpath('(.//p)[1]/@class')[0].split()[1]
+        records.append({'title': str(title), 'price': price, 'rating': rating})
+    return records
+
+
+def parse_links_soup(content, page_url):
+    """Absolute URLs of every link inside a product_pod (image and title links alike)"""
+    soup = BeautifulSoup(content, 'html.parser')
+    links = [urljoin(page_url, link['href'])
+             for book in soup.find_all('article', class_='product_pod') for link in book.find_all('a', href=True)]
+    soup.decompose()
+    return links
+
+
+def parse_links_lxml(content, page_url):
+    """Absolute URLs of every link inside a product_pod, read with lxml"""
+    tree = lxml_html.fromstring(content)
+    return [urljoin(page_url, str(href)) for href in tree.xpath(_PRODUCT_POD + '//a/@href')]
+
+
+def parse_detail_soup(content):
+    """Parse a product detail page with BeautifulSoup (reference implementation)
+
+    Returns a raw record: title, price text and rating as on the listing,
+    plus the UPC, availability text (e.g. 'In stock (22 available)') and
+    category from the breadcrumb. Missing elements come back as None.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    main = soup.find('div', class_='product_main')
+    price = main.find('p', class_='price_color') if main else None
+    rating = main.find('p', class_='star-rating') if main else None
+    info = {row.th.get_text(strip=True): row.td.get_text(strip=True)
+            for row in soup.find_all('tr') if row.th and row.td}
+    breadcrumb = soup.find('ul', class_='breadcrumb')
+    crumbs = breadcrumb.find_all('li') if breadcrumb else []
+    record = {
+        'title': main.h1.get_text() if main and main.h1 else None,
+        'price': price.get_text(strip=True) if price else None,
+        'rating': rating['class'][1] if rating and len(rating['class']) > 1 else None,
+        'upc': info.get('UPC'),
+        'availability': info.get('Availability'),
+        'category': crumbs[-2].get_text(strip=True) if len(crumbs) >= 3 else None,
+    }
+    soup.decompose()
+    return record
+
+
+def parse_detail_lxml(content):
+    """Parse a product detail page with lxml; same record as parse_detail_soup"""
+    tree = lxml_html.fromstring(content)
+    main = tree.xpath(_PRODUCT_MAIN)
+    main = main[0] if main else None
+    price = main.xpath(_PRICE) if main is not None else []
+    rating = main.xpath(_RATING) if main is not None else []
+    rating = rating[0].split() if rating else []
+    info = {}
+    for row in tree.xpath('//tr[th and td]'):
+        info[row.xpath('string(th)').strip()] = row.xpath('string(td)').strip()
+    crumbs = tree.xpath(_BREADCRUMB)
+    title = main.xpath('.//h1') if main is not None else []
+    return {
+        'title': title[0].text_content() if title else None,
+        'price': price[0].text_content().strip() if price else None,
+        'rating': rating[1] if len(rating) > 1 else None,
+        'upc': info.get('UPC'),
+        'availability': info.get('Availability'),
+        'category': crumbs[-2].text_content().strip() if len(crumbs) >= 3 else None,
+    }
+
+PARSERS = {
+    'bs4': parse_books_soup,
+    'lxml': parse_books_lxml,
+}
+
+
+def available_parsers():
+    """Names of the parser backends usable in this environment"""
+    return [name for name in PARSERS if name != 'lxml' or lxml_html is not None]
+
+
+def _backend(name):
+    if name in (None, 'auto', 'lxml'):
+        return 'lxml' if lxml_html is not None else 'bs4'
+    if name not in PARSERS:
+        raise ValueError(f"Unknown parser '{name}', expected one of: auto, {', '.join(PARSERS)}")
+    return name
+
+
+def get_parser(name='auto', raw=False):
+    """Return the parse function for a backend name
+
+    'auto' picks the lxml fast path when lxml is installed and BeautifulSoup
+    otherwise. Requesting 'lxml' without lxml installed also falls back.
+    With raw=True the returned function leaves prices as scraped text.
+    """
+    parse = PARSERS[_backend(name)]
+    return functools.partial(parse, raw=True) if raw else parse
+
+
+def get_detail_parsers(name='auto'):
+    """Return (parse_links, parse_detail) for a backend name, resolved like get_parser"""
+    if _backend(name) == 'lxml':
+        return parse_links_lxml, parse_detail_lxml
+    return parse_links_soup, parse_detail_soup
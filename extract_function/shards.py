@@ -0,0 +1,121 @@
+import datetime
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from google.cloud import storage
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+# Most shards the coordinator waits on at once; the rest queue for a free slot
+DEFAULT_MAX_WORKERS = 16
+# A worker invocation may scrape for as long as the function timeout allows
+DEFAULT_WORKER_TIMEOUT = 540
+MANIFEST_VERSION = 1
+
+
+def plan_shards(first_page, last_page, shard_count):
+    """Split pages first_page..last_page into at most `shard_count` contiguous ranges
+
+    Returns [{'shard', 'start_page', 'end_page'}, ...] with sizes differing by
+    at most one page.
+    """
+    pages = last_page - first_page + 1
+    if pages < 1:
+        raise ValueError(f"Empty page range {first_page}..{last_page}")
+    shard_count = max(1, min(int(shard_count), pages))
+    size, extra = divmod(pages, shard_count)
+    shards = []
+    start = first_page
+    for shard in range(shard_count):
+        end = start + size - 1 + (1 if shard < extra else 0)
+        shards.append({'shard': shard, 'start_page': start, 'end_page': end})
+        start = end + 1
+    return shards
+
+
+def shard_blob_name(run_id, shard, shard_count, extension):
+    """Object name of one shard; fixed per shard so a retry overwrites a partial attempt"""
+    return f"books_{run_id}/shard-{shard:05d}-of-{shard_count:05d}.{extension}"
+
+
+def manifest_blob_name(run_id):
+    return f"books_{run_id}/manifest.json"
+
+
+def http_invoker(worker_urls, session=None, timeout=DEFAULT_WORKER_TIMEOUT):
+    """Build invoke(payload, attempt) that POSTs a shard to a worker and returns its JSON
+
+    Attempts rotate through `worker_urls`, so a retry lands on a different
+    worker when several are given. Raises on HTTP errors and on responses
+    whose status is not 'success'.
+    """
+    if isinstance(worker_urls, str):
+        worker_urls = [url.strip() for url in worker_urls.split(',') if url.strip()]
+    if not worker_urls:
+        raise ValueError("Sharded extraction needs at least one worker URL")
+    session = session or requests.Session()
+
+    def invoke(payload, attempt):
+        url = worker_urls[(payload['shard'] + attempt) % len(worker_urls)]
+        response = session.post(url, json=payload, timeout=timeout)
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        if response.status_code != 200 or result.get('status') != 'success':
+            raise RuntimeError(f"Worker {url} failed shard {payload['shard']} "
+                               f"({response.status_code}): {result.get('message', response.text[:200])}")
+        return result
+
+    return invoke
+
+
+def run_shards(shards, invoke, max_attempts=DEFAULT_MAX_ATTEMPTS, max_workers=DEFAULT_MAX_WORKERS,
+               backoff=DEFAULT_RETRY_BACKOFF, sleep=time.sleep):
+    """Invoke shards in parallel, at most `max_workers` at a time, retrying each one independently
+
+    `invoke(shard, attempt)` returns the worker's result dict or raises. A
+    failing shard is retried up to `max_attempts` times with exponential
+    backoff without holding up the others. Returns one entry per shard with
+    its status ('success' or 'failed'), attempts, and gcs_uri/books or error.
+    """
+    def run_one(shard):
+        error = None
+        for attempt in range(max_attempts):
+            if attempt:
+                sleep(backoff * 2 ** (attempt - 1))
+            try:
+                result = invoke(shard, attempt)
+                return dict(shard, status='success', attempts=attempt + 1,
+                            gcs_uri=result['gcs_uri'], books=result.get('books', 0))
+            except Exception as e:
+                error = str(e)
+                print(f"Shard {shard['shard']} attempt {attempt + 1}/{max_attempts} failed: {error}")
+        return dict(shard, status='failed', attempts=max_attempts, error=error)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as executor:
+        return list(executor.map(run_one, shards))
+
+
+def build_manifest(run_id, output_format, results):
+    """Manifest describing every shard of a run, loadable by gcs_to_bigquery"""
+    return {
+        'version': MANIFEST_VERSION,
+        'run_id': run_id,
+        'format': output_format,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'complete': all(result['status'] == 'success' for result in results),
+        'books': sum(result.get('books', 0) for result in results),
+        'shards': results,
+    }
+
+
+def write_manifest(manifest, bucket_name, storage_client=None):
+    """Upload the manifest next to its shards; returns its gs:// URI"""
+    blob_name = manifest_blob_name(manifest['run_id'])
+    storage_client = storage_client or storage.Client()
+    blob = storage_client.bucket(bucket_name).blob(blob_name)
+    blob.upload_from_string(json.dumps(manifest, indent=2), content_type='application/json')
+    return f"gs://{bucket_name}/{blob_name}"
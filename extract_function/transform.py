@@ -0,0 +1,314 @@
+"""Batch transform and validation between scraping and the upload
+
+The parsers hand over raw records (price still the scraped text such as
+'£51.77', rating the star-rating class). Here they are converted and checked
+a batch at a time, and the scraped date is stamped once per batch. Records
+from detail pages (crawler.py) also carry a UPC, availability text and
+category; with detail=True those are checked and passed on too. A row
+that fails a check is set aside with its reason rather than sent on to
+BigQuery, where one bad value fails the whole load job.
+
+Two implementations apply the same rules: transform_batch_rows, the per-row
+reference, and transform_batch_arrow, which runs each conversion and check
+as one pyarrow.compute kernel over the whole batch.
+"""
+import datetime
+import functools
+import math
+import re
+import time
+
+try:
+    import pyarrow
+    import pyarrow.compute as pc
+except ImportError:  # the columnar transform is optional; transform_batch_rows needs nothing
+    pyarrow = None
+
+RATINGS = ('One', 'Two', 'Three', 'Four', 'Five')
+RATING_STARS = {name: stars for stars, name in enumerate(RATINGS, start=1)}
+PRICE_RANGE = (0.0, 10000.0)
+DEFAULT_BATCH_ROWS = 1000
+
+# A rejected row reports the first of these checks it fails
+REJECT_REASONS = ('invalid_title', 'missing_title', 'missing_price', 'invalid_price', 'price_out_of_range',
+                  'missing_rating', 'invalid_rating')
+DETAIL_REJECT_REASONS = ('missing_upc',)
+
+_PRICE_PATTERN = r'^[0-9]+(\.[0-9]+)?$'
+_PRICE_RE = re.compile(_PRICE_PATTERN)
+# 'In stock (22 available)' -> availability 'In stock', stock 22
+_STOCK_PATTERN = r'\((?P<stock>[0-9]+) available\)'
+_STOCK_RE = re.compile(_STOCK_PATTERN)
+_COUNT_PATTERN = r'\(.*\)'
+
+
+def batch_stats(rows, rejected, reasons, ratings, prices):
+    """Data-quality summary of one batch; `prices` are the valid rows' prices"""
+    return {
+        'rows': rows,
+        'valid': rows - rejected,
+        'rejected': rejected,
+        'reasons': reasons,
+        'ratings': ratings,
+        'price_min': min(prices) if prices else None,
+        'price_max': max(prices) if prices else None,
+        'price_mean': sum(prices) / len(prices) if prices else None,
+    }
+
+
+def check_row(record, price_range=PRICE_RANGE, detail=False):
+    """Return (reason, price, stars) for one raw record; reason is None when every check passes"""
+    title = record.get('title')
+    if title is not None and not isinstance(title, str):
+        return 'invalid_title', None, None
+    if title is None or not title.strip():
+        return 'missing_title', None, None
+
+    price = record.get('price')
+    if isinstance(price, str):
+        price = price.replace('£', '').strip()
+        if not price:
+            return 'missing_price', None, None
+        if not _PRICE_RE.match(price):
+            return 'invalid_price', None, None
+        price = float(price)
+    elif price is None:
+        return 'missing_price', None, None
+    elif isinstance(price, bool) or not isinstance(price, (int, float)) or math.isnan(price):
+        return 'invalid_price', None, None
+    if not price_range[0] <= price <= price_range[1]:
+        return 'price_out_of_range', None, None
+
+    rating = record.get('rating')
+    if rating is None or rating == '':
+        return 'missing_rating', None, None
+    if rating not in RATING_STARS:
+        return 'invalid_rating', None, None
+    if detail:
+        upc = record.get('upc')
+        if not isinstance(upc, str) or not upc.strip():
+            return 'missing_upc', None, None
+    return None, float(price), RATING_STARS[rating]
+
+
+def detail_fields(record):
+    """upc, availability, stock and category of a detail-page record"""
+    availability = record.get('availability')
+    match = _STOCK_RE.search(availability) if isinstance(availability, str) else None
+    return {
+        'upc': record['upc'],
+        'availability': re.sub(_COUNT_PATTERN, '', availability).strip() if isinstance(availability, str) else None,
+        'stock': int(match.group('stock')) if match else None,
+        'category': record.get('category'),
+    }
+
+
+def transform_batch_rows(records, scraped_date, price_range=PRICE_RANGE, detail=False):
+    """Convert and validate a batch one record at a time (reference implementation)
+
+    Returns (rows, rejects, stats): rows are dicts ready for the writers,
+    rejects are the raw records with a 'reason' added.
+    """
+    rows, rejects, reasons, ratings, prices = [], [], {}, {}, []
+    scraped_date = scraped_date.isoformat()
+    for record in records:
+        reason, price, stars = check_row(record, price_range, detail)
+        if reason is not None:
+            rejects.append(dict(record, reason=reason))
+            reasons[reason] = reasons.get(reason, 0) + 1
+            continue
+        row = {'title': record['title'], 'price': price, 'rating': record['rating'], 'scraped_date': scraped_date}
+        if detail:
+            row.update(detail_fields(record))
+        rows.append(row)
+        ratings[stars] = ratings.get(stars, 0) + 1
+        prices.append(price)
+    return rows, rejects, batch_stats(len(records), len(rejects), reasons, ratings, prices)
+
+
+def book_table(title, price, rating, scraped_date, details=None):
+    """pyarrow Table with the columns and types of the BigQuery table
+
+    `details` holds the upc, availability, stock and category arrays of a
+    detail crawl.
+    """
+    return pyarrow.table(dict({
+        'title': title,
+        'price': price,
+        'rating': rating,
+        'scraped_date': pyarrow.repeat(pyarrow.scalar(scraped_date, pyarrow.date32()), len(title)),
+    }, **(details or {})))
+
+
+def _field(raw, name):
+    try:
+        return raw.field(name)
+    except KeyError:
+        return pyarrow.nulls(len(raw))
+
+
+def _counts(values):
+    return {item['values']: item['counts'] for item in pc.value_counts(values).to_pylist()}
+
+
+def transform_batch_arrow(records, scraped_date, price_range=PRICE_RANGE, detail=False):
+    """Convert and validate a batch with vectorized Arrow kernels
+
+    Same rules and results as transform_batch_rows, but rows come back as a
+    pyarrow Table. Only rejected rows are touched one at a time. A batch
+    whose columns mix value types (e.g. numeric and text prices) is handed
+    to transform_batch_rows.
+    """
+    if pyarrow is None:
+        raise RuntimeError("The columnar transform requires pyarrow")
+    try:
+        raw = pyarrow.array(records, type=None if records else pyarrow.struct([]))
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        raw = None
+    text_fields = ('title', 'rating') + (('upc', 'availability', 'category') if detail else ())
+    columns = {name: _field(raw, name) for name in text_fields + ('price',)} if raw is not None else {}
+    if raw is None or not all(pyarrow.types.is_string(columns[name].type) or pyarrow.types.is_null(columns[name].type)
+                              for name in text_fields):
+        return _rows_as_table(records, scraped_date, price_range, detail)
+    title, rating = (columns[name].cast(pyarrow.string()) for name in ('title', 'rating'))
+    price = columns['price']
+
+    missing_title = pc.fill_null(pc.equal(pc.utf8_length(pc.utf8_trim_whitespace(title)), 0), True)
+    if pyarrow.types.is_string(price.type) or pyarrow.types.is_null(price.type):
+        price_text = pc.utf8_trim_whitespace(pc.replace_substring(price.cast(pyarrow.string()), '£', ''))
+        missing_price = pc.fill_null(pc.equal(pc.utf8_length(price_text), 0), True)
+        parsed = pc.fill_null(pc.match_substring_regex(price_text, _PRICE_PATTERN), False)
+        value = pc.if_else(parsed, price_text, pyarrow.scalar(None, pyarrow.string())).cast(pyarrow.float64())
+    elif pyarrow.types.is_integer(price.type) or pyarrow.types.is_floating(price.type):
+        value = price.cast(pyarrow.float64())
+        missing_price = pc.is_null(price)
+        parsed = pc.invert(pc.fill_null(pc.is_nan(value), True))
+    else:
+        return _rows_as_table(records, scraped_date, price_range, detail)
+    stars = pc.index_in(rating, value_set=pyarrow.array(RATINGS))
+    missing_rating = pc.fill_null(pc.equal(pc.utf8_length(rating), 0), True)
+
+    checks = [
+        ('missing_title', missing_title),
+        ('missing_price', missing_price),
+        ('invalid_price', pc.and_(pc.invert(missing_price), pc.invert(parsed))),
+        ('price_out_of_range', pc.fill_null(pc.or_(pc.less(value, price_range[0]),
+                                                   pc.greater(value, price_range[1])), False)),
+        ('missing_rating', missing_rating),
+        ('invalid_rating', pc.and_(pc.invert(missing_rating), pc.is_null(stars))),
+    ]
+    details = None
+    if detail:
+        upc, availability, category = (columns[name].cast(pyarrow.string())
+                                       for name in ('upc', 'availability', 'category'))
+        checks.append(('missing_upc', pc.fill_null(pc.equal(pc.utf8_length(pc.utf8_trim_whitespace(upc)), 0), True)))
+        stock = pc.struct_field(pc.extract_regex(availability, _STOCK_PATTERN), [0])
+        details = {
+            'upc': upc,
+            'availability': pc.utf8_trim_whitespace(pc.replace_substring_regex(availability, _COUNT_PATTERN, '')),
+            'stock': stock.cast(pyarrow.int64()),
+            'category': category,
+        }
+    rejected = functools.reduce(pc.or_, (mask for _, mask in checks))
+    keep = pc.invert(rejected)
+    if details:
+        details = {name: column.filter(keep) for name, column in details.items()}
+    table = book_table(title.filter(keep), value.filter(keep), rating.filter(keep), scraped_date, details)
+
+    rejects, reasons = [], {}
+    if table.num_rows < len(records):
+        reason = pyarrow.nulls(len(records), pyarrow.string())
+        for name, mask in reversed(checks):
+            reason = pc.if_else(mask, name, reason)
+        indices = pc.indices_nonzero(rejected)
+        rejects = [dict(records[index], reason=name)
+                   for index, name in zip(indices.to_pylist(), reason.take(indices).to_pylist())]
+        reasons = _counts(reason.take(indices))
+
+    prices = table['price']
+    stats = batch_stats(len(records), len(rejects), reasons, _counts(pc.add(stars.filter(keep), 1)), [])
+    if table.num_rows:
+        extremes = pc.min_max(prices).as_py()
+        stats.update(price_min=extremes['min'], price_max=extremes['max'], price_mean=pc.mean(prices).as_py())
+    return table, rejects, stats
+
+
+def _rows_as_table(records, scraped_date, price_range, detail):
+    rows, rejects, stats = transform_batch_rows(records, scraped_date, price_range, detail)
+    details = None
+    if detail:
+        details = {name: pyarrow.array([row[name] for row in rows], pyarrow.int64() if name == 'stock' else pyarrow.string())
+                   for name in ('upc', 'availability', 'stock', 'category')}
+    table = book_table(pyarrow.array([row['title'] for row in rows], pyarrow.string()),
+                       pyarrow.array([row['price'] for row in rows], pyarrow.float64()),
+                       pyarrow.array([row['rating'] for row in rows], pyarrow.string()), scraped_date, details)
+    return table, rejects, stats
+
+
+TRANSFORMS = {
+    'rows': transform_batch_rows,
+    'arrow': transform_batch_arrow,
+}
+
+
+def resolve_transform(name='auto'):
+    """Name of the transform to use: 'auto' (and 'arrow') fall back to 'rows' without pyarrow"""
+    if name in (None, 'auto', 'arrow'):
+        return 'arrow' if pyarrow is not None else 'rows'
+    if name not in TRANSFORMS:
+        raise ValueError(f"Unknown transform '{name}', expected one of: auto, {', '.join(TRANSFORMS)}")
+    return name
+
+
+def merge_stats(total, stats):
+    """Fold one batch's stats into running totals for the run"""
+    valid_before = total.get('valid', 0)
+    for key in ('batches', 'rows', 'valid', 'rejected', 'transform_ms'):
+        total[key] = total.get(key, 0) + stats.get(key, 1 if key == 'batches' else 0)
+    for key in ('reasons', 'ratings'):
+        counts = total.setdefault(key, {})
+        for name, count in stats[key].items():
+            counts[name] = counts.get(name, 0) + count
+    if stats['price_mean'] is not None:
+        total['price_min'] = min(total.get('price_min', stats['price_min']), stats['price_min'])
+        total['price_max'] = max(total.get('price_max', stats['price_max']), stats['price_max'])
+        total['price_mean'] = (total.get('price_mean', 0.0) * valid_before
+                               + stats['price_mean'] * stats['valid']) / total['valid']
+    return total
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_transformed(records, transform='auto', batch_rows=DEFAULT_BATCH_ROWS, price_range=PRICE_RANGE,
+                     scraped_date=None, rejects=None, quality=None, on_batch=None, detail=False):
+    """Transform raw records `batch_rows` at a time, yielding each batch's valid rows
+
+    Batches are lists of dicts with the 'rows' transform and pyarrow Tables
+    with 'arrow'. Rows are stamped with `scraped_date`, or today's date
+    taken once per batch. Rejected rows are appended to `rejects`, run
+    totals are kept in `quality`, and `on_batch` is called with every
+    batch's stats (including 'transform_ms'). With detail=True the detail
+    columns are checked and kept as well.
+    """
+    transform_batch = TRANSFORMS[resolve_transform(transform)]
+    quality = quality if quality is not None else {}
+    for batch in _batches(records, batch_rows):
+        started = time.perf_counter()
+        valid, batch_rejects, stats = transform_batch(batch, scraped_date or datetime.date.today(), price_range,
+                                                      detail)
+        stats['transform_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if rejects is not None:
+            rejects.extend(batch_rejects)
+        merge_stats(quality, stats)
+        if on_batch is not None:
+            on_batch(stats)
+        yield valid
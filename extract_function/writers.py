@@ -0,0 +1,385 @@
+import csv
+import datetime
+import io
+import json
+import queue
+import threading
+import time
+import uuid
+
+from google.cloud import storage
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+try:
+    import fastavro
+except ImportError:  # Avro output is optional
+    fastavro = None
+
+FIELDNAMES = ['title', 'price', 'rating', 'scraped_date']
+# Extra columns of records enriched from product detail pages (crawler.py)
+DETAIL_FIELDNAMES = FIELDNAMES + ['upc', 'availability', 'stock', 'category']
+
+# Explicit column types shared by the columnar formats (mirrors the BigQuery table)
+AVRO_SCHEMA = {
+    'type': 'record',
+    'name': 'Book',
+    'fields': [
+        {'name': 'title', 'type': 'string'},
+        {'name': 'price', 'type': 'double'},
+        {'name': 'rating', 'type': 'string'},
+        {'name': 'scraped_date', 'type': {'type': 'int', 'logicalType': 'date'}},
+    ],
+}
+
+DETAIL_AVRO_SCHEMA = dict(AVRO_SCHEMA, name='DetailedBook', fields=AVRO_SCHEMA['fields'] + [
+    {'name': 'upc', 'type': 'string'},
+    {'name': 'availability', 'type': ['null', 'string'], 'default': None},
+    {'name': 'stock', 'type': ['null', 'long'], 'default': None},
+    {'name': 'category', 'type': ['null', 'string'], 'default': None},
+])
+
+# Output format -> (file extension, content type)
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'avro': ('avro', 'application/avro'),
+}
+
+# Resumable upload chunks must be a multiple of 256 KiB
+DEFAULT_CHUNK_SIZE = 4 * 256 * 1024
+
+# Uploads are written here and copied to their final name once complete, so
+# a failed upload never leaves a truncated object where loads look for it
+PARTIAL_PREFIX = '_partial/'
+
+_DONE = object()
+_ABORT = object()
+
+
+class RowCounter:
+    """Pass-through iterator that counts the records flowing through it"""
+
+    def __init__(self, records):
+        self._records = iter(records)
+        self.count = 0
+
+    def __iter__(self):
+        for record in self._records:
+            self.count += 1
+            yield record
+
+
+def iter_csv_chunks(records, fieldnames=FIELDNAMES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode records as CSV, yielding UTF-8 chunks of roughly `chunk_size` bytes"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink:
+    """Write-only file object that hands out what was written since the last drain
+
+    Encoders (ParquetWriter, fastavro) see a continuous stream and an
+    ever-growing position, so offsets written into file footers stay correct.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._buffered = 0
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    @property
+    def buffered(self):
+        return self._buffered
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        self._buffered = 0
+        return data
+
+
+def _parse_date(value):
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _book_schema(detail=False):
+    fields = [
+        ('title', pyarrow.string()),
+        ('price', pyarrow.float64()),
+        ('rating', pyarrow.string()),
+        ('scraped_date', pyarrow.date32()),
+    ]
+    if detail:
+        fields += [('upc', pyarrow.string()), ('availability', pyarrow.string()), ('stock', pyarrow.int64()),
+                   ('category', pyarrow.string())]
+    return pyarrow.schema(fields)
+
+
+def iter_parquet_table_chunks(tables, compression='snappy', detail=False):
+    """Encode pyarrow Tables as Parquet, one row group per table"""
+    if pyarrow is None:
+        raise RuntimeError("Parquet output requires pyarrow")
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), _book_schema(detail),
+                                       compression=compression) as writer:
+        for table in tables:
+            writer.write_table(table)
+            yield sink.drain()
+    if sink.buffered:
+        yield sink.drain()
+
+
+def iter_parquet_chunks(records, batch_rows=50000, compression='snappy', detail=False):
+    """Encode records as Parquet, one row group per `batch_rows` records"""
+    if pyarrow is None:
+        raise RuntimeError("Parquet output requires pyarrow")
+    schema = _book_schema(detail)
+
+    def tables():
+        for batch in _batches(records, batch_rows):
+            columns = {name: [record[name] for record in batch] for name in schema.names}
+            columns['scraped_date'] = [_parse_date(value) for value in columns['scraped_date']]
+            yield pyarrow.Table.from_pydict(columns, schema=schema)
+
+    yield from iter_parquet_table_chunks(tables(), compression=compression, detail=detail)
+
+
+def iter_csv_table_chunks(tables, chunk_size=DEFAULT_CHUNK_SIZE, detail=False):
+    """Encode pyarrow Tables as CSV with Arrow's writer (strings are always quoted)"""
+    if pyarrow is None:
+        raise RuntimeError("Writing Arrow tables requires pyarrow")
+    sink = _ChunkSink()
+    with pyarrow.csv.CSVWriter(pyarrow.PythonFile(sink, mode='w'), _book_schema(detail)) as writer:
+        for table in tables:
+            writer.write_table(table)
+            if sink.buffered >= chunk_size:
+                yield sink.drain()
+    if sink.buffered:
+        yield sink.drain()
+
+
+def iter_avro_chunks(records, codec='deflate', chunk_size=DEFAULT_CHUNK_SIZE, detail=False):
+    """Encode records as an Avro object container file with AVRO_SCHEMA (DETAIL_AVRO_SCHEMA with detail=True)"""
+    if fastavro is None:
+        raise RuntimeError("Avro output requires fastavro")
+    sink = _ChunkSink()
+    schema = DETAIL_AVRO_SCHEMA if detail else AVRO_SCHEMA
+    writer = fastavro.write.Writer(sink, fastavro.parse_schema(schema), codec=codec)
+    dates = {}
+    for record in records:
+        scraped_date = record['scraped_date']
+        if scraped_date not in dates:
+            dates[scraped_date] = _parse_date(scraped_date)
+        writer.write(dict(record, scraped_date=dates[scraped_date]))
+        if sink.buffered >= chunk_size:
+            yield sink.drain()
+    writer.flush()
+    if sink.buffered:
+        yield sink.drain()
+
+
+def iter_chunks(records, output_format='csv', chunk_size=DEFAULT_CHUNK_SIZE, detail=False):
+    """Encode records in `output_format` (csv, parquet or avro) as byte chunks
+
+    With detail=True the detail-page columns (DETAIL_FIELDNAMES) are written too.
+    """
+    if output_format == 'csv':
+        return iter_csv_chunks(records, fieldnames=DETAIL_FIELDNAMES if detail else FIELDNAMES, chunk_size=chunk_size)
+    if output_format == 'parquet':
+        return iter_parquet_chunks(records, detail=detail)
+    if output_format == 'avro':
+        return iter_avro_chunks(records, chunk_size=chunk_size, detail=detail)
+    raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(FORMATS)}")
+
+
+def iter_table_chunks(tables, output_format='csv', chunk_size=DEFAULT_CHUNK_SIZE, detail=False):
+    """Encode pyarrow Tables (from the columnar transform) in `output_format` as byte chunks
+
+    CSV and Parquet are written by Arrow straight from the columns; Avro
+    still goes through fastavro one row at a time.
+    """
+    if output_format == 'csv':
+        return iter_csv_table_chunks(tables, chunk_size=chunk_size, detail=detail)
+    if output_format == 'parquet':
+        return iter_parquet_table_chunks(tables, detail=detail)
+    if output_format == 'avro':
+        return iter_avro_chunks((row for table in tables for row in table.to_pylist()), chunk_size=chunk_size,
+                                detail=detail)
+    raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(FORMATS)}")
+
+
+def _delete_partial(blob):
+    try:
+        blob.delete()
+    except Exception as e:  # Leaves a stray object under PARTIAL_PREFIX, nothing else
+        print(f"Could not delete the partial upload {blob.name}: {e}")
+
+
+def upload_chunks(chunks, bucket_name, blob_name, content_type='text/csv',
+                  storage_client=None, chunk_size=DEFAULT_CHUNK_SIZE, max_pending_chunks=4, timings=None):
+    """Upload an iterable of byte chunks to GCS through a resumable upload
+
+    Chunks are produced on the calling thread and handed to a background
+    uploader through a bounded queue, so producing the data (scraping,
+    parsing, encoding) overlaps with the network upload while at most
+    `max_pending_chunks` chunks are held in memory. The data is written to
+    a temporary object under PARTIAL_PREFIX and copied to `blob_name` once
+    complete; if producing or uploading fails, the temporary object is
+    deleted and nothing is created at `blob_name`. Time spent writing to GCS
+    is accumulated in `timings['upload']` (milliseconds).
+    """
+    storage_client = storage_client or storage.Client()
+    bucket = storage_client.bucket(bucket_name)
+    partial = bucket.blob(f"{PARTIAL_PREFIX}{blob_name}.{uuid.uuid4().hex}")
+    pending = queue.Queue(maxsize=max_pending_chunks)
+    errors = []
+    timings = timings if timings is not None else {}
+    timings.setdefault('upload', 0.0)
+
+    def upload():
+        chunk = out = None
+        try:
+            out = partial.open('wb', chunk_size=chunk_size, content_type=content_type)
+            while True:
+                chunk = pending.get()
+                if chunk is _DONE:
+                    break
+                if chunk is _ABORT:
+                    raise RuntimeError("Upload aborted by producer")
+                start = time.perf_counter()
+                out.write(chunk)
+                timings['upload'] += (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            out.close()
+            bucket.copy_blob(partial, bucket, blob_name)
+            timings['upload'] += (time.perf_counter() - start) * 1000
+        except Exception as e:
+            errors.append(e)
+            if out is not None and not out.closed:
+                try:
+                    # Finalize what was sent so the temporary object can be deleted
+                    out.close()
+                except Exception:  # An unfinished session expires on its own after a week
+                    pass
+            # Keep draining so the producer never blocks on a dead uploader
+            while chunk not in (_DONE, _ABORT):
+                chunk = pending.get()
+        finally:
+            if out is not None:
+                _delete_partial(partial)
+
+    uploader = threading.Thread(target=upload, name=f"upload-{blob_name}", daemon=True)
+    uploader.start()
+    try:
+        for chunk in chunks:
+            if errors:
+                break
+            pending.put(chunk)
+    except BaseException:
+        pending.put(_ABORT)
+        uploader.join()
+        raise
+    pending.put(_DONE)
+    uploader.join()
+    if errors:
+        raise errors[0]
+
+    return f"gs://{bucket_name}/{blob_name}"
+
+
+def stream_to_gcs(records, bucket_name, blob_name, storage_client=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  output_format='csv', timings=None, detail=False):
+    """Stream records to GCS as CSV, Parquet or Avro without materializing the file
+
+    Returns (gcs_uri, row_count). See upload_chunks for `timings`.
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(FORMATS)}")
+    counter = RowCounter(records)
+    gcs_uri = upload_chunks(
+        iter_chunks(counter, output_format, chunk_size=chunk_size, detail=detail),
+        bucket_name, blob_name, content_type=FORMATS[output_format][1],
+        storage_client=storage_client, chunk_size=chunk_size, timings=timings,
+    )
+    return gcs_uri, counter.count
+
+
+def stream_tables_to_gcs(tables, bucket_name, blob_name, storage_client=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         output_format='csv', timings=None, detail=False):
+    """Like stream_to_gcs, for pyarrow Tables instead of record dicts
+
+    Returns (gcs_uri, row_count).
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(FORMATS)}")
+    counted = {'rows': 0}
+
+    def counting():
+        for table in tables:
+            counted['rows'] += table.num_rows
+            yield table
+
+    gcs_uri = upload_chunks(
+        iter_table_chunks(counting(), output_format, chunk_size=chunk_size, detail=detail),
+        bucket_name, blob_name, content_type=FORMATS[output_format][1],
+        storage_client=storage_client, chunk_size=chunk_size, timings=timings,
+    )
+    return gcs_uri, counted['rows']
+
+
+def write_rejects(rejects, bucket_name, blob_name, storage_client=None):
+    """Upload rejected rows as newline-delimited JSON (one raw record plus 'reason' per line)"""
+    storage_client = storage_client or storage.Client()
+    blob = storage_client.bucket(bucket_name).blob(blob_name)
+    data = ''.join(json.dumps(reject, default=str) + '\n' for reject in rejects)
+    blob.upload_from_string(data, content_type='application/x-ndjson')
+    return f"gs://{bucket_name}/{blob_name}"
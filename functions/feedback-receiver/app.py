@@ -1,8 +1,18 @@
 import os
+import sys
 import json
+import time
+import uuid
 import logging
-from flask import Flask, request, jsonify
-from google.cloud import pubsub_v1
+import threading
+from collections import deque
+from flask import Flask, Response, request, jsonify, stream_with_context
+
+# metrics.py and lazy_clients.py live in functions/shared; deploy.sh copies
+# them next to app.py, so the local copies win when present
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+import metrics  # noqa: E402
+from lazy_clients import LazyClient, warm_up, warm_up_from_env  # noqa: E402
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,27 +20,143 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Initialize Pub/Sub publisher client
-try:
-    publisher = pubsub_v1.PublisherClient()
-    # project_id = os.environ.get('PROJECT_ID', os.environ.get('GOOGLE_CLOUD_PROJECT'))
-    project_id = "vital-cathode-454012-k0"
-    if not project_id:
-        logger.error("PROJECT_ID or GOOGLE_CLOUD_PROJECT environment variable not set")
-        raise ValueError("PROJECT_ID environment variable is required")
+# 'sync' waits for Pub/Sub to return the message ID; 'async' acknowledges
+# immediately with a client-generated ID and publishes in the background
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'sync')
+PUBLISH_TIMEOUT = float(os.environ.get('PUBLISH_TIMEOUT', 30))
+
+# Backpressure: requests wait this long for a publish slot before getting a 503
+MAX_OUTSTANDING_PUBLISHES = int(os.environ.get('MAX_OUTSTANDING_PUBLISHES', 1000))
+BACKPRESSURE_TIMEOUT = float(os.environ.get('BACKPRESSURE_TIMEOUT', 5))
+publish_slots = threading.BoundedSemaphore(MAX_OUTSTANDING_PUBLISHES)
+
+# /batch limits: longest accepted NDJSON line, and how many lines may be
+# awaiting their publish result before the oldest is reported
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl')
+MAX_LINE_BYTES = int(os.environ.get('BATCH_MAX_LINE_BYTES', 64 * 1024))
+BATCH_RESULT_WINDOW = int(os.environ.get('BATCH_RESULT_WINDOW', 500))
+
+PUBLISH_SECONDS = metrics.histogram('receiver_publish_seconds', 'Time from publish() to the Pub/Sub result',
+                                    labels=('outcome',))
+FEEDBACK = metrics.counter('receiver_feedback_total', 'Feedback messages by outcome', labels=('outcome',))
+
+def make_publisher():
+    """Pub/Sub publisher that packs concurrent requests into batched Publish RPCs
+    
+    google.cloud.pubsub_v1 is imported here rather than at module level: it
+    is the slowest part of starting an instance.
+    """
+    from google.cloud import pubsub_v1
+    
+    batch_settings = pubsub_v1.types.BatchSettings(
+        max_messages=int(os.environ.get('PUBSUB_BATCH_MAX_MESSAGES', 100)),
+        max_bytes=int(os.environ.get('PUBSUB_BATCH_MAX_BYTES', 1024 * 1024)),
+        max_latency=float(os.environ.get('PUBSUB_BATCH_MAX_LATENCY', 0.01)),
+    )
+    publisher_options = pubsub_v1.types.PublisherOptions(
+        flow_control=pubsub_v1.types.PublishFlowControl(
+            message_limit=MAX_OUTSTANDING_PUBLISHES,
+            byte_limit=int(os.environ.get('PUBSUB_FLOW_CONTROL_MAX_BYTES', 64 * 1024 * 1024)),
+            limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
+        )
+    )
+    return pubsub_v1.PublisherClient(batch_settings, publisher_options=publisher_options)
+
+# The publisher is built by the first request that publishes (or /warmup)
+publisher = LazyClient('pubsub_publisher', make_publisher)
+# project_id = os.environ.get('PROJECT_ID', os.environ.get('GOOGLE_CLOUD_PROJECT'))
+project_id = "vital-cathode-454012-k0"
+topic_name = os.environ.get('PUBSUB_TOPIC', 'feedback-topic')
+topic_path = f"projects/{project_id}/topics/{topic_name}"
+logger.info(f"Publishing to Pub/Sub topic: {topic_path}")
+warm_up_from_env(publisher)
+
+class PublishBackpressure(Exception):
+    """Raised when too many publishes are outstanding to accept another"""
+
+def _release_publish_slot(future, started):
+    publish_slots.release()
+    error = future.exception()
+    PUBLISH_SECONDS.observe(time.perf_counter() - started, outcome='error' if error else 'published')
+    if error:
+        logger.error(f"Error publishing to Pub/Sub: {error}")
+
+def publish_feedback(message_data):
+    """Start publishing a feedback message without waiting for Pub/Sub
     
-    topic_name = os.environ.get('PUBSUB_TOPIC', 'feedback-topic')
-    topic_path = publisher.topic_path(project_id, topic_name)
-    logger.info(f"Initialized Pub/Sub client with topic: {topic_path}")
-except Exception as e:
-    logger.error(f"Error initializing Pub/Sub client: {e}")
-    # Continue execution, will handle errors in the endpoint
+    Returns (client_id, future). The client-generated ID travels as the
+    `client_id` message attribute so asynchronously acknowledged feedback can
+    be traced downstream. Raises PublishBackpressure when
+    MAX_OUTSTANDING_PUBLISHES publishes are still in flight.
+    """
+    if not publish_slots.acquire(timeout=BACKPRESSURE_TIMEOUT):
+        FEEDBACK.inc(outcome='backpressure')
+        raise PublishBackpressure(f"More than {MAX_OUTSTANDING_PUBLISHES} publishes outstanding")
+    client_id = str(uuid.uuid4())
+    started = time.perf_counter()
+    try:
+        future = publisher.publish(
+            topic_path,
+            json.dumps(message_data).encode('utf-8'),
+            client_id=client_id
+        )
+    except Exception:
+        publish_slots.release()
+        FEEDBACK.inc(outcome='failed')
+        raise
+    FEEDBACK.inc(outcome='accepted')
+    future.add_done_callback(lambda done: _release_publish_slot(done, started))
+    return client_id, future
+
+def feedback_from_json(data):
+    """Pub/Sub message data for a decoded feedback body, or None when fields are missing"""
+    if 'user_id' not in data or 'message' not in data:
+        FEEDBACK.inc(outcome='invalid')
+        return None
+    return {
+        "user_id": data['user_id'],
+        "message": data['message']
+    }
+
+def accepted_body(client_id):
+    """Response body for feedback acknowledged before Pub/Sub confirms it (PUBLISH_MODE=async)"""
+    return {
+        "status": "accepted",
+        "message": f"Feedback accepted for publishing with client ID: {client_id}",
+        "client_id": client_id
+    }
+
+def published_body(message_id):
+    """Response body once Pub/Sub has returned the message ID"""
+    return {
+        "status": "success",
+        "message": f"Feedback received and published to Pub/Sub with ID: {message_id}"
+    }
+
+INVALID_CONTENT_TYPE = {"error": "Content-Type must be application/json"}
+MISSING_FIELDS = {"error": "JSON must contain user_id and message fields"}
+BACKPRESSURE = {"error": "Too many pending messages, retry later"}
+INTERNAL_ERROR = {"error": "Internal server error"}
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/warmup', methods=['GET'])
+def warmup():
+    """Build the Pub/Sub client now instead of on the first feedback request"""
+    try:
+        return jsonify({"status": "warm", "init_ms": warm_up(publisher)}), 200
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
 @app.route('/', methods=['POST'])
 def receive_feedback():
     try:
@@ -41,39 +167,134 @@ def receive_feedback():
             logger.info(f"Received feedback request: {data}")
         else:
             logger.warning(f"Invalid content type: {content_type}")
-            return jsonify({"error": "Content-Type must be application/json"}), 415
+            return jsonify(INVALID_CONTENT_TYPE), 415
         
-        # Validate input
-        if 'user_id' not in data or 'message' not in data:
+        # Validate input and prepare the message for Pub/Sub
+        message_data = feedback_from_json(data)
+        if message_data is None:
             logger.warning("Missing required fields in request")
-            return jsonify({"error": "JSON must contain user_id and message fields"}), 400
-        
-        # Prepare message for Pub/Sub
-        message_data = {
-            "user_id": data['user_id'],
-            "message": data['message']
-        }
+            return jsonify(MISSING_FIELDS), 400
         
         # Publish to Pub/Sub
         try:
-            future = publisher.publish(
-                topic_path, 
-                json.dumps(message_data).encode('utf-8')
-            )
-            message_id = future.result()
+            client_id, future = publish_feedback(message_data)
+            if PUBLISH_MODE == 'async':
+                return jsonify(accepted_body(client_id)), 202
+            
+            message_id = future.result(timeout=PUBLISH_TIMEOUT)
             logger.info(f"Published message with ID: {message_id}")
             
-            return jsonify({
-                "status": "success",
-                "message": f"Feedback received and published to Pub/Sub with ID: {message_id}"
-            })
+            return jsonify(published_body(message_id))
+        except PublishBackpressure as e:
+            logger.warning(f"Rejecting feedback under backpressure: {e}")
+            return jsonify(BACKPRESSURE), 503, {"Retry-After": "1"}
         except Exception as e:
             logger.error(f"Error publishing to Pub/Sub: {e}")
             return jsonify({"error": f"Failed to publish message: {str(e)}"}), 500
             
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return jsonify(INTERNAL_ERROR), 500
+
+def iter_ndjson_lines(stream, max_line_bytes=MAX_LINE_BYTES):
+    """Yield (line_number, raw_line) from a byte stream without buffering the body
+    
+    Lines longer than `max_line_bytes` are skipped over and yielded as None.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Discard the rest of the oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            yield line_number, None
+            continue
+        yield line_number, line
+
+def parse_feedback_line(line):
+    """Validate one NDJSON line; returns (message_data, error)"""
+    if line is None:
+        return None, f"Line exceeds {MAX_LINE_BYTES} bytes"
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(data, dict) or 'user_id' not in data or 'message' not in data:
+        return None, "JSON must contain user_id and message fields"
+    return {"user_id": data['user_id'], "message": data['message']}, None
+
+def publish_ndjson(stream):
+    """Publish every valid line of an NDJSON stream, yielding one result per line
+    
+    Results come out in line order. At most BATCH_RESULT_WINDOW lines wait on
+    their publish future at once, so memory stays bounded however large the
+    upload is, while the publisher still batches everything in the window.
+    """
+    pending = deque()
+    
+    def resolve(line_number, client_id, future, error):
+        if error is None and PUBLISH_MODE == 'async':
+            return {"line": line_number, "status": "accepted", "client_id": client_id}
+        if error is None:
+            try:
+                message_id = future.result(timeout=PUBLISH_TIMEOUT)
+                return {"line": line_number, "status": "published", "message_id": message_id}
+            except Exception as e:
+                error = f"Failed to publish message: {e}"
+        return {"line": line_number, "status": "error", "error": error}
+    
+    for line_number, line in iter_ndjson_lines(stream):
+        if line is not None and not line.strip():
+            continue
+        message_data, error = parse_feedback_line(line)
+        if error is not None:
+            FEEDBACK.inc(outcome='invalid')
+        client_id = future = None
+        if error is None:
+            try:
+                client_id, future = publish_feedback(message_data)
+            except PublishBackpressure:
+                error = BACKPRESSURE["error"]
+            except Exception as e:
+                error = f"Failed to publish message: {e}"
+        pending.append((line_number, client_id, future, error))
+        while len(pending) >= BATCH_RESULT_WINDOW:
+            yield resolve(*pending.popleft())
+    while pending:
+        yield resolve(*pending.popleft())
+
+@app.route('/batch', methods=['POST'])
+def receive_feedback_batch():
+    """Accept newline-delimited feedback records and publish them in bulk
+    
+    The body is read and published line by line; the response streams back
+    one NDJSON result per non-empty line followed by a summary line. A bad
+    line is reported on its own and does not fail the rest of the batch.
+    """
+    content_type = (request.headers.get('Content-Type') or '').split(';')[0].strip()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        logger.warning(f"Invalid content type for batch: {content_type}")
+        return jsonify({"error": f"Content-Type must be one of: {', '.join(NDJSON_CONTENT_TYPES)}"}), 415
+    
+    def generate():
+        summary = {"lines": 0, "published": 0, "accepted": 0, "failed": 0}
+        try:
+            for result in publish_ndjson(request.stream):
+                summary["lines"] += 1
+                summary["failed" if result["status"] == "error" else result["status"]] += 1
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logger.error(f"Unexpected error in batch: {e}")
+            summary["error"] = "Internal server error"
+        logger.info(f"Batch processed: {summary}")
+        metrics.log_event('batch_processed', **summary)
+        yield json.dumps({"summary": summary}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 8080))
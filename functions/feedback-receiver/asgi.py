@@ -0,0 +1,159 @@
+"""ASGI serving mode for the feedback receiver.
+
+Serves the same `/`, `/health` and `/warmup` routes as app.py, with the same
+validation and responses, on an event loop: a request waiting for Pub/Sub
+holds a suspended coroutine instead of a thread, so one instance can keep
+thousands of requests in flight. Publishing, batching and metrics are
+shared with app.py; NDJSON uploads to /batch stay on the Flask app. The
+client's publish() call, which can block, runs on a small thread pool
+(PUBLISH_THREADS, default 4) instead of the event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# app.py puts functions/shared (metrics.py) on sys.path
+import app as receiver
+import metrics
+from app import (BACKPRESSURE, BACKPRESSURE_TIMEOUT, FEEDBACK, INTERNAL_ERROR, INVALID_CONTENT_TYPE,
+                 MAX_OUTSTANDING_PUBLISHES, MISSING_FIELDS, PUBLISH_TIMEOUT, PublishBackpressure, accepted_body,
+                 feedback_from_json, logger, published_body, warm_up)
+
+# Created on first use: before Python 3.10 an asyncio.Semaphore binds to the
+# event loop that is current when it is created
+_slots = None
+
+# Runs app.publish_feedback, which waits on app.publish_slots and on the
+# client's publish() call; only requests that already hold a slot get here
+PUBLISH_THREADS = int(os.environ.get('PUBLISH_THREADS', 4))
+_publish_executor = ThreadPoolExecutor(max_workers=PUBLISH_THREADS, thread_name_prefix='publish')
+
+
+def _publish_slots():
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_OUTSTANDING_PUBLISHES)
+    return _slots
+
+
+def _settle(slots, publish_future, result):
+    slots.release()
+    if result.cancelled():
+        return
+    error = publish_future.exception()
+    if error is not None:
+        result.set_exception(error)
+    else:
+        result.set_result(publish_future.result())
+
+
+def _discard(result):
+    """Retrieve the outcome of a publish nobody waits for; app.py logs failures"""
+    if not result.cancelled():
+        result.exception()
+
+
+async def publish_feedback(message_data):
+    """Publish without blocking the event loop; returns (client_id, asyncio future of the message ID)
+
+    Waiting for a publish slot and for Pub/Sub's answer both suspend the
+    request instead of holding a thread; the publish call itself runs on the
+    publish thread pool. Raises PublishBackpressure when no slot frees up
+    within BACKPRESSURE_TIMEOUT.
+    """
+    loop = asyncio.get_running_loop()
+    if not getattr(receiver.publisher, 'ready', True):
+        # Importing and building the client takes a few hundred ms; keep the loop serving meanwhile
+        await loop.run_in_executor(None, receiver.publisher.get)
+
+    slots = _publish_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), BACKPRESSURE_TIMEOUT)
+    except asyncio.TimeoutError:
+        FEEDBACK.inc(outcome='backpressure')
+        raise PublishBackpressure(f"More than {MAX_OUTSTANDING_PUBLISHES} publishes outstanding")
+    try:
+        # Every slot held here is also held in app.publish_slots and released
+        # after it, so the thread semaphore only waits on Flask requests served
+        # by the same process; that wait and publish() stay off the loop
+        client_id, publish_future = await loop.run_in_executor(
+            _publish_executor, receiver.publish_feedback, message_data)
+    except BaseException:
+        slots.release()
+        raise
+    result = loop.create_future()
+    publish_future.add_done_callback(lambda done: loop.call_soon_threadsafe(_settle, slots, done, result))
+    return client_id, result
+
+
+async def receive_feedback(request):
+    try:
+        content_type = request.headers.get('Content-Type')
+        if content_type == 'application/json':
+            data = await request.json()
+            logger.info(f"Received feedback request: {data}")
+        else:
+            logger.warning(f"Invalid content type: {content_type}")
+            return JSONResponse(INVALID_CONTENT_TYPE, status_code=415)
+
+        message_data = feedback_from_json(data)
+        if message_data is None:
+            logger.warning("Missing required fields in request")
+            return JSONResponse(MISSING_FIELDS, status_code=400)
+
+        try:
+            client_id, result = await publish_feedback(message_data)
+            if receiver.PUBLISH_MODE == 'async':
+                result.add_done_callback(_discard)
+                return JSONResponse(accepted_body(client_id), status_code=202)
+
+            message_id = await asyncio.wait_for(result, PUBLISH_TIMEOUT)
+            logger.info(f"Published message with ID: {message_id}")
+
+            return JSONResponse(published_body(message_id))
+        except PublishBackpressure as e:
+            logger.warning(f"Rejecting feedback under backpressure: {e}")
+            return JSONResponse(BACKPRESSURE, status_code=503, headers={"Retry-After": "1"})
+        except Exception as e:
+            logger.error(f"Error publishing to Pub/Sub: {e}")
+            return JSONResponse({"error": f"Failed to publish message: {str(e)}"}, status_code=500)
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return JSONResponse(INTERNAL_ERROR, status_code=500)
+
+
+async def health_check(request):
+    return JSONResponse({"status": "healthy"})
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+async def warmup(request):
+    try:
+        init_ms = await asyncio.get_running_loop().run_in_executor(None, warm_up, receiver.publisher)
+        return JSONResponse({"status": "warm", "init_ms": init_ms})
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=500)
+
+
+app = Starlette(routes=[
+    Route('/', receive_feedback, methods=['POST']),
+    Route('/health', health_check, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/warmup', warmup, methods=['GET']),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), backlog=4096)
@@ -0,0 +1,27 @@
+import os
+import logging
+import sys
+
+# Modules shared by the sentiment services live in functions/shared; deploy.sh
+# copies them next to main.py, so the local copy wins when present
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from sentiment_service import SentimentService
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# Every message is analyzed once, then sent to the sinks configured for its
+# sentiment in SENTIMENT_SINKS (JSON); see functions/README.md
+service = SentimentService('sentiment-router')
+app = service.app
+process_pubsub_message = app.view_functions['process_pubsub_message']
+
+# Used by worker.py, the pull-mode entry point, and by tests
+project_id = service.project_id
+router = service.router
+message_dedup = service.message_dedup
+slack_dispatcher = service.slack_dispatcher
+bigquery_buffer = service.bigquery_buffer
+
+if __name__ == "__main__":
+    service.run()
@@ -0,0 +1,47 @@
+"""Pull-mode entry point for the sentiment router.
+
+Instead of one push request per message, this streams messages from a pull
+subscription, groups them into micro-batches and routes each batch on a
+bounded thread pool, acking or nacking every message individually.
+
+    PUBSUB_SUBSCRIPTION=sentiment-pull python worker.py
+"""
+import os
+import logging
+import signal
+import threading
+
+from google.cloud import pubsub_v1
+
+from main import message_dedup, project_id, router
+from pull_worker import BatchWorker, run_subscriber
+from sentiment_router import handle_pulled
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(
+        project_id, os.environ.get('PUBSUB_SUBSCRIPTION', 'sentiment-pull'))
+    worker = BatchWorker(
+        lambda message: handle_pulled(message, router, message_dedup),
+        max_batch_size=int(os.environ.get('PULL_BATCH_SIZE', 100)),
+        max_batch_latency=float(os.environ.get('PULL_BATCH_LATENCY', 0.5)),
+        max_workers=int(os.environ.get('PULL_MAX_WORKERS', 16)),
+    )
+
+    # Cloud Run and Kubernetes send SIGTERM before stopping the container
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    with subscriber:
+        run_subscriber(
+            subscriber, subscription_path, worker,
+            max_messages=int(os.environ.get('PULL_MAX_OUTSTANDING_MESSAGES', 1000)),
+            stop_event=stop,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INSERT_SECONDS = metrics.histogram('bigquery_insert_seconds', 'insert_rows_json latency per batch',
+                                   labels=('outcome',))
+ROWS = metrics.counter('bigquery_buffer_rows_total', 'Buffered BigQuery rows by outcome', labels=('outcome',))
+
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_LATENCY = 1.0
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BACKOFF = 0.5
+# insert_rows_json requests are capped at 10 MB; stay well below it
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+
+
+class BigQueryRowBuffer:
+    """Buffers rows in memory and streams them to BigQuery in batches
+
+    `add` returns as soon as the row is queued. A background worker sends a
+    table's rows with one insert_rows_json call once `max_rows` are waiting
+    or `max_latency` seconds after the oldest was queued, whichever comes
+    first. Row IDs become insert IDs, so BigQuery drops rows repeated by a
+    retry. Failed calls are retried with backoff up to `max_attempts` times;
+    rows BigQuery rejects as invalid are logged and dropped. `close` flushes
+    everything still queued.
+    """
+
+    def __init__(self, client=None, max_rows=DEFAULT_MAX_ROWS, max_latency=DEFAULT_MAX_LATENCY,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, retry_backoff=DEFAULT_RETRY_BACKOFF, clock=time.monotonic,
+                 start=True):
+        self._client = client
+        self.max_rows = max_rows
+        self.max_latency = max_latency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._oldest = {}
+        self._retry_at = 0.0
+        self._closing = False
+        self.stats = {'queued': 0, 'inserted': 0, 'dropped': 0, 'batches': 0, 'retries': 0}
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        if start:
+            self.start()
+
+    @classmethod
+    def from_env(cls, client=None):
+        return cls(
+            client,
+            max_rows=int(os.environ.get('BQ_SINK_BATCH_ROWS', DEFAULT_MAX_ROWS)),
+            max_latency=float(os.environ.get('BQ_SINK_BATCH_LATENCY', DEFAULT_MAX_LATENCY)),
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import bigquery
+            self._client = bigquery.Client()
+        return self._client
+
+    def start(self):
+        self._worker.start()
+
+    def add(self, table, row, row_id=None):
+        """Queue one row for `table`"""
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("BigQuery row buffer is shut down")
+            rows = self._pending.setdefault(table, deque())
+            if not rows:
+                self._oldest[table] = self._clock()
+            rows.append({'row': row, 'row_id': row_id, 'attempts': 0})
+            self.stats['queued'] += 1
+            # Wake the worker to start this batch's timer, or to send it when full
+            if len(rows) == 1 or len(rows) >= self.max_rows:
+                self._cond.notify()
+
+    def pending_count(self):
+        with self._cond:
+            return sum(len(rows) for rows in self._pending.values())
+
+    def _next_due(self, now):
+        """Pick a table whose rows should be sent now, or how long to wait"""
+        if self._retry_at > now:
+            return None, self._retry_at - now
+        earliest = None
+        for table, rows in self._pending.items():
+            if not rows:
+                continue
+            due = self._oldest[table] + self.max_latency
+            if self._closing or len(rows) >= self.max_rows or due <= now:
+                return table, None
+            earliest = due if earliest is None else min(earliest, due)
+        return None, (earliest - now if earliest is not None else None)
+
+    def _take(self, table):
+        rows = self._pending[table]
+        batch = []
+        size = 0
+        while rows and len(batch) < self.max_rows and (not batch or size < MAX_BATCH_BYTES):
+            entry = rows.popleft()
+            size += len(str(entry['row']))
+            batch.append(entry)
+        self._oldest[table] = self._clock()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    table, wait = self._next_due(self._clock())
+                    if table is not None:
+                        batch = self._take(table)
+                        break
+                    if self._closing and not any(self._pending.values()):
+                        return
+                    self._cond.wait(wait)
+            self._send(table, batch)
+
+    def _send(self, table, batch):
+        rows = [entry['row'] for entry in batch]
+        row_ids = [entry['row_id'] for entry in batch]
+        started = time.perf_counter()
+        try:
+            errors = self.client.insert_rows_json(table, rows, row_ids=row_ids if all(row_ids) else None)
+        except Exception as e:
+            INSERT_SECONDS.observe(time.perf_counter() - started, outcome='error')
+            logger.error(f"Error streaming {len(batch)} rows to {table}: {e}")
+            self._retry(table, batch)
+            return
+        INSERT_SECONDS.observe(time.perf_counter() - started, outcome='ok' if not errors else 'row_errors')
+
+        failed = {error['index']: error['errors'] for error in errors or []}
+        # Rows BigQuery skipped only because another row in the request was
+        # invalid come back as 'stopped'; they are fine to send again
+        retry = [entry for index, entry in enumerate(batch)
+                 if index in failed and all(err.get('reason') == 'stopped' for err in failed[index])]
+        invalid = len(failed) - len(retry)
+        if invalid:
+            logger.error(f"BigQuery rejected {invalid} rows for {table}: {list(failed.values())[:3]}")
+        self._finish(len(batch) - len(failed), invalid)
+        if retry:
+            self._retry(table, retry, count_attempt=False)
+
+    def _retry(self, table, batch, count_attempt=True):
+        keep = []
+        for entry in batch:
+            if count_attempt:
+                entry['attempts'] += 1
+            if entry['attempts'] < self.max_attempts:
+                keep.append(entry)
+        with self._cond:
+            self._pending.setdefault(table, deque()).extendleft(reversed(keep))
+            self.stats['retries'] += 1
+            if count_attempt:
+                attempts = max((entry['attempts'] for entry in keep), default=1)
+                self._retry_at = self._clock() + self.retry_backoff * 2 ** (attempts - 1)
+            self._cond.notify()
+        if len(keep) < len(batch):
+            logger.error(f"Giving up on {len(batch) - len(keep)} rows for {table}")
+            self._finish(0, len(batch) - len(keep))
+
+    def _finish(self, inserted, dropped):
+        ROWS.inc(inserted, outcome='inserted')
+        if dropped:
+            ROWS.inc(dropped, outcome='dropped')
+        with self._cond:
+            self.stats['batches'] += 1
+            self.stats['inserted'] += inserted
+            self.stats['dropped'] += dropped
+
+    def close(self, timeout=None):
+        """Flush queued rows (ignoring the batch latency) and stop the worker"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._worker.is_alive():
+            self._worker.join(timeout)
+
+
+def exit_on_sigterm():
+    """Make SIGTERM exit the interpreter normally, so atexit drains still run
+
+    Python's default SIGTERM action kills the process without running atexit
+    handlers. Servers that install their own SIGTERM handler (gunicorn's
+    workers, the pull worker) are left alone; they already exit cleanly.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        return False
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    return True
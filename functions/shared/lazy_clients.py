@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INIT_SECONDS = metrics.histogram('client_init_seconds', 'Time to import and construct a Google API client',
+                                 labels=('client',))
+
+
+class LazyClient:
+    """Builds a client on first use, exactly once, however many threads ask at once
+
+    `factory` should do its own heavy imports (e.g. google.cloud.pubsub_v1),
+    so neither the import nor the construction runs until a request needs
+    the client. Attribute access is forwarded to the client, so a LazyClient
+    can be passed anywhere the client itself is expected.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self.init_seconds = None
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = self._factory()
+                    self.init_seconds = time.perf_counter() - started
+                    INIT_SECONDS.observe(self.init_seconds, client=self.name)
+                    logger.info(f"Initialized {self.name} client in {self.init_seconds * 1000:.0f} ms")
+                client = self._client
+        return client
+
+    @property
+    def ready(self):
+        return self._client is not None
+
+    def __getattr__(self, attribute):
+        # Only reached for attributes LazyClient itself does not have
+        if attribute.startswith('__'):
+            raise AttributeError(attribute)
+        return getattr(self.get(), attribute)
+
+
+def warm_up(*clients):
+    """Build every client that is not built yet; returns {name: init ms} for each"""
+    timings = {}
+    for client in clients:
+        client.get()
+        timings[client.name] = round((client.init_seconds or 0.0) * 1000, 3)
+    return timings
+
+
+def warm_up_from_env(*clients):
+    """Start building clients on a background thread when WARM_CLIENTS is 'background'
+
+    The instance can then answer health checks straight away while the
+    clients load, instead of the first real request paying for them.
+    """
+    if os.environ.get('WARM_CLIENTS', 'lazy').lower() != 'background':
+        return None
+    thread = threading.Thread(target=warm_up, args=clients, name='client-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def make_secret_client():
+    from google.cloud import secretmanager
+    return secretmanager.SecretManagerServiceClient()
+
+
+def make_language_client():
+    from google.cloud import language_v1
+    return language_v1.LanguageServiceClient()
@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Redis is only needed for a redis:// shared store
+    redis = None
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 100000
+# How long a processed message ID is remembered; cover Pub/Sub's redelivery
+# backoff with room to spare
+DEFAULT_TTL = 3600
+# How long a claim blocks redeliveries if its holder dies without finishing
+DEFAULT_LEASE = 300
+
+NEW, IN_FLIGHT, DONE = 'new', 'in_flight', 'done'
+
+CLAIMS = metrics.counter('pubsub_dedup_claims_total', 'Message ID claims by result', labels=('result',))
+
+
+class FileClaimStore:
+    """Shares message claims between processes as one small file per message ID
+
+    Claims are created with O_EXCL, so exactly one process wins each ID.
+    Each claim records its holder's token, and only that holder can release it.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, lease=DEFAULT_LEASE):
+        self.directory = directory
+        self.ttl = ttl
+        self.lease = lease
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, message_id):
+        # Pub/Sub message IDs are numeric, but never let one escape the directory
+        return os.path.join(self.directory, f"{message_id.replace(os.sep, '_')}.claim")
+
+    def _write(self, path, state, lifetime, flags, token=None):
+        fd = os.open(path, flags, 0o644)
+        with os.fdopen(fd, 'w', encoding='utf-8') as claim_file:
+            json.dump({'state': state, 'expires_at': time.time() + lifetime, 'token': token}, claim_file)
+
+    def _read(self, path):
+        with open(path, 'r', encoding='utf-8') as claim_file:
+            return json.load(claim_file)
+
+    def claim(self, message_id, token):
+        path = self._path(message_id)
+        for _ in range(2):
+            try:
+                self._write(path, IN_FLIGHT, self.lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, token)
+                return NEW
+            except FileExistsError:
+                pass
+            try:
+                claim = self._read(path)
+            except (FileNotFoundError, ValueError):
+                # Released, or still being written by its owner
+                continue
+            if claim['expires_at'] > time.time():
+                return DONE if claim['state'] == DONE else IN_FLIGHT
+            # Expired: drop it and race for a fresh claim
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return IN_FLIGHT
+
+    def complete(self, message_id):
+        tmp_path = self._path(message_id) + '.tmp'
+        self._write(tmp_path, DONE, self.ttl, os.O_CREAT | os.O_TRUNC | os.O_WRONLY)
+        os.replace(tmp_path, self._path(message_id))
+
+    def release(self, message_id, token):
+        # Only drop our own claim; after the lease ran out it may belong to someone else
+        path = self._path(message_id)
+        try:
+            claim = self._read(path)
+            if claim['state'] == IN_FLIGHT and claim.get('token') == token:
+                os.remove(path)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def __str__(self):
+        return self.directory
+
+
+class RedisClaimStore:
+    """Shares message claims between processes through Redis (SET NX)
+
+    An unfinished claim is stored as `in_flight:<token>`, so only its holder
+    can release it.
+    """
+
+    def __init__(self, url, ttl=DEFAULT_TTL, lease=DEFAULT_LEASE, prefix='pubsub-dedup:'):
+        if redis is None:
+            raise ValueError("redis is not installed; cannot use a redis:// dedup store")
+        self.url = url
+        self.ttl = ttl
+        self.lease = lease
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def claim(self, message_id, token):
+        key = self.prefix + message_id
+        if self._client.set(key, f"{IN_FLIGHT}:{token}", nx=True, ex=int(self.lease)):
+            return NEW
+        state = self._client.get(key)
+        if state is None:
+            # Released between the two calls; let the redelivery retry
+            return IN_FLIGHT
+        return DONE if state.decode('utf-8') == DONE else IN_FLIGHT
+
+    def complete(self, message_id):
+        self._client.set(self.prefix + message_id, DONE, ex=int(self.ttl))
+
+    def release(self, message_id, token):
+        # Only drop our own claim; after the lease ran out it may belong to someone else
+        key = self.prefix + message_id
+        current = self._client.get(key)
+        if current is not None and current.decode('utf-8') == f"{IN_FLIGHT}:{token}":
+            self._client.delete(key)
+
+    def __str__(self):
+        return self.url
+
+
+def open_store(location, ttl=DEFAULT_TTL, lease=DEFAULT_LEASE):
+    """Build a shared claim store from a redis:// URL or a local directory"""
+    if location.startswith(('redis://', 'rediss://')):
+        return RedisClaimStore(location, ttl, lease)
+    return FileClaimStore(location, ttl, lease)
+
+
+class MessageDeduplicator:
+    """Makes Pub/Sub handlers idempotent on the message ID
+
+    `claim(message_id)` returns (state, token): the state is NEW for the
+    first delivery, IN_FLIGHT while that delivery is still being processed
+    and DONE once `complete` was called. Call `release(message_id, token)`
+    with the token of a NEW claim when processing fails, so a redelivery can
+    retry; a claim that outlived its lease and was taken over is left alone.
+    The last `window` IDs are remembered in-process; a shared `store` extends
+    that across instances. Store keys are prefixed with `namespace`, so
+    services that each receive every message (one subscription apiece) do not
+    skip each other's work. If the store is unreachable the local window
+    still applies.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, ttl=DEFAULT_TTL, lease=DEFAULT_LEASE, store=None, namespace='',
+                 clock=time.monotonic):
+        self.window = window
+        self.ttl = ttl
+        self.lease = lease
+        self.store = store
+        self.namespace = namespace
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counts = {NEW: 0, IN_FLIGHT: 0, DONE: 0}
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.environ.get('MESSAGE_DEDUP_TTL', DEFAULT_TTL))
+        lease = float(os.environ.get('MESSAGE_DEDUP_LEASE', DEFAULT_LEASE))
+        location = os.environ.get('MESSAGE_DEDUP_URL')
+        return cls(
+            window=int(os.environ.get('MESSAGE_DEDUP_WINDOW', DEFAULT_WINDOW)),
+            ttl=ttl,
+            lease=lease,
+            store=open_store(location, ttl, lease) if location else None,
+            # Cloud Run and Cloud Functions set K_SERVICE to the service name
+            namespace=os.environ.get('MESSAGE_DEDUP_NAMESPACE', os.environ.get('K_SERVICE', '')),
+        )
+
+    def _store_key(self, message_id):
+        return f"{self.namespace}.{message_id}" if self.namespace else message_id
+
+    def _remember(self, message_id, state, token=None):
+        lifetime = self.ttl if state == DONE else self.lease
+        self._entries[message_id] = (state, self._clock() + lifetime, token)
+        self._entries.move_to_end(message_id)
+        while len(self._entries) > self.window:
+            self._entries.popitem(last=False)
+
+    def _count(self, result):
+        CLAIMS.inc(result=result)
+        with self._lock:
+            self._counts[result] += 1
+        return result
+
+    def _store_error(self, message):
+        with self._lock:
+            self.errors += 1
+        logger.warning(message)
+
+    def claim(self, message_id):
+        token = uuid.uuid4().hex
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is not None and entry[1] > self._clock():
+                local = entry[0]
+            else:
+                local = None
+                # Hold the ID while the shared store is asked, so concurrent
+                # deliveries to this instance never both go through
+                self._remember(message_id, IN_FLIGHT, token)
+        if local is not None:
+            return self._count(local), None
+        if self.store is None:
+            return self._count(NEW), token
+
+        try:
+            state = self.store.claim(self._store_key(message_id), token)
+        except Exception as e:
+            self._store_error(f"Dedup store {self.store} unavailable, using the local window only: {e}")
+            return self._count(NEW), token
+        if state != NEW:
+            with self._lock:
+                if state == DONE:
+                    self._remember(message_id, DONE)
+                else:
+                    self._entries.pop(message_id, None)
+            return self._count(state), None
+        return self._count(NEW), token
+
+    def complete(self, message_id):
+        """Mark a claimed message processed so later deliveries are skipped"""
+        with self._lock:
+            self._remember(message_id, DONE)
+        if self.store is not None:
+            try:
+                self.store.complete(self._store_key(message_id))
+            except Exception as e:
+                self._store_error(f"Could not record message {message_id} in dedup store {self.store}: {e}")
+
+    def release(self, message_id, token):
+        """Give up the claim `token` after a failure so the next delivery is processed"""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is not None and entry[2] == token:
+                del self._entries[message_id]
+        if self.store is not None:
+            try:
+                self.store.release(self._store_key(message_id), token)
+            except Exception as e:
+                self._store_error(f"Could not release message {message_id} in dedup store {self.store}: {e}")
+
+    def stats(self):
+        with self._lock:
+            claims = sum(self._counts.values())
+            return {
+                'claimed': self._counts[NEW],
+                'duplicates_in_flight': self._counts[IN_FLIGHT],
+                'duplicates_done': self._counts[DONE],
+                'errors': self.errors,
+                'duplicate_rate': (claims - self._counts[NEW]) / claims if claims else 0.0,
+                'entries': len(self._entries),
+                'store': str(self.store) if self.store is not None else None,
+            }
@@ -0,0 +1,202 @@
+"""Lightweight in-process metrics shared by every service.
+
+Counters and histograms live in a registry that renders the Prometheus text
+exposition format for a `/metrics` endpoint. Recording is a dict lookup and
+an add under a per-metric lock, cheap enough to leave on in production;
+set METRICS_ENABLED=false to turn every metric into a no-op.
+`log_event` writes one JSON line to stdout, which Cloud Logging parses into
+a structured entry.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() != 'false'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value if value is not None else "")}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = tuple(map(labels.get, self.labels)) if labels else ()
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(map(labels.get, self.labels)) if labels else (), 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}" for key, value in values]
+
+
+class Histogram:
+    """Distribution of observations (usually seconds) in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = tuple(map(labels.get, self.labels)) if labels else ()
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes how long the `with` block takes"""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        series = self._series.get(tuple(map(labels.get, self.labels)) if labels else ())
+        return series[2] if series else 0
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_number(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: entering a generator-based
+    # context manager costs several times more than the observation itself
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """Named metrics plus callbacks that report point-in-time values as gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._gauges = []
+
+    def _register(self, metric_class, name, documentation, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter, name, documentation, labels=labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labels=labels, buckets=buckets)
+
+    def gauge_callback(self, name, documentation, read):
+        """Report `read()` (a number, or a dict of label value -> number) at scrape time"""
+        with self._lock:
+            self._gauges.append((name, documentation, read))
+
+    def render(self):
+        """The registry in Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for name, documentation, read in gauges:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                value = read()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                # Stats dicts may carry labels such as a backend name; only numbers are reported
+                lines.extend(f'{name}{{key="{_escape(key)}"}} {_format_number(number)}'
+                             for key, number in sorted(value.items())
+                             if isinstance(number, (int, float)) and not isinstance(number, bool))
+            else:
+                lines.append(f"{name} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge_callback = REGISTRY.gauge_callback
+render = REGISTRY.render
+
+
+def log_event(event, severity='INFO', **fields):
+    """Write one structured log line (JSON on stdout)"""
+    if not ENABLED:
+        return
+    print(json.dumps(dict({'severity': severity, 'event': event}, **fields), default=str),
+          file=sys.stdout, flush=True)
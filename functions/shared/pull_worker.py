@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SECONDS = metrics.histogram('pull_batch_seconds', 'Time to process one pulled micro-batch')
+BATCH_SIZE = metrics.histogram('pull_batch_size', 'Messages per pulled micro-batch',
+                               buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+PULLED = metrics.counter('pull_messages_total', 'Pulled messages by outcome', labels=('outcome',))
+
+DEFAULT_MAX_BATCH_SIZE = 100
+DEFAULT_MAX_BATCH_LATENCY = 0.5
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_OUTSTANDING_MESSAGES = 1000
+DEFAULT_MAX_OUTSTANDING_BYTES = 100 * 1024 * 1024
+
+
+class BatchWorker:
+    """Groups pulled messages into micro-batches and processes each concurrently
+
+    Use an instance as the streaming-pull callback. A batch is cut when it
+    holds `max_batch_size` messages or `max_batch_latency` seconds after its
+    first message arrived, then `handle(message)` runs for every message on a
+    pool of `max_workers` threads. Each message is acked when `handle`
+    returns True and nacked when it returns False or raises.
+    """
+
+    def __init__(self, handle, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_batch_latency=DEFAULT_MAX_BATCH_LATENCY,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        self.handle = handle
+        self.max_batch_size = max_batch_size
+        self.max_batch_latency = max_batch_latency
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._cond = threading.Condition()
+        self._batch = []
+        self._batch_started = None
+        self._closed = False
+        self.stats = {'batches': 0, 'acked': 0, 'nacked': 0}
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+
+    def __call__(self, message):
+        with self._cond:
+            if self._closed:
+                message.nack()
+                return
+            if not self._batch:
+                self._batch_started = time.monotonic()
+            self._batch.append(message)
+            if len(self._batch) >= self.max_batch_size:
+                self._cond.notify()
+
+    def _next_batch(self):
+        """Wait until a batch is due; returns None once closed and drained"""
+        with self._cond:
+            while True:
+                if self._batch:
+                    age = time.monotonic() - self._batch_started
+                    if self._closed or len(self._batch) >= self.max_batch_size or age >= self.max_batch_latency:
+                        batch = self._batch[:self.max_batch_size]
+                        self._batch = self._batch[self.max_batch_size:]
+                        self._batch_started = time.monotonic()
+                        return batch
+                    self._cond.wait(self.max_batch_latency - age)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._process(batch)
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        results = [self._pool.submit(self._handle_one, message) for message in batch]
+        acked = sum(future.result() for future in results)
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+        BATCH_SIZE.observe(len(batch))
+        PULLED.inc(acked, outcome='acked')
+        PULLED.inc(len(batch) - acked, outcome='nacked')
+        with self._cond:
+            self.stats['batches'] += 1
+            self.stats['acked'] += acked
+            self.stats['nacked'] += len(batch) - acked
+        logger.debug(f"Processed batch of {len(batch)} messages ({acked} acked)")
+
+    def _handle_one(self, message):
+        try:
+            ok = self.handle(message)
+        except Exception as e:
+            logger.error(f"Error processing message {getattr(message, 'message_id', '')}: {e}")
+            ok = False
+        if ok:
+            message.ack()
+        else:
+            message.nack()
+        return bool(ok)
+
+    def close(self, timeout=None):
+        """Stop taking messages, finish the queued ones and shut the pool down"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._flusher.join(timeout)
+        self._pool.shutdown(wait=True)
+
+
+def run_subscriber(subscriber, subscription_path, worker, max_messages=DEFAULT_MAX_OUTSTANDING_MESSAGES,
+                   max_bytes=DEFAULT_MAX_OUTSTANDING_BYTES, timeout=None, stop_event=None):
+    """Stream-pull `subscription_path` into `worker` until timeout or `stop_event`
+
+    Flow control caps how many unacked messages (and bytes) the client holds,
+    so a backlog never floods the worker. On exit the stream is cancelled and
+    the worker drains what it already received.
+    """
+    from google.cloud import pubsub_v1
+
+    flow_control = pubsub_v1.types.FlowControl(max_messages=max_messages, max_bytes=max_bytes)
+    streaming_pull = subscriber.subscribe(subscription_path, callback=worker, flow_control=flow_control)
+    logger.info(f"Listening on {subscription_path}")
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while not streaming_pull.done():
+            if stop_event is not None and stop_event.is_set():
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                streaming_pull.result(timeout=0.5)
+            except TimeoutError:
+                pass
+    finally:
+        streaming_pull.cancel()
+        try:
+            streaming_pull.result(timeout=30)
+        except Exception:
+            pass
+        worker.close()
+        logger.info(f"Stopped listening on {subscription_path}: {worker.stats}")
+        metrics.log_event('subscriber_stopped', subscription=subscription_path, **worker.stats)
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Redis is only needed for a redis:// shared backend
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 3600
+# How long a claim to score a message holds before others stop waiting and score it themselves
+DEFAULT_CLAIM_TTL = 30
+CLAIM_POLL_INTERVAL = 0.05
+# Expired entries are swept from a FileBackend at most this often (seconds)
+DEFAULT_SWEEP_INTERVAL = 300
+
+
+def normalize_text(text):
+    """Canonical form of a message so trivially different repeats share a key"""
+    text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.split()).casefold()
+
+
+def cache_key(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Bounded, thread-safe in-process cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class FileBackend:
+    """Shares cached scores between processes as one small JSON file per key
+
+    A claim is a `<key>.lock` file created with O_EXCL; one older than
+    `claim_ttl` is treated as abandoned. Expired entries, abandoned claims
+    and stray temp files are swept on write, at most every `sweep_interval`
+    seconds.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, claim_ttl=DEFAULT_CLAIM_TTL,
+                 sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.directory = directory
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix='.json'):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as entry_file:
+                entry = json.load(entry_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry['expires_at'] <= time.time():
+            _remove(self._path(key))
+            return None
+        return entry['value']
+
+    def set(self, key, value):
+        # Write to a temp file first so readers never see a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump({'value': value, 'expires_at': time.time() + self.ttl}, tmp_file)
+        os.replace(tmp_path, self._path(key))
+        if time.time() >= self._next_sweep:
+            self.sweep()
+
+    def claim(self, key):
+        """Take the right to score `key`; returns a token, or None when someone else holds it"""
+        path = self._path(key, '.lock')
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except FileExistsError:
+                try:
+                    if os.path.getmtime(path) + self.claim_ttl > time.time():
+                        return None
+                except FileNotFoundError:
+                    continue  # Released in the meantime
+                _remove(path)  # Abandoned by a caller that died while scoring
+        return None
+
+    def release(self, key, token):
+        _remove(token)
+
+    def sweep(self):
+        """Delete expired entries, abandoned claims and leftover temp files"""
+        now = time.time()
+        self._next_sweep = now + self.sweep_interval
+        for entry in os.scandir(self.directory):
+            try:
+                age = now - entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.json'):
+                expired = age >= self.ttl
+            else:
+                expired = entry.name.endswith(('.lock', '.tmp')) and age >= self.claim_ttl
+            if expired:
+                _remove(entry.path)
+
+    def __str__(self):
+        return self.directory
+
+
+class RedisBackend:
+    """Shares cached scores between processes through Redis"""
+
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix='sentiment:', claim_ttl=DEFAULT_CLAIM_TTL):
+        if redis is None:
+            raise ValueError("redis is not installed; cannot use a redis:// sentiment cache")
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+        self.claim_ttl = claim_ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, json.dumps(value), ex=int(self.ttl))
+
+    def claim(self, key):
+        """Take the right to score `key` (SET NX with a lease); returns a token or None"""
+        token = uuid.uuid4().hex
+        if self._client.set(f"{self.prefix}claim:{key}", token, nx=True, px=int(self.claim_ttl * 1000)):
+            return token
+        return None
+
+    def release(self, key, token):
+        # Only drop our own claim; after the lease ran out it may belong to someone else
+        name = f"{self.prefix}claim:{key}"
+        current = self._client.get(name)
+        if current is not None and current.decode('utf-8') == token:
+            self._client.delete(name)
+
+    def __str__(self):
+        return self.url
+
+
+def open_backend(location, ttl=DEFAULT_TTL):
+    """Build a shared backend from a redis:// URL or a local directory"""
+    if location.startswith(('redis://', 'rediss://')):
+        return RedisBackend(location, ttl)
+    return FileBackend(location, ttl)
+
+
+class SentimentCache:
+    """Memoizes sentiment scores by normalized message text
+
+    Lookups try the in-process LRU first, then the optional shared backend,
+    and only call `compute` when both miss. A shared backend lets separate
+    services (or instances) score each distinct message once: the first
+    caller to miss claims the key on the backend, and callers that miss
+    while it is scoring wait up to the claim's lease for its stored value.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, backend=None):
+        self.local = LRUCache(max_entries, ttl)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.waits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.environ.get('SENTIMENT_CACHE_TTL', DEFAULT_TTL))
+        location = os.environ.get('SENTIMENT_CACHE_URL')
+        return cls(
+            max_entries=int(os.environ.get('SENTIMENT_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+            ttl=ttl,
+            backend=open_backend(location, ttl) if location else None,
+        )
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _backend_call(self, action, *args):
+        """Run a backend method and return (ok, result)
+
+        A broken shared cache must not stop messages being scored, so errors
+        are counted and logged instead of raised.
+        """
+        try:
+            return True, getattr(self.backend, action)(*args)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Sentiment cache backend {self.backend} failed to {action}: {e}")
+            return False, None
+
+    def _claim_or_wait(self, key):
+        """Claim `key`, or wait for the caller holding the claim to store its value
+
+        Returns (value, token): the stored value when another caller scored
+        it, else the claim token to release after scoring (None when the
+        backend cannot coordinate, so the caller just scores).
+        """
+        if not hasattr(self.backend, 'claim'):
+            return None, None
+        ok, token = self._backend_call('claim', key)
+        if not ok or token is not None:
+            return None, token
+        self._count('waits')
+        deadline = time.monotonic() + getattr(self.backend, 'claim_ttl', DEFAULT_CLAIM_TTL)
+        while time.monotonic() < deadline:
+            time.sleep(CLAIM_POLL_INTERVAL)
+            ok, value = self._backend_call('get', key)
+            if not ok or value is not None:
+                return value, None
+            # The claim was released without a value (the scorer failed) or abandoned
+            ok, token = self._backend_call('claim', key)
+            if not ok or token is not None:
+                return None, token
+        return None, None
+
+    def get_or_compute(self, text, compute):
+        """Return the cached value for `text`, calling `compute(text)` on a miss"""
+        key = cache_key(text)
+        value = self.local.get(key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        token = None
+        if self.backend is not None:
+            _, value = self._backend_call('get', key)
+            if value is None:
+                value, token = self._claim_or_wait(key)
+            if value is None and token is not None:
+                # Another caller may have stored the value just before releasing its claim
+                _, value = self._backend_call('get', key)
+                if value is not None:
+                    self._backend_call('release', key, token)
+            if value is not None:
+                self._count('shared_hits')
+                self.local.set(key, value)
+                return value
+
+        self._count('misses')
+        try:
+            value = compute(text)
+            self.local.set(key, value)
+            if self.backend is not None:
+                self._backend_call('set', key, value)
+        finally:
+            if token is not None:
+                self._backend_call('release', key, token)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'waits': self.waits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                'entries': len(self.local),
+                'backend': str(self.backend) if self.backend is not None else None,
+            }
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+
+try:
+    import numpy
+except ImportError:  # NumPy is only needed for the lexicon and hybrid engines
+    numpy = None
+
+import metrics
+from sentiment_lexicon import BOOSTERS, CONTRASTS, LEXICON, NEGATORS
+
+POSITIVE_THRESHOLD = 0.2
+NEGATIVE_THRESHOLD = -0.2
+
+ENGINES = ('api', 'lexicon', 'hybrid')
+# Local scores must clear a threshold by this much to skip the NL API
+DEFAULT_BAND = 0.3
+DEFAULT_MIN_HITS = 1
+
+NEGATION_SCOPE = 3
+NEGATION_FACTOR = -0.5
+CONTRAST_BEFORE, CONTRAST_AFTER = 0.5, 1.5
+EXCLAMATION_BOOST = 0.1
+MAX_EXCLAMATIONS = 4
+# Larger values pull scores of short messages towards 0
+NORMALIZATION_ALPHA = 1.0
+
+TOKEN_PATTERN = re.compile(r"[a-z']+|!")
+
+SCORED = metrics.counter('sentiment_scored_total', 'Messages scored, by who scored them', labels=('scorer',))
+
+
+def categorize(score):
+    """Map a sentiment score to positive, negative or neutral"""
+    if score >= POSITIVE_THRESHOLD:
+        return "positive"
+    elif score <= NEGATIVE_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+
+class LexiconScorer:
+    """Scores messages from word weights, vectorized over a batch with NumPy
+
+    Handles negation ("not good"), boosters ("very slow"), contrasts ("nice
+    but broken") and exclamation marks. Returns scores in [-1, 1] on the same
+    scale as the NL API, plus how many lexicon words each message contained.
+    """
+
+    def __init__(self, lexicon=LEXICON, negators=NEGATORS, boosters=BOOSTERS, contrasts=CONTRASTS):
+        if numpy is None:
+            raise ValueError("numpy is not installed; cannot use the lexicon sentiment scorer")
+        words = sorted(set(lexicon) | set(negators) | set(boosters) | set(contrasts) | {'!'})
+        # Id 0 is every word outside the vocabulary
+        self.vocabulary = {word: index for index, word in enumerate(words, start=1)}
+        size = len(words) + 1
+        self.weights = numpy.zeros(size)
+        self.boosts = numpy.ones(size)
+        self.negators = numpy.zeros(size, dtype=bool)
+        self.contrasts = numpy.zeros(size, dtype=bool)
+        self.exclamations = numpy.zeros(size)
+        for word, index in self.vocabulary.items():
+            self.weights[index] = lexicon.get(word, 0.0)
+            self.boosts[index] = boosters.get(word, 1.0)
+            self.negators[index] = word in negators
+            self.contrasts[index] = word in contrasts
+        self.exclamations[self.vocabulary['!']] = 1.0
+
+    def _token_ids(self, texts):
+        vocabulary = self.vocabulary
+        ids, lengths = [], []
+        for text in texts:
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            ids.extend(vocabulary.get(token, 0) for token in tokens)
+            lengths.append(len(tokens))
+        return numpy.array(ids, dtype=numpy.int64), numpy.array(lengths, dtype=numpy.int64)
+
+    def score_batch(self, texts):
+        """Return (scores, hits) arrays for a sequence of messages"""
+        count = len(texts)
+        ids, lengths = self._token_ids(texts)
+        doc = numpy.repeat(numpy.arange(count), lengths)
+        weights = self.weights[ids]
+
+        # Boosters scale the word right after them, within the same message
+        same_doc = doc[1:] == doc[:-1]
+        boost = numpy.ones_like(weights)
+        boost[1:] = numpy.where(same_doc, self.boosts[ids[:-1]], 1.0)
+        weights = weights * boost
+
+        # A negator flips the next NEGATION_SCOPE words
+        is_negator = self.negators[ids]
+        negated = numpy.zeros(len(ids), dtype=bool)
+        for distance in range(1, NEGATION_SCOPE + 1):
+            negated[distance:] |= is_negator[:-distance] & (doc[distance:] == doc[:-distance])
+        weights = numpy.where(negated, weights * NEGATION_FACTOR, weights)
+
+        # In messages with a contrast, words after it outweigh words before it
+        is_contrast = self.contrasts[ids]
+        seen = numpy.cumsum(is_contrast)
+        starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        seen_before_doc = numpy.concatenate(([0], seen))[starts]
+        after_contrast = (seen - is_contrast - seen_before_doc[doc]) > 0
+        has_contrast = numpy.bincount(doc, is_contrast, minlength=count) > 0
+        weights = weights * numpy.where(has_contrast[doc],
+                                        numpy.where(after_contrast, CONTRAST_AFTER, CONTRAST_BEFORE), 1.0)
+
+        totals = numpy.bincount(doc, weights, minlength=count)
+        hits = numpy.bincount(doc, self.weights[ids] != 0, minlength=count).astype(numpy.int64)
+        exclamations = numpy.minimum(numpy.bincount(doc, self.exclamations[ids], minlength=count), MAX_EXCLAMATIONS)
+        totals = totals + numpy.sign(totals) * exclamations * EXCLAMATION_BOOST
+        scores = totals / numpy.sqrt(totals ** 2 + NORMALIZATION_ALPHA)
+        return scores, hits
+
+    def score(self, text):
+        scores, hits = self.score_batch([text])
+        return float(scores[0]), int(hits[0])
+
+
+class SentimentEngine:
+    """Decides, per message, whether the local scorer or the NL API scores it
+
+    `api` always calls `remote`; `lexicon` never does. `hybrid` keeps local
+    scores that clear a threshold by at least `band` (and contain `min_hits`
+    lexicon words) and escalates everything ambiguous to `remote`.
+    """
+
+    def __init__(self, remote=None, mode='api', band=DEFAULT_BAND, min_hits=DEFAULT_MIN_HITS, scorer=None):
+        if mode not in ENGINES:
+            raise ValueError(f"Unknown sentiment engine '{mode}'. Must be one of: {', '.join(ENGINES)}")
+        if mode != 'lexicon' and remote is None:
+            raise ValueError(f"The {mode} sentiment engine needs an API scorer")
+        self.remote = remote
+        self.mode = mode
+        self.band = band
+        self.min_hits = min_hits
+        self.scorer = scorer or (LexiconScorer() if mode != 'api' else None)
+        self._lock = threading.Lock()
+        self.local_scored = 0
+        self.api_scored = 0
+
+    @classmethod
+    def from_env(cls, remote=None):
+        return cls(
+            remote,
+            mode=os.environ.get('SENTIMENT_ENGINE', 'api'),
+            band=float(os.environ.get('SENTIMENT_LOCAL_BAND', DEFAULT_BAND)),
+            min_hits=int(os.environ.get('SENTIMENT_LOCAL_MIN_HITS', DEFAULT_MIN_HITS)),
+        )
+
+    def is_confident(self, score, hits):
+        return hits >= self.min_hits and (
+            score >= POSITIVE_THRESHOLD + self.band or score <= NEGATIVE_THRESHOLD - self.band)
+
+    def _count(self, local, api):
+        with self._lock:
+            self.local_scored += local
+            self.api_scored += api
+        if local:
+            SCORED.inc(local, scorer='local')
+        if api:
+            SCORED.inc(api, scorer='api')
+
+    def score(self, text):
+        if self.mode == 'api':
+            self._count(0, 1)
+            return self.remote(text)
+        score, hits = self.scorer.score(text)
+        if self.mode == 'lexicon' or self.is_confident(score, hits):
+            self._count(1, 0)
+            return score
+        self._count(0, 1)
+        return self.remote(text)
+
+    def score_batch(self, texts):
+        """Score many messages, running the local scorer over all of them at once"""
+        if self.mode == 'api':
+            return [self.score(text) for text in texts]
+        scores, hits = self.scorer.score_batch(texts)
+        results = []
+        for text, score, hit_count in zip(texts, scores.tolist(), hits.tolist()):
+            if self.mode == 'lexicon' or self.is_confident(score, hit_count):
+                self._count(1, 0)
+                results.append(score)
+            else:
+                self._count(0, 1)
+                results.append(self.remote(text))
+        return results
+
+    def stats(self):
+        with self._lock:
+            scored = self.local_scored + self.api_scored
+            return {
+                'engine': self.mode,
+                'band': self.band,
+                'local_scored': self.local_scored,
+                'api_scored': self.api_scored,
+                'api_calls_avoided': self.local_scored / scored if scored else 0.0,
+            }
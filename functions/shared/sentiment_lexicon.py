@@ -0,0 +1,63 @@
+"""Word weights for the local sentiment scorer.
+
+Weights run from -1 (strongly negative) to 1 (strongly positive) and are
+tuned for short product and support feedback rather than general text.
+"""
+
+POSITIVE = {
+    'amazing': 0.9, 'awesome': 0.9, 'excellent': 0.9, 'fantastic': 0.9, 'outstanding': 0.9,
+    'perfect': 0.9, 'superb': 0.9, 'wonderful': 0.9, 'brilliant': 0.85, 'incredible': 0.85,
+    'love': 0.85, 'loved': 0.85, 'loving': 0.8, 'loves': 0.85, 'best': 0.8, 'delighted': 0.85,
+    'thrilled': 0.85, 'impressed': 0.75, 'impressive': 0.75, 'great': 0.75, 'beautiful': 0.7,
+    'happy': 0.7, 'glad': 0.6, 'pleased': 0.65, 'enjoy': 0.6, 'enjoyed': 0.6, 'enjoying': 0.6,
+    'recommend': 0.6, 'recommended': 0.6, 'thanks': 0.45, 'thank': 0.45, 'grateful': 0.65,
+    'appreciate': 0.55, 'appreciated': 0.55, 'helpful': 0.6, 'friendly': 0.55, 'fast': 0.45,
+    'quick': 0.4, 'quickly': 0.35, 'easy': 0.5, 'smooth': 0.5, 'seamless': 0.6, 'reliable': 0.55,
+    'good': 0.5, 'nice': 0.5, 'solid': 0.4, 'fine': 0.2, 'ok': 0.1, 'okay': 0.1, 'decent': 0.3,
+    'useful': 0.45, 'intuitive': 0.5, 'clean': 0.35, 'works': 0.3, 'working': 0.2, 'fixed': 0.35,
+    'resolved': 0.4, 'improved': 0.45, 'improvement': 0.35, 'better': 0.4, 'favorite': 0.7,
+    'favourite': 0.7, 'worth': 0.4, 'satisfied': 0.6, 'lovely': 0.7, 'exceptional': 0.85,
+    'flawless': 0.85, 'stellar': 0.8, 'top': 0.3, 'wow': 0.6, 'cool': 0.4, 'fun': 0.5,
+    'polite': 0.45, 'responsive': 0.45, 'convenient': 0.45, 'affordable': 0.35, 'bargain': 0.4,
+    'kudos': 0.6, 'bravo': 0.6, 'yay': 0.6, 'success': 0.5, 'successful': 0.5, 'win': 0.4,
+}
+
+NEGATIVE = {
+    'terrible': -0.9, 'horrible': -0.9, 'awful': -0.9, 'worst': -0.9, 'disgusting': -0.9,
+    'hate': -0.85, 'hated': -0.85, 'hates': -0.85, 'useless': -0.8, 'pathetic': -0.85,
+    'unacceptable': -0.85, 'furious': -0.85, 'scam': -0.85, 'garbage': -0.85, 'trash': -0.8,
+    'disappointed': -0.7, 'disappointing': -0.7, 'disappointment': -0.7, 'frustrated': -0.7,
+    'frustrating': -0.7, 'angry': -0.75, 'annoyed': -0.6, 'annoying': -0.6, 'upset': -0.6,
+    'broken': -0.7, 'broke': -0.6, 'crash': -0.6, 'crashes': -0.65, 'crashed': -0.65,
+    'crashing': -0.65, 'bug': -0.45, 'bugs': -0.5, 'buggy': -0.6, 'error': -0.45, 'errors': -0.5,
+    'fail': -0.6, 'fails': -0.6, 'failed': -0.6, 'failing': -0.6, 'failure': -0.6, 'bad': -0.6,
+    'poor': -0.6, 'slow': -0.5, 'slowly': -0.4, 'laggy': -0.5, 'late': -0.4, 'delayed': -0.45,
+    'never': -0.2, 'missing': -0.4, 'lost': -0.45, 'wrong': -0.5, 'rude': -0.7, 'unhelpful': -0.6,
+    'confusing': -0.5, 'confused': -0.4, 'complicated': -0.35, 'expensive': -0.35,
+    'overpriced': -0.55, 'refund': -0.45, 'cancel': -0.4, 'cancelled': -0.35, 'problem': -0.4,
+    'problems': -0.45, 'issue': -0.3, 'issues': -0.35, 'worse': -0.6, 'unusable': -0.8,
+    'unreliable': -0.6, 'ridiculous': -0.65, 'waste': -0.7, 'wasted': -0.7, 'stuck': -0.45,
+    'freezes': -0.55, 'freezing': -0.5, 'damaged': -0.6, 'defective': -0.7, 'sucks': -0.75,
+    'mess': -0.55, 'nightmare': -0.8, 'sad': -0.5, 'unhappy': -0.65, 'regret': -0.6,
+    'complaint': -0.4, 'timeout': -0.4, 'timing': -0.1, 'down': -0.3, 'outage': -0.6,
+    'spam': -0.5, 'ugh': -0.5, 'meh': -0.3, 'mediocre': -0.4, 'lacking': -0.35,
+}
+
+LEXICON = dict(POSITIVE, **NEGATIVE)
+
+# Flip the sentiment of the next few words ("not good", "never works")
+NEGATORS = {
+    'not', 'no', "don't", 'dont', "doesn't", 'doesnt', "didn't", 'didnt', "isn't", 'isnt',
+    "wasn't", 'wasnt', "aren't", 'arent', "won't", 'wont', "can't", 'cant', 'cannot',
+    'without', 'hardly', 'barely', "couldn't", 'couldnt', "wouldn't", 'wouldnt', 'nothing',
+}
+
+# Strengthen the next word ("very slow", "really great")
+BOOSTERS = {
+    'very': 1.3, 'really': 1.3, 'so': 1.2, 'extremely': 1.5, 'incredibly': 1.5, 'super': 1.3,
+    'absolutely': 1.4, 'totally': 1.3, 'completely': 1.3, 'truly': 1.3, 'highly': 1.3,
+    'quite': 1.1, 'too': 1.2, 'slightly': 0.6, 'somewhat': 0.7, 'bit': 0.7, 'kinda': 0.7,
+}
+
+# Words after a contrast carry the message ("good idea but terrible execution")
+CONTRASTS = {'but', 'however', 'although', 'though', 'yet'}
@@ -0,0 +1,367 @@
+import base64
+import datetime
+import json
+import logging
+import os
+import time
+
+import requests
+
+import metrics
+from message_dedup import DONE, NEW
+from sentiment_engine import SentimentEngine, categorize
+from token_cache import INVALID_TOKEN_ERRORS
+
+logger = logging.getLogger(__name__)
+
+NL_API_SECONDS = metrics.histogram('sentiment_nl_api_seconds', 'Natural Language API analyze_sentiment latency')
+SLACK_POST_SECONDS = metrics.histogram('slack_post_seconds', 'chat.postMessage latency', labels=('outcome',))
+FEEDBACK = metrics.counter('sentiment_feedback_total', 'Routed feedback by sentiment', labels=('sentiment',))
+DELIVERIES = metrics.counter('sentiment_deliveries_total', 'Sink deliveries by sink type and outcome',
+                             labels=('sink', 'outcome'))
+
+SENTIMENTS = ('positive', 'negative', 'neutral')
+
+# How each sentiment is presented in Slack
+SLACK_STYLES = {
+    'positive': {
+        'color': '#36a64f',  # Green
+        'pretext': 'New positive feedback received! :smile:',
+    },
+    'negative': {
+        'color': '#D00000',  # Red
+        'pretext': 'Urgent: Negative feedback received! :warning:',
+        'footer': 'Please follow up with this user promptly',
+    },
+    'neutral': {
+        'color': '#A0A0A0',  # Grey
+        'pretext': 'New feedback received',
+    },
+}
+
+# What the router does with each sentiment when SENTIMENT_SINKS is not set;
+# this matches the two original subscriber services
+DEFAULT_SINKS = {
+    'positive': [{'type': 'slack', 'channel': '#followup'}],
+    'negative': [{'type': 'slack', 'channel': '#support'}],
+}
+
+
+def make_analyzer(language_client, cache=None, engine=None):
+    """Build analyze_sentiment(text) -> (sentiment, score) around an NL API client
+
+    `engine` picks who scores each message (see SentimentEngine); by default
+    it is configured from SENTIMENT_ENGINE and SENTIMENT_LOCAL_BAND.
+    """
+    def score_sentiment(text):
+        # Imported on first use; the library adds noticeably to cold starts
+        from google.cloud import language_v1
+        document = language_v1.Document(
+            content=text, type_=language_v1.Document.Type.PLAIN_TEXT
+        )
+        with NL_API_SECONDS.time():
+            return language_client.analyze_sentiment(
+                request={"document": document}
+            ).document_sentiment.score
+
+    engine = engine or SentimentEngine.from_env(score_sentiment)
+    if engine.remote is None:
+        engine.remote = score_sentiment
+
+    def analyze_sentiment(text):
+        score = cache.get_or_compute(text, engine.score) if cache is not None else engine.score(text)
+        return categorize(score), score
+    analyze_sentiment.engine = engine
+    return analyze_sentiment
+
+
+class LogSink:
+    """Writes routed feedback to the service log"""
+
+    def __init__(self, level='INFO'):
+        self.level = getattr(logging, level.upper())
+
+    def deliver(self, feedback, sentiment, score):
+        logger.log(self.level, f"{sentiment.capitalize()} feedback from {feedback['user_id']} "
+                               f"(score {score:.2f}): {feedback['message']}")
+        return {'ok': True}
+
+    def __str__(self):
+        return 'log'
+
+
+class SlackSink:
+    """Posts routed feedback to a Slack channel"""
+
+    def __init__(self, channel, token_cache, style=None, post=requests.post, dispatcher=None):
+        self.channel = channel
+        self.token_cache = token_cache
+        self.style = style
+        self.post = post
+        self.dispatcher = dispatcher
+
+    def attachment(self, feedback, sentiment, score):
+        style = SLACK_STYLES[self.style or sentiment]
+        attachment = {
+            "color": style['color'],
+            "pretext": style['pretext'],
+            "author_name": f"User: {feedback['user_id']}",
+            "title": f"Sentiment Score: {score:.2f}",
+            "text": feedback['message'],
+        }
+        if 'footer' in style:
+            attachment['footer'] = style['footer']
+        return attachment
+
+    def payload(self, feedback, sentiment, score):
+        return {"channel": self.channel, "attachments": [self.attachment(feedback, sentiment, score)]}
+
+    def deliver(self, feedback, sentiment, score):
+        if self.dispatcher is not None:
+            # Posted (and coalesced into digests) by the dispatcher's worker
+            alert_id = self.dispatcher.enqueue(self.channel, self.attachment(feedback, sentiment, score))
+            return {'ok': True, 'queued': alert_id}
+        payload = self.payload(feedback, sentiment, score)
+        token = self.token_cache.get()
+        # Refetch the token once if Slack rejects it
+        for attempt in range(2):
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+            started = time.perf_counter()
+            response = self.post(
+                "https://slack.com/api/chat.postMessage",
+                headers=headers,
+                json=payload
+            )
+            result = response.json()
+            SLACK_POST_SECONDS.observe(time.perf_counter() - started, outcome='ok' if result.get('ok') else 'error')
+            if result.get('error') not in INVALID_TOKEN_ERRORS or attempt:
+                return result
+            logger.warning(f"Slack rejected the cached token ({result['error']}), refreshing")
+            self.token_cache.invalidate(token)
+            token = self.token_cache.get()
+
+    def __str__(self):
+        return f"slack:{self.channel}"
+
+
+class BigQuerySink:
+    """Streams routed feedback into a BigQuery table
+
+    With a BigQueryRowBuffer rows are queued and inserted in batches by its
+    worker; otherwise every message is its own insert_rows_json call.
+    """
+
+    def __init__(self, table, client=None, row_buffer=None):
+        self.table = table
+        self._client = client
+        self.row_buffer = row_buffer
+
+    def row(self, feedback, sentiment, score):
+        return {
+            'user_id': feedback['user_id'],
+            'message': feedback['message'],
+            'sentiment': sentiment,
+            'score': score,
+            'message_id': feedback.get('message_id'),
+            'received_at': datetime.datetime.utcnow().isoformat(),
+        }
+
+    def deliver(self, feedback, sentiment, score):
+        row = self.row(feedback, sentiment, score)
+        if self.row_buffer is not None:
+            self.row_buffer.add(self.table, row, row_id=row['message_id'])
+            return {'ok': True, 'queued': True}
+        if self._client is None:
+            from google.cloud import bigquery
+            self._client = bigquery.Client()
+        errors = self._client.insert_rows_json(self.table, [row])
+        if errors:
+            return {'ok': False, 'error': str(errors)}
+        return {'ok': True}
+
+    def __str__(self):
+        return f"bigquery:{self.table}"
+
+
+def build_sinks(config, token_cache=None, bigquery_client=None, dispatcher=None, row_buffer=None):
+    """Turn {sentiment: [sink spec, ...]} into {sentiment: [sink, ...]}
+
+    A sink spec is a dict with a `type` of `slack` (`channel`, optional
+    `style`), `bigquery` (`table`) or `log` (optional `level`). Slack sinks
+    queue alerts on `dispatcher` when one is given instead of posting inline,
+    and BigQuery sinks batch their rows through `row_buffer`.
+    """
+    sinks = {}
+    for sentiment, specs in config.items():
+        if sentiment not in SENTIMENTS:
+            raise ValueError(f"Unknown sentiment '{sentiment}'. Must be one of: {', '.join(SENTIMENTS)}")
+        sinks[sentiment] = []
+        for spec in specs:
+            sink_type = spec.get('type')
+            if sink_type == 'slack':
+                if token_cache is None:
+                    raise ValueError("Slack sinks need a Slack token")
+                sinks[sentiment].append(SlackSink(spec['channel'], token_cache, style=spec.get('style'),
+                                                    dispatcher=dispatcher))
+            elif sink_type == 'bigquery':
+                sinks[sentiment].append(BigQuerySink(spec['table'], bigquery_client, row_buffer))
+            elif sink_type == 'log':
+                sinks[sentiment].append(LogSink(spec.get('level', 'INFO')))
+            else:
+                raise ValueError(f"Unknown sink type '{sink_type}'. Must be one of: slack, bigquery, log")
+    return sinks
+
+
+def sinks_config_from_env(default=DEFAULT_SINKS, record_feedback=True):
+    """Read the sink layout from the SENTIMENT_SINKS JSON environment variable
+
+    FEEDBACK_TABLE adds a BigQuery sink for every sentiment, so each analyzed
+    message is recorded with its score (unless `record_feedback` is False).
+    """
+    raw = os.environ.get('SENTIMENT_SINKS')
+    config = json.loads(raw) if raw else default
+    table = os.environ.get('FEEDBACK_TABLE')
+    if table and record_feedback:
+        config = {sentiment: list(config.get(sentiment, [])) + [{'type': 'bigquery', 'table': table}]
+                  for sentiment in SENTIMENTS}
+    return config
+
+
+class SentimentRouter:
+    """Analyzes each feedback message once and hands it to that sentiment's sinks
+
+    A failing sink is logged and reported but does not stop the others.
+    """
+
+    def __init__(self, analyze_sentiment, sinks):
+        self.analyze_sentiment = analyze_sentiment
+        self.sinks = sinks
+
+    def route(self, feedback):
+        sentiment, score = self.analyze_sentiment(feedback['message'])
+        FEEDBACK.inc(sentiment=sentiment)
+        logger.info(f"Feedback analyzed - User: {feedback['user_id']}, Sentiment: {sentiment}, Score: {score}")
+
+        deliveries = []
+        for sink in self.sinks.get(sentiment, []):
+            try:
+                result = sink.deliver(feedback, sentiment, score)
+                if result and not result.get('ok'):
+                    logger.warning(f"{sink} rejected {sentiment} feedback: {result.get('error')}")
+                else:
+                    logger.info(f"Delivered {sentiment} feedback to {sink}")
+            except Exception as e:
+                logger.error(f"Error delivering {sentiment} feedback to {sink}: {e}")
+                result = {'ok': False, 'error': str(e)}
+            ok = bool(result and result.get('ok'))
+            DELIVERIES.inc(sink=str(sink).split(':', 1)[0], outcome='ok' if ok else 'failed')
+            deliveries.append({'sink': str(sink), 'ok': ok})
+        return {'sentiment': sentiment, 'score': score, 'deliveries': deliveries}
+
+
+class InvalidFeedback(ValueError):
+    """A message that can never be processed, however often it is retried"""
+
+
+def decode_feedback(data):
+    """Parse a Pub/Sub message payload (bytes) into a feedback dict"""
+    feedback = json.loads(data.decode('utf-8'))
+    if not isinstance(feedback, dict) or 'message' not in feedback or 'user_id' not in feedback:
+        raise InvalidFeedback("Missing required fields in feedback")
+    return feedback
+
+
+def handle_pulled(message, router, dedup=None):
+    """Process a pulled Pub/Sub message; returns True to ack, False to nack
+
+    Malformed messages are acked so they are dropped instead of redelivered
+    forever; failures that may be transient (e.g. the NL API) raise so the
+    message is nacked and retried. With a MessageDeduplicator, redeliveries
+    of a processed message are acked without being routed again, and those
+    of a message still in flight are nacked so they come back later.
+    """
+    message_id = getattr(message, 'message_id', '')
+    if dedup is not None and message_id:
+        state, token = dedup.claim(message_id)
+        if state != NEW:
+            logger.info(f"Skipping redelivered message {message_id} ({state})")
+            return state == DONE
+    try:
+        feedback = decode_feedback(message.data)
+    except (InvalidFeedback, UnicodeDecodeError, json.JSONDecodeError) as e:
+        logger.error(f"Dropping malformed message {message_id}: {e}")
+        if dedup is not None and message_id:
+            dedup.complete(message_id)
+        return True
+    if message_id:
+        feedback['message_id'] = message_id
+    try:
+        router.route(feedback)
+    except BaseException:
+        if dedup is not None and message_id:
+            dedup.release(message_id, token)
+        raise
+    if dedup is not None and message_id:
+        dedup.complete(message_id)
+    return True
+
+
+def handle_push(envelope, router, dedup=None):
+    """Process a Pub/Sub push envelope; returns (body, status) for Flask
+
+    With a MessageDeduplicator, a redelivery of a processed message is
+    acknowledged without being analyzed or alerted on again. A redelivery of
+    a message that is still being processed gets a 429, so Pub/Sub backs off
+    and retries it, and it is only acknowledged once the original finishes.
+    """
+    # Extract Pub/Sub message
+    if not envelope or 'message' not in envelope:
+        logger.error("No Pub/Sub message received")
+        return 'No Pub/Sub message received', 400
+
+    # Decode the message data
+    pubsub_message = envelope['message']
+    logger.info(f"Received Pub/Sub message: {pubsub_message}")
+
+    if not pubsub_message.get('data'):
+        logger.error("No data in message")
+        return 'No data in message', 400
+
+    message_id = pubsub_message.get('messageId') or pubsub_message.get('message_id')
+    if dedup is not None and message_id:
+        state, token = dedup.claim(message_id)
+        if state == DONE:
+            logger.info(f"Skipping redelivered message {message_id}: already processed")
+            return 'Message already processed', 200
+        if state != NEW:
+            logger.info(f"Deferring redelivered message {message_id}: still being processed")
+            return 'Message is already being processed', 429
+
+    processed = False
+    try:
+        # Decode, parse and validate the message
+        feedback = decode_feedback(base64.b64decode(pubsub_message['data']))
+        if message_id:
+            feedback['message_id'] = message_id
+        router.route(feedback)
+        processed = True
+        return 'Message processed successfully', 200
+
+    except InvalidFeedback as invalid:
+        logger.error("Missing required fields in message")
+        return str(invalid), 400
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Invalid JSON in message: {json_err}")
+        return f'Error: Invalid JSON format: {str(json_err)}', 400
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        return f'Error: {str(e)}', 500
+    finally:
+        if dedup is not None and message_id:
+            if processed:
+                dedup.complete(message_id)
+            else:
+                dedup.release(message_id, token)
@@ -0,0 +1,137 @@
+import atexit
+import logging
+import os
+
+from flask import Flask, Response, jsonify, request
+
+import metrics
+from bigquery_buffer import BigQueryRowBuffer, exit_on_sigterm
+from lazy_clients import LazyClient, make_language_client, make_secret_client, warm_up, warm_up_from_env
+from message_dedup import MessageDeduplicator
+from sentiment_cache import SentimentCache
+from sentiment_router import DEFAULT_SINKS, SentimentRouter, build_sinks, handle_push, make_analyzer, \
+    sinks_config_from_env
+from slack_dispatcher import SlackDispatcher
+from token_cache import TokenCache, secret_fetcher
+
+logger = logging.getLogger(__name__)
+
+
+class SentimentService:
+    """A Pub/Sub push service that analyzes feedback and routes it by sentiment
+
+    sentiment-router and the positive/negative compatibility shims are all
+    built here and differ only in `default_sinks`, the sink layout used when
+    SENTIMENT_SINKS is not set. Everything else (lazy Google clients, the
+    sentiment cache, the Slack token and optional dispatcher, the BigQuery row
+    buffer, message dedup, metrics) is configured from the environment the same
+    way for each. `app` serves POST / (Pub/Sub push), GET /cache/stats,
+    GET /metrics and GET /warmup.
+
+    With `record_feedback` False, FEEDBACK_TABLE is ignored, with a warning.
+    """
+
+    def __init__(self, name, default_sinks=DEFAULT_SINKS, record_feedback=True):
+        self.name = name
+
+        # Google clients (and their libraries) are loaded on first use, so a new
+        # instance starts serving sooner; GET /warmup or WARM_CLIENTS=background
+        # loads them ahead of the first message
+        self.secret_client = LazyClient('secret_manager', make_secret_client)
+        self.language_client = LazyClient('language', make_language_client)
+        self.project_id = os.environ.get('PROJECT_ID', os.environ.get('GOOGLE_CLOUD_PROJECT'))
+
+        # Scores by normalized message text; set SENTIMENT_CACHE_URL to share them
+        # with the other sentiment services
+        self.sentiment_cache = SentimentCache.from_env()
+        # Read the Slack token once per TTL instead of on every alert
+        self.slack_token = TokenCache(
+            secret_fetcher(self.secret_client, self.project_id, 'SLACK_TOKEN'),
+            ttl=float(os.environ.get('SLACK_TOKEN_TTL', 300)),
+        )
+        warm_up_from_env(self.secret_client, self.language_client)
+
+        # With SLACK_ASYNC=true alerts are queued and posted (coalesced into digests
+        # during bursts) by a background worker, so handlers return as soon as an alert
+        # is queued. Off by default: the message is acked before the post, so set
+        # SLACK_ALERT_JOURNAL too or alerts queued in memory are lost with the instance
+        self.slack_dispatcher = None
+        if os.environ.get('SLACK_ASYNC', 'false').lower() == 'true':
+            self.slack_dispatcher = SlackDispatcher.from_env(self.slack_token)
+            atexit.register(self.slack_dispatcher.close, timeout=float(os.environ.get('SLACK_DRAIN_TIMEOUT', 10)))
+
+        if not record_feedback and os.environ.get('FEEDBACK_TABLE'):
+            logger.warning(f"FEEDBACK_TABLE is set but {name} does not record feedback; nothing is written to it "
+                           f"unless sentiment-router or positive-sentiment also runs with FEEDBACK_TABLE")
+        config = sinks_config_from_env(default_sinks, record_feedback=record_feedback)
+
+        # BigQuery sink rows are queued and streamed in batches by a background
+        # worker instead of one insert per message
+        self.bigquery_buffer = None
+        uses_bigquery = any(spec.get('type') == 'bigquery' for specs in config.values() for spec in specs)
+        if uses_bigquery and os.environ.get('BQ_SINK_BUFFERED', 'true').lower() == 'true':
+            self.bigquery_buffer = BigQueryRowBuffer.from_env()
+            atexit.register(self.bigquery_buffer.close, timeout=float(os.environ.get('BQ_SINK_DRAIN_TIMEOUT', 10)))
+
+        # Run the atexit drains above when the platform stops the instance
+        exit_on_sigterm()
+
+        # Every message is analyzed once, then sent to the sinks configured for its sentiment
+        self.router = SentimentRouter(
+            make_analyzer(self.language_client, self.sentiment_cache),
+            build_sinks(config, token_cache=self.slack_token, dispatcher=self.slack_dispatcher,
+                        row_buffer=self.bigquery_buffer),
+        )
+
+        # Pub/Sub redelivers messages whose handling outlives the ack deadline; skip
+        # those instead of analyzing and alerting twice. MESSAGE_DEDUP_URL shares the
+        # processed IDs between instances
+        self.message_dedup = MessageDeduplicator.from_env()
+
+        metrics.gauge_callback('sentiment_cache_stats', 'Sentiment cache counters', self.sentiment_cache.stats)
+        metrics.gauge_callback('pubsub_dedup_stats', 'Pub/Sub message dedup counters', self.message_dedup.stats)
+        if self.slack_dispatcher is not None:
+            metrics.gauge_callback('slack_dispatcher_stats', 'Slack dispatcher counters',
+                                   self.slack_dispatcher.stats.copy)
+            metrics.gauge_callback('slack_dispatcher_pending', 'Alerts queued for Slack',
+                                   self.slack_dispatcher.pending_count)
+        if self.bigquery_buffer is not None:
+            metrics.gauge_callback('bigquery_buffer_pending', 'Rows queued for BigQuery',
+                                   self.bigquery_buffer.pending_count)
+
+        self.app = self._make_app()
+
+    def _make_app(self):
+        app = Flask(self.name)
+
+        @app.route('/', methods=['POST'])
+        def process_pubsub_message():
+            """Analyze a Pub/Sub message once and route it by sentiment."""
+            return handle_push(request.get_json(), self.router, self.message_dedup)
+
+        @app.route('/cache/stats', methods=['GET'])
+        def cache_stats():
+            """Report sentiment cache hit/miss counters."""
+            return jsonify(self.sentiment_cache.stats()), 200
+
+        @app.route('/metrics', methods=['GET'])
+        def metrics_endpoint():
+            """Prometheus metrics."""
+            return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+        @app.route('/warmup', methods=['GET'])
+        def warmup():
+            """Load the Google clients and the Slack token before the first message."""
+            try:
+                init_ms = warm_up(self.secret_client, self.language_client)
+                self.slack_token.get()
+                return jsonify({"status": "warm", "init_ms": init_ms}), 200
+            except Exception as e:
+                logger.error(f"Warm-up failed: {e}")
+                return jsonify({"status": "error", "error": str(e)}), 500
+
+        return app
+
+    def run(self):
+        """Serve `app` with Flask's development server on $PORT (default 8080)"""
+        self.app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
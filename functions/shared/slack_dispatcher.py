@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from token_cache import INVALID_TOKEN_ERRORS
+
+logger = logging.getLogger(__name__)
+
+SLACK_POST_SECONDS = metrics.histogram('slack_post_seconds', 'chat.postMessage latency', labels=('outcome',))
+
+SLACK_POST_URL = "https://slack.com/api/chat.postMessage"
+DEFAULT_DIGEST_WINDOW = 5.0
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_TIMEOUT = 10
+# Slack renders at most 100 attachments; keep digests readable
+MAX_DIGEST_ATTACHMENTS = 20
+
+
+def make_session(pool_size=4):
+    """Keep-alive session for Slack API calls"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    return session
+
+
+class AlertJournal:
+    """Append-only JSON-lines file of queued and delivered alerts
+
+    Every alert is fsynced before enqueue returns, so alerts accepted by a
+    request survive a crash or restart and are replayed on the next start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def pending(self):
+        """Alerts written but not yet marked done, in the order they were queued"""
+        alerts = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        continue
+                    if 'done' in record:
+                        alerts.pop(record['done'], None)
+                    else:
+                        alerts[record['id']] = record['alert']
+        except FileNotFoundError:
+            pass
+        return list(alerts.items())
+
+    def _write(self, records):
+        with open(self.path, 'a', encoding='utf-8') as journal_file:
+            for record in records:
+                journal_file.write(json.dumps(record) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def append(self, alert_id, alert):
+        self._write([{'id': alert_id, 'alert': alert}])
+
+    def mark_done(self, alert_ids):
+        self._write([{'done': alert_id} for alert_id in alert_ids])
+
+    def compact(self):
+        """Drop the history once nothing is pending"""
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+
+
+class SlackDispatcher:
+    """Posts Slack alerts from a background thread
+
+    `enqueue` returns once the alert is queued (and journaled, when a journal
+    is configured). The worker posts over one pooled session. The first alert
+    for a channel goes out immediately; alerts arriving within
+    `digest_window` seconds of the last post to that channel are coalesced
+    into a single digest message. A 429 pauses all posting for its
+    Retry-After, and a rejected token is refetched before retrying.
+    """
+
+    def __init__(self, token_cache, session=None, digest_window=DEFAULT_DIGEST_WINDOW, journal=None,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=DEFAULT_TIMEOUT, clock=time.monotonic, start=True):
+        self.token_cache = token_cache
+        self.session = session or make_session()
+        self.digest_window = digest_window
+        self.journal = journal
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._last_post = {}
+        self._blocked_until = 0.0
+        self._closing = False
+        self.stats = {'queued': 0, 'delivered': 0, 'dropped': 0, 'posts': 0, 'digests': 0, 'rate_limited': 0}
+        if journal is not None:
+            for alert_id, alert in journal.pending():
+                self._queue(alert_id, alert)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        if start:
+            self.start()
+
+    @classmethod
+    def from_env(cls, token_cache):
+        journal_path = os.environ.get('SLACK_ALERT_JOURNAL')
+        if not journal_path:
+            logger.warning("SLACK_ALERT_JOURNAL is not set; queued Slack alerts are lost if the instance stops "
+                           "before posting them")
+        return cls(
+            token_cache,
+            digest_window=float(os.environ.get('SLACK_DIGEST_WINDOW', DEFAULT_DIGEST_WINDOW)),
+            journal=AlertJournal(journal_path) if journal_path else None,
+        )
+
+    def start(self):
+        self._worker.start()
+
+    def _queue(self, alert_id, alert):
+        self._pending.setdefault(alert['channel'], deque()).append(
+            {'id': alert_id, 'attachment': alert['attachment'], 'attempts': 0})
+        self.stats['queued'] += 1
+
+    def enqueue(self, channel, attachment):
+        """Queue one alert attachment for `channel`; returns its ID"""
+        alert_id = uuid.uuid4().hex
+        alert = {'channel': channel, 'attachment': attachment}
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("Slack dispatcher is shut down")
+            if self.journal is not None:
+                self.journal.append(alert_id, alert)
+            self._queue(alert_id, alert)
+            self._cond.notify()
+        return alert_id
+
+    def pending_count(self):
+        with self._cond:
+            return sum(len(alerts) for alerts in self._pending.values())
+
+    def _next_due(self, now):
+        """Pick a channel whose alerts may be posted now, or how long to wait"""
+        earliest = None
+        for channel, alerts in self._pending.items():
+            if not alerts:
+                continue
+            due = self._blocked_until
+            if not self._closing:
+                due = max(due, self._last_post.get(channel, float('-inf')) + self.digest_window)
+            if due <= now:
+                return channel, None
+            earliest = due if earliest is None else min(earliest, due)
+        return None, (earliest - now if earliest is not None else None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    channel, wait = self._next_due(self._clock())
+                    if channel is not None:
+                        alerts = self._pending[channel]
+                        batch = [alerts.popleft() for _ in range(min(len(alerts), MAX_DIGEST_ATTACHMENTS))]
+                        break
+                    if self._closing and not any(self._pending.values()):
+                        return
+                    self._cond.wait(wait)
+            self._send(channel, batch)
+
+    def _payload(self, channel, batch):
+        attachments = [alert['attachment'] for alert in batch]
+        if len(batch) == 1:
+            return {"channel": channel, "attachments": attachments}
+        return {"channel": channel, "text": f"{len(batch)} new alerts", "attachments": attachments}
+
+    def _post(self, payload):
+        token = self.token_cache.get()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        return token, self.session.post(SLACK_POST_URL, headers=headers, json=payload, timeout=self.timeout)
+
+    def _send(self, channel, batch):
+        payload = self._payload(channel, batch)
+        retry = False
+        started = time.perf_counter()
+        try:
+            token, response = self._post(payload)
+            if response.status_code == 429:
+                SLACK_POST_SECONDS.observe(time.perf_counter() - started, outcome='rate_limited')
+                retry_after = float(response.headers.get('Retry-After', 1))
+                logger.warning(f"Slack rate limited posts to {channel}; retrying in {retry_after}s")
+                with self._cond:
+                    self.stats['rate_limited'] += 1
+                    self._blocked_until = self._clock() + retry_after
+                self._requeue(channel, batch, count_attempt=False)
+                return
+            result = response.json()
+            SLACK_POST_SECONDS.observe(time.perf_counter() - started, outcome='ok' if result.get('ok') else 'error')
+            if result.get('ok'):
+                self._finish(channel, batch, delivered=True)
+                return
+            if result.get('error') in INVALID_TOKEN_ERRORS:
+                logger.warning(f"Slack rejected the cached token ({result['error']}), refreshing")
+                self.token_cache.invalidate(token)
+                retry = True
+            else:
+                logger.error(f"Slack API error posting to {channel}: {result.get('error')}")
+        except Exception as e:
+            SLACK_POST_SECONDS.observe(time.perf_counter() - started, outcome='error')
+            logger.error(f"Error posting to Slack {channel}: {e}")
+            retry = True
+
+        if retry:
+            self._requeue(channel, batch)
+        else:
+            self._finish(channel, batch, delivered=False)
+
+    def _requeue(self, channel, batch, count_attempt=True):
+        keep = []
+        for alert in batch:
+            if count_attempt:
+                alert['attempts'] += 1
+            if alert['attempts'] < self.max_attempts:
+                keep.append(alert)
+        dropped = [alert for alert in batch if alert not in keep]
+        with self._cond:
+            self._pending.setdefault(channel, deque()).extendleft(reversed(keep))
+            self._last_post[channel] = self._clock()
+            self._cond.notify()
+        if dropped:
+            logger.error(f"Giving up on {len(dropped)} alerts for {channel}")
+            self._finish(channel, dropped, delivered=False)
+
+    def _finish(self, channel, batch, delivered):
+        with self._cond:
+            self._last_post[channel] = self._clock()
+            if delivered:
+                self.stats['posts'] += 1
+                self.stats['delivered'] += len(batch)
+                if len(batch) > 1:
+                    self.stats['digests'] += 1
+            else:
+                self.stats['dropped'] += len(batch)
+            if self.journal is not None:
+                self.journal.mark_done([alert['id'] for alert in batch])
+                if not any(self._pending.values()):
+                    self.journal.compact()
+
+    def close(self, timeout=None):
+        """Flush queued alerts (ignoring the digest window) and stop the worker"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._worker.is_alive():
+            self._worker.join(timeout)
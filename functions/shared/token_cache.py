@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_RETRY_INTERVAL = 30
+
+# Slack errors meaning the token we sent is no longer any good
+INVALID_TOKEN_ERRORS = ('invalid_auth', 'token_expired', 'token_revoked', 'not_authed')
+
+
+def secret_fetcher(secret_client, project_id, secret_id, version='latest'):
+    """Callable that reads the current value of a Secret Manager secret"""
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version}"
+
+    def fetch():
+        response = secret_client.access_secret_version(request={"name": name})
+        return response.payload.data.decode("UTF-8")
+    return fetch
+
+
+class TokenCache:
+    """Holds a secret in memory and refreshes it in the background
+
+    The first `get()` fetches synchronously. Once the token is older than
+    `ttl`, callers keep getting the cached value while a single background
+    thread fetches a new one. `invalidate()` drops a token the remote side
+    rejected so the next `get()` fetches a fresh one. Safe to share between
+    request threads.
+    """
+
+    def __init__(self, fetch, ttl=DEFAULT_TTL, retry_interval=DEFAULT_RETRY_INTERVAL, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Separate from _lock so readers holding a valid token never wait on the network
+        self._fetch_lock = threading.Lock()
+        self._token = None
+        self._refresh_at = 0.0
+        self._refresh_thread = None
+        self.fetches = 0
+
+    def _fetch(self):
+        token = self.fetch()
+        with self._lock:
+            self._token = token
+            self._refresh_at = self._clock() + self.ttl
+            self.fetches += 1
+        return token
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch()
+        except Exception as e:
+            # Keep serving the current token and try again later
+            logger.error(f"Background token refresh failed: {e}")
+            with self._lock:
+                self._refresh_at = self._clock() + self.retry_interval
+
+    def get(self):
+        with self._lock:
+            token = self._token
+            if token is not None:
+                if self._clock() >= self._refresh_at and not self._refreshing():
+                    self._refresh_thread = threading.Thread(target=self._refresh_in_background, daemon=True)
+                    self._refresh_thread.start()
+                return token
+
+        # No usable token: fetch once while concurrent callers wait for it
+        with self._fetch_lock:
+            with self._lock:
+                if self._token is not None:
+                    return self._token
+            return self._fetch()
+
+    def _refreshing(self):
+        return self._refresh_thread is not None and self._refresh_thread.is_alive()
+
+    def invalidate(self, token=None):
+        """Forget `token` (or whatever is cached) after the remote side rejected it
+
+        Passing the rejected token means threads that all saw the same failure
+        trigger one refetch between them, not one each.
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+
+    def wait_for_refresh(self, timeout=None):
+        """Block until an in-flight background refresh finishes"""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
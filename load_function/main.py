@@ -1,12 +1,284 @@
 import os
+import sys
+import csv
+import copy
 import json
+import time
+import uuid
+import datetime
+import threading
+import fnmatch
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import functions_framework
 from google.cloud import bigquery
+from google.cloud import storage
+
+# metrics.py lives in functions/shared; the Cloud Build config copies it next
+# to main.py, so the local copy wins when present
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions', 'shared'))
+import metrics  # noqa: E402
 
 # Set Google Cloud credentials
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "credintal.json"
 
-def load_to_bigquery(gcs_uri, dataset_id, table_id, write_disposition=None, dedup_on=None):
+SOURCE_FORMATS = ['csv', 'parquet', 'avro']
+DEDUP_MODES = ['rewrite', 'merge']
+
+SCHEMA = [
+    bigquery.SchemaField("title", "STRING"),
+    bigquery.SchemaField("price", "FLOAT"),
+    bigquery.SchemaField("rating", "STRING"),
+    bigquery.SchemaField("scraped_date", "DATE"),
+]
+# Files from detail crawls (EXTRACT_CRAWL=details) add these columns; NULL for listing-only rows
+DETAIL_SCHEMA = SCHEMA + [
+    bigquery.SchemaField("upc", "STRING"),
+    bigquery.SchemaField("availability", "STRING"),
+    bigquery.SchemaField("stock", "INTEGER"),
+    bigquery.SchemaField("category", "STRING"),
+]
+DETAIL_COLUMNS = ['upc', 'availability', 'stock', 'category']
+# A CSV header row is looked for in this many leading bytes
+HEADER_BYTES = 4096
+
+# BigQuery accepts at most this many source URIs in one load job
+MAX_URIS_PER_JOB = 10000
+DEFAULT_PARALLEL_JOBS = 4
+
+# Staging tables expire on their own if a run dies before dropping them
+STAGING_EXPIRATION = datetime.timedelta(hours=6)
+
+STAGE_SECONDS = metrics.histogram('load_stage_seconds', 'Time spent per load stage (client_init, format_detect, '
+                                  'job_submit, job_wait, dedup)', labels=('stage',))
+ROWS_LOADED = metrics.counter('load_rows_total', 'Rows written by BigQuery load jobs')
+REQUESTS = metrics.counter('load_requests_total', 'Load requests by status', labels=('status',))
+
+# Clients are created on first use and reused by every request a warm instance serves
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_or_create_client(kind, factory, project=None):
+    key = (kind, project)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory(project=project)
+                _clients[key] = client
+    return client
+
+def get_bigquery_client(project=None):
+    """Shared BigQuery client for `project` (default project when None)"""
+    return _get_or_create_client('bigquery', bigquery.Client, project)
+
+def get_storage_client(project=None):
+    """Shared Cloud Storage client for `project` (default project when None)"""
+    return _get_or_create_client('storage', storage.Client, project)
+
+class StageTimer:
+    """Accumulates wall-clock milliseconds per named stage into a dict
+
+    Every timed stage is also recorded in the load_stage_seconds histogram.
+    """
+    
+    def __init__(self, timings=None):
+        self.timings = timings if timings is not None else {}
+        self._lock = threading.Lock()
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            self.add({name: elapsed * 1000})
+    
+    def add(self, timings):
+        """Fold another set of stage timings (e.g. from a parallel job) into this one"""
+        with self._lock:
+            for name, elapsed_ms in timings.items():
+                self.timings[name] = round(self.timings.get(name, 0) + elapsed_ms, 3)
+
+# Leading bytes of the self-describing formats
+MAGIC_BYTES = {
+    b'PAR1': 'parquet',
+    b'Obj\x01': 'avro',
+}
+
+def detect_source_format(gcs_uri, storage_client=None):
+    """Work out whether a GCS object is CSV, Parquet or Avro
+    
+    The file extension is trusted when present; otherwise the first bytes of
+    the object are checked for the Parquet/Avro magic numbers.
+    """
+    object_name = gcs_uri.rsplit('/', 1)[-1]
+    extension = object_name.rsplit('.', 1)[-1].lower() if '.' in object_name else ''
+    if extension in SOURCE_FORMATS:
+        return extension
+    if '*' in gcs_uri:
+        return 'csv'
+    
+    bucket_name, _, blob_name = gcs_uri[len('gs://'):].partition('/')
+    storage_client = storage_client or get_storage_client()
+    head = storage_client.bucket(bucket_name).blob(blob_name).download_as_bytes(start=0, end=3)
+    return MAGIC_BYTES.get(head, 'csv')
+
+def has_detail_columns(gcs_uri, storage_client=None):
+    """Whether a CSV object's header row has the detail-crawl columns
+    
+    Listing CSVs (including every file written before detail crawls existed)
+    have only the four listing columns. An object whose header cannot be
+    read counts as a listing CSV; the load job then reports the real problem.
+    """
+    bucket_name, _, blob_name = gcs_uri[len('gs://'):].partition('/')
+    try:
+        storage_client = storage_client or get_storage_client()
+        head = storage_client.bucket(bucket_name).blob(blob_name).download_as_bytes(start=0, end=HEADER_BYTES - 1)
+    except Exception as e:
+        print(f"Could not read the header of {gcs_uri}, loading it as a listing CSV: {e}")
+        return False
+    lines = head.decode('utf-8', errors='replace').splitlines()
+    header = next(csv.reader(lines[:1]), [])
+    return set(DETAIL_COLUMNS) <= set(header)
+
+def build_job_config(source_format='csv', detail=False):
+    """Load job settings for a source format
+    
+    Parquet and Avro carry their own typed schema and load natively; CSV needs
+    the explicit schema (DETAIL_SCHEMA when `detail`, else SCHEMA) and has a
+    header row to skip. Returns a fresh copy of a cached template, so callers
+    may adjust it per request.
+    """
+    return copy.deepcopy(_job_config_template(source_format, detail))
+
+@functools.lru_cache(maxsize=None)
+def _job_config_template(source_format, detail=False):
+    if source_format == 'parquet':
+        return bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET)
+    if source_format == 'avro':
+        return bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.AVRO,
+            use_avro_logical_types=True,  # Load the date logical type as DATE, not INTEGER
+        )
+    return bigquery.LoadJobConfig(
+        schema=DETAIL_SCHEMA if detail else SCHEMA,
+        skip_leading_rows=1,
+        source_format=bigquery.SourceFormat.CSV,
+    )
+
+def parse_columns(columns):
+    """Split a comma-separated column list and check each name against the schema"""
+    if not columns:
+        return []
+    if isinstance(columns, str):
+        columns = columns.split(',')
+    names = [column.strip() for column in columns if column.strip()]
+    known = {field.name for field in DETAIL_SCHEMA}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+    return names
+
+def build_table_options(partition_by=None, cluster_by=None):
+    """Partitioning and clustering settings for the target table
+    
+    Returns (time_partitioning, clustering_fields); either may be None.
+    """
+    time_partitioning = None
+    if partition_by:
+        field = parse_columns(partition_by)[0]
+        time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field=field)
+    clustering_fields = parse_columns(cluster_by) or None
+    return time_partitioning, clustering_fields
+
+def build_dedup_query(dataset_id, table_id, dedup_on, time_partitioning=None, clustering_fields=None):
+    """Full-table dedup: rewrite the table keeping the latest row per key"""
+    table_options = ""
+    if time_partitioning:
+        table_options += f"\n        PARTITION BY {time_partitioning.field}"
+    if clustering_fields:
+        table_options += f"\n        CLUSTER BY {', '.join(clustering_fields)}"
+    return f"""
+        CREATE OR REPLACE TABLE `{dataset_id}.{table_id}`{table_options} AS
+        SELECT * EXCEPT(row_num) FROM (
+          SELECT *, ROW_NUMBER() OVER(PARTITION BY {dedup_on} ORDER BY scraped_date DESC) row_num
+          FROM `{dataset_id}.{table_id}`
+        ) WHERE row_num = 1
+        """
+
+def build_merge_query(dataset_id, table_id, staging_id, keys, schema=SCHEMA):
+    """Incremental dedup: merge the latest staged row per key into the target
+    
+    Only the staged batch is deduplicated and scanned as the source; existing
+    target rows are updated when the staged row is at least as recent. Only
+    the columns of the staged `schema` are written, so a listing-only batch
+    keeps the detail columns the target already has.
+    """
+    columns = [field.name for field in schema]
+    key_list = ', '.join(keys)
+    on_clause = ' AND '.join(f"T.{key} = S.{key}" for key in keys)
+    update_clause = ', '.join(f"{column} = COALESCE(S.{column}, T.{column})" if column in DETAIL_COLUMNS
+                              else f"{column} = S.{column}" for column in columns if column not in keys)
+    return f"""
+        MERGE `{dataset_id}.{table_id}` T
+        USING (
+          SELECT * EXCEPT(row_num) FROM (
+            SELECT *, ROW_NUMBER() OVER(PARTITION BY {key_list} ORDER BY scraped_date DESC) row_num
+            FROM `{dataset_id}.{staging_id}`
+          ) WHERE row_num = 1
+        ) S
+        ON {on_clause}
+        WHEN MATCHED AND S.scraped_date >= T.scraped_date THEN
+          UPDATE SET {update_clause}
+        WHEN NOT MATCHED THEN
+          INSERT ({', '.join(columns)}) VALUES ({', '.join(f"S.{column}" for column in columns)})
+        """
+
+def merge_from_staging(client, dataset_ref, gcs_uri, dataset_id, table_id, job_config, keys,
+                       time_partitioning=None, clustering_fields=None, timer=None, schema=SCHEMA):
+    """Load `gcs_uri` into a temporary staging table and MERGE it into the target
+    
+    The staging table is dropped afterwards whether or not the merge succeeds,
+    and carries an expiration in case the function dies before that. Returns
+    the number of rows loaded into staging.
+    """
+    timer = timer or StageTimer()
+    with timer.stage('job_submit'):
+        target = bigquery.Table(dataset_ref.table(table_id), schema=schema)
+        target.time_partitioning = time_partitioning
+        target.clustering_fields = clustering_fields
+        target = client.create_table(target, exists_ok=True)
+        # Tables created before the detail columns existed get them added (all NULLABLE)
+        missing = [field for field in schema if field.name not in {column.name for column in target.schema}]
+        if missing:
+            target.schema = list(target.schema) + missing
+            client.update_table(target, ['schema'])
+        
+        staging_id = f"{table_id}_staging_{uuid.uuid4().hex[:12]}"
+        staging = bigquery.Table(dataset_ref.table(staging_id), schema=schema)
+        staging.expires = datetime.datetime.now(datetime.timezone.utc) + STAGING_EXPIRATION
+        staging = client.create_table(staging)
+    try:
+        with timer.stage('job_submit'):
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+            load_job = client.load_table_from_uri(gcs_uri, staging.reference, job_config=job_config)
+        with timer.stage('job_wait'):
+            load_job.result()
+        with timer.stage('dedup'):
+            client.query(build_merge_query(dataset_id, table_id, staging_id, keys, schema)).result()
+    finally:
+        with timer.stage('dedup'):
+            client.delete_table(staging.reference, not_found_ok=True)
+    return load_job.output_rows
+
+def load_to_bigquery(gcs_uri, dataset_id, table_id, write_disposition=None, dedup_on=None, source_format=None,
+                     dedup_mode='rewrite', partition_by=None, cluster_by=None, client=None, timings=None,
+                     detail=None):
     """Load data from GCS to BigQuery
     
     Args:
@@ -15,80 +287,364 @@ def load_to_bigquery(gcs_uri, dataset_id, table_id, write_disposition=None, dedu
         table_id: BigQuery table ID
         write_disposition: How to write the data (WRITE_APPEND, WRITE_TRUNCATE, WRITE_EMPTY)
         dedup_on: Column name to use for deduplication
+        source_format: csv, parquet or avro; detected from the object when omitted
+        dedup_mode: 'rewrite' rebuilds the whole table after loading; 'merge'
+            loads into a staging table and MERGEs only the new batch on `dedup_on`
+        partition_by: DATE column (e.g. 'scraped_date') to day-partition the table on
+            when it is created or rewritten
+        cluster_by: Column name(s) to cluster the table on when it is created or rewritten
+        client: Optional bigquery.Client to use instead of the shared one
+        timings: Optional dict that receives per-stage latency in milliseconds
+            (client_init, format_detect, job_submit, job_wait, dedup)
+        detail: Whether a CSV source has the detail-crawl columns; read from
+            the header row when omitted
+    
+    Returns the number of rows written by the load job.
     """
-    client = bigquery.Client()
-    dataset_ref = client.dataset(dataset_id)
-    job_config = bigquery.LoadJobConfig(
-        schema=[
-            bigquery.SchemaField("title", "STRING"),
-            bigquery.SchemaField("price", "FLOAT"),
-            bigquery.SchemaField("rating", "STRING"),
-            bigquery.SchemaField("scraped_date", "DATE"),
-        ],
-        skip_leading_rows=1,
-        source_format=bigquery.SourceFormat.CSV,
-    )
+    timer = StageTimer(timings)
+    with timer.stage('client_init'):
+        client = client or get_bigquery_client()
+        dataset_ref = client.dataset(dataset_id)
+    with timer.stage('format_detect'):
+        if not source_format:
+            source_format = detect_source_format(gcs_uri)
+        if source_format == 'csv' and detail is None:
+            detail = has_detail_columns(gcs_uri)
+    job_config = build_job_config(source_format, bool(detail))
+    time_partitioning, clustering_fields = build_table_options(partition_by, cluster_by)
+    
+    if dedup_on and dedup_mode == 'merge':
+        # Parquet and Avro stage into the widest schema; their columns are matched by name
+        if write_disposition == 'WRITE_TRUNCATE':
+            raise ValueError("dedup_mode 'merge' cannot be combined with WRITE_TRUNCATE")
+        keys = parse_columns(dedup_on)
+        return merge_from_staging(client, dataset_ref, gcs_uri, dataset_id, table_id, job_config, keys,
+                                  time_partitioning, clustering_fields, timer,
+                                  SCHEMA if source_format == 'csv' and not detail else DETAIL_SCHEMA)
+    
+    # Applied when the load creates the table; must match an existing table's settings
+    job_config.time_partitioning = time_partitioning
+    job_config.clustering_fields = clustering_fields
     
     # Set write disposition if provided, default is WRITE_APPEND
     if write_disposition:
         if write_disposition in ["WRITE_APPEND", "WRITE_TRUNCATE", "WRITE_EMPTY"]:
             job_config.write_disposition = getattr(bigquery.WriteDisposition, write_disposition)
+    if write_disposition in (None, 'WRITE_APPEND'):
+        # Appending detail-crawl files to a table created before the detail columns existed.
+        # Schema update options are only accepted with an explicit WRITE_APPEND
+        job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+        job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
     
-    load_job = client.load_table_from_uri(
-        gcs_uri, dataset_ref.table(table_id), job_config=job_config
-    )
+    with timer.stage('job_submit'):
+        load_job = client.load_table_from_uri(
+            gcs_uri, dataset_ref.table(table_id), job_config=job_config
+        )
     
-    load_job.result()  # Wait for the job to complete
+    with timer.stage('job_wait'):
+        load_job.result()  # Wait for the job to complete
     
     # Perform deduplication if requested
     if dedup_on:
-        dedup_query = f"""
-        CREATE OR REPLACE TABLE `{dataset_id}.{table_id}` AS
-        SELECT * EXCEPT(row_num) FROM (
-          SELECT *, ROW_NUMBER() OVER(PARTITION BY {dedup_on} ORDER BY scraped_date DESC) row_num
-          FROM `{dataset_id}.{table_id}`
-        ) WHERE row_num = 1
-        """
-        dedup_job = client.query(dedup_query)
-        dedup_job.result()
+        with timer.stage('dedup'):
+            dedup_query = build_dedup_query(dataset_id, table_id, dedup_on, time_partitioning, clustering_fields)
+            dedup_job = client.query(dedup_query)
+            dedup_job.result()
     
-    table = client.get_table(dataset_ref.table(table_id))
-    return table.num_rows
+    # The finished job already reports its row count; no extra get_table round trip
+    return load_job.output_rows
+
+def expand_uris(gcs_uris, storage_client=None):
+    """Resolve wildcard URIs (gs://bucket/books_*.csv) into the matching objects
+    
+    Concrete URIs are passed through untouched; order is preserved and
+    duplicates are dropped.
+    """
+    expanded = []
+    for gcs_uri in gcs_uris:
+        if '*' not in gcs_uri:
+            expanded.append(gcs_uri)
+            continue
+        bucket_name, _, pattern = gcs_uri[len('gs://'):].partition('/')
+        prefix = pattern.split('*', 1)[0]
+        storage_client = storage_client or get_storage_client()
+        for blob in storage_client.list_blobs(bucket_name, prefix=prefix):
+            if fnmatch.fnmatchcase(blob.name, pattern):
+                expanded.append(f"gs://{bucket_name}/{blob.name}")
+    return list(dict.fromkeys(expanded))
+
+def read_manifest(manifest_uri, storage_client=None):
+    """Read a sharded extract run's manifest (see extract_function/shards.py)
+    
+    Returns (shard URIs that were written, source format, manifest dict).
+    """
+    bucket_name, _, blob_name = manifest_uri[len('gs://'):].partition('/')
+    storage_client = storage_client or get_storage_client()
+    manifest = json.loads(storage_client.bucket(bucket_name).blob(blob_name).download_as_bytes())
+    uris = [shard['gcs_uri'] for shard in manifest['shards'] if shard['status'] == 'success']
+    return uris, manifest.get('format'), manifest
+
+def load_batch(gcs_uris, dataset_id, table_id, write_disposition=None, dedup_on=None, source_format=None,
+               dedup_mode='rewrite', partition_by=None, cluster_by=None, max_parallel_jobs=DEFAULT_PARALLEL_JOBS,
+               client=None, storage_client=None, timings=None):
+    """Load many GCS objects with as few load jobs as possible
+    
+    URIs (wildcards are expanded first) are grouped by source format, and CSVs
+    also by whether their header has the detail columns; each group is
+    submitted as one load job; groups run in parallel, at most
+    `max_parallel_jobs` at a time. If a combined job fails, its URIs are
+    retried one job per URI so a single bad file only fails itself.
+    Deduplication runs once after all loads. Stage timings are summed over
+    jobs. Other arguments are as for load_to_bigquery.
+    
+    Returns a dict with the total rows_loaded and a per-URI `results` list of
+    {gcs_uri, status ('loaded' or 'failed'), rows or error}.
+    """
+    timer = StageTimer(timings)
+    with timer.stage('client_init'):
+        client = client or get_bigquery_client()
+    with timer.stage('format_detect'):
+        uris = expand_uris(gcs_uris, storage_client)
+        if not uris:
+            raise ValueError(f"No objects match {', '.join(gcs_uris)}")
+        groups = {}
+        for gcs_uri in uris:
+            uri_format = source_format or detect_source_format(gcs_uri, storage_client)
+            detail = uri_format == 'csv' and has_detail_columns(gcs_uri, storage_client)
+            groups.setdefault((uri_format, detail), []).append(gcs_uri)
+    jobs = [(source, group[start:start + MAX_URIS_PER_JOB])
+            for source, group in groups.items()
+            for start in range(0, len(group), MAX_URIS_PER_JOB)]
+    
+    # Truncating or requiring an empty table only makes sense for a single job
+    exclusive = write_disposition in ('WRITE_TRUNCATE', 'WRITE_EMPTY')
+    if exclusive and len(jobs) > 1:
+        raise ValueError(f"{write_disposition} needs all URIs in one load job (same format, at most {MAX_URIS_PER_JOB})")
+    merge = bool(dedup_on) and dedup_mode == 'merge'
+    
+    def run_job(job):
+        """Run one load job; returns (rows loaded, error or None, stage timings)"""
+        (uri_format, detail), job_uris = job
+        job_timings = {}
+        try:
+            rows = load_to_bigquery(job_uris, dataset_id, table_id, write_disposition,
+                                    dedup_on if merge else None, uri_format, dedup_mode,
+                                    partition_by, cluster_by, client=client, timings=job_timings, detail=detail)
+            return rows, None, job_timings
+        except Exception as e:
+            return 0, str(e), job_timings
+    
+    # Concurrent MERGEs into one table conflict, so merge mode runs jobs one at a time
+    workers = 1 if merge else max(1, int(max_parallel_jobs))
+    rows_loaded = 0
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        retries = []
+        for (source, job_uris), (rows, error, job_timings) in zip(jobs, executor.map(run_job, jobs)):
+            timer.add(job_timings)
+            if error is None:
+                rows_loaded += rows
+                for gcs_uri in job_uris:
+                    results[gcs_uri] = {'gcs_uri': gcs_uri, 'status': 'loaded'}
+                if len(job_uris) == 1:
+                    results[job_uris[0]]['rows'] = rows
+            elif len(job_uris) == 1 or exclusive:
+                for gcs_uri in job_uris:
+                    results[gcs_uri] = {'gcs_uri': gcs_uri, 'status': 'failed', 'error': error}
+            else:
+                # Isolate the bad objects by loading each URI of the failed job on its own
+                print(f"Combined load of {len(job_uris)} URIs failed, retrying individually: {error}")
+                retries.extend((source, [gcs_uri]) for gcs_uri in job_uris)
+        
+        for (source, job_uris), (rows, error, job_timings) in zip(retries, executor.map(run_job, retries)):
+            timer.add(job_timings)
+            gcs_uri = job_uris[0]
+            if error is None:
+                rows_loaded += rows
+                results[gcs_uri] = {'gcs_uri': gcs_uri, 'status': 'loaded', 'rows': rows}
+            else:
+                results[gcs_uri] = {'gcs_uri': gcs_uri, 'status': 'failed', 'error': error}
+    results = [results[gcs_uri] for gcs_uri in uris]
+    
+    if dedup_on and not merge and any(result['status'] == 'loaded' for result in results):
+        time_partitioning, clustering_fields = build_table_options(partition_by, cluster_by)
+        with timer.stage('dedup'):
+            client.query(build_dedup_query(dataset_id, table_id, dedup_on, time_partitioning, clustering_fields)).result()
+    
+    return {'rows_loaded': rows_loaded, 'results': results}
+
+def load_batch_response(gcs_uris, dataset_id, table_id, write_disposition, dedup_on, source_format,
+                        dedup_mode, partition_by, cluster_by, max_parallel_jobs):
+    """Run load_batch and shape the HTTP response
+    
+    status is 'success' when every URI loaded, 'partial' when only some did
+    and 'error' when none did.
+    """
+    print(f"Batch loading {len(gcs_uris)} URI pattern(s) to BigQuery...")
+    timings = {}
+    try:
+        batch = load_batch(gcs_uris, dataset_id, table_id, write_disposition, dedup_on, source_format,
+                           dedup_mode, partition_by, cluster_by, max_parallel_jobs, timings=timings)
+    except ValueError as e:
+        REQUESTS.inc(status='invalid')
+        return json.dumps({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        REQUESTS.inc(status='error')
+        metrics.log_event('load_failed', severity='ERROR', uris=len(gcs_uris), error=str(e), timings_ms=timings)
+        return json.dumps({
+            'status': 'error',
+            'message': f"Failed to load data to BigQuery: {str(e)}",
+            'timings_ms': timings
+        }), 500
+    
+    results = batch['results']
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    loaded = len(results) - failed
+    status = 'success' if not failed else ('partial' if loaded else 'error')
+    print(f"Loaded {batch['rows_loaded']} rows from {loaded}/{len(results)} objects to {dataset_id}.{table_id}")
+    ROWS_LOADED.inc(batch['rows_loaded'])
+    REQUESTS.inc(status=status)
+    metrics.log_event('load_complete', status=status, table=f"{dataset_id}.{table_id}",
+                      rows_loaded=batch['rows_loaded'], uris_loaded=loaded, uris_failed=failed, timings_ms=timings)
+    
+    return json.dumps({
+        'status': status,
+        'message': f"Loaded {batch['rows_loaded']} rows from {loaded} of {len(results)} objects "
+                   f"to BigQuery table {dataset_id}.{table_id}",
+        'rows_loaded': batch['rows_loaded'],
+        'uris_loaded': loaded,
+        'uris_failed': failed,
+        'results': results,
+        'incremental': write_disposition != 'WRITE_TRUNCATE',
+        'timings_ms': timings
+    }), (500 if status == 'error' else 200)
 
 @functions_framework.http
 def gcs_to_bigquery(request):
     """Cloud Function 2: Load data from GCS to BigQuery"""
+    if getattr(request, 'path', '/') == '/metrics':
+        return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+    
     # Parse request parameters
     request_json = request.get_json(silent=True)
+    missing_input = json.dumps({
+        'status': 'error',
+        'message': "Missing 'gcs_uri' parameter (or 'gcs_uris' or 'manifest_uri')"
+    }), 400
     
-    if not request_json or 'gcs_uri' not in request_json:
+    if not isinstance(request_json, dict):
+        return missing_input
+    
+    gcs_uri = request_json.get('gcs_uri')
+    gcs_uris = request_json.get('gcs_uris')  # Optional: list of URIs and/or wildcards for a batch load
+    if gcs_uri is not None and (not isinstance(gcs_uri, str) or not gcs_uri):
         return json.dumps({
             'status': 'error',
-            'message': "Missing 'gcs_uri' parameter"
+            'message': "'gcs_uri' must be a non-empty string"
         }), 400
-    
-    gcs_uri = request_json['gcs_uri']
+    if gcs_uris is not None and (not isinstance(gcs_uris, list) or not gcs_uris
+                                 or not all(isinstance(uri, str) and uri for uri in gcs_uris)):
+        return json.dumps({
+            'status': 'error',
+            'message': "'gcs_uris' must be a non-empty list of strings"
+        }), 400
+    if not (gcs_uri or gcs_uris or request_json.get('manifest_uri')):
+        return missing_input
     dataset_id = request_json.get('dataset_id', os.environ.get('BQ_DATASET_ID', 'books_dataset'))
     table_id = request_json.get('table_id', os.environ.get('BQ_TABLE_ID', 'books_data'))
     write_disposition = request_json.get('write_disposition')  # Optional: WRITE_APPEND, WRITE_TRUNCATE, WRITE_EMPTY
     dedup_on = request_json.get('dedup_on')  # Optional: column name to deduplicate on (e.g., 'title')
+    source_format = request_json.get('source_format')  # Optional: csv, parquet or avro (detected by default)
+    dedup_mode = request_json.get('dedup_mode', os.environ.get('BQ_DEDUP_MODE', 'rewrite'))  # Optional: rewrite or merge
+    partition_by = request_json.get('partition_by', os.environ.get('BQ_PARTITION_BY'))  # Optional: e.g. 'scraped_date'
+    cluster_by = request_json.get('cluster_by', os.environ.get('BQ_CLUSTER_BY'))  # Optional: e.g. 'title' or 'rating,title'
+    
+    if source_format and source_format not in SOURCE_FORMATS:
+        return json.dumps({
+            'status': 'error',
+            'message': f"Unsupported source_format '{source_format}', expected one of: {', '.join(SOURCE_FORMATS)}"
+        }), 400
+    if dedup_mode not in DEDUP_MODES:
+        return json.dumps({
+            'status': 'error',
+            'message': f"Unsupported dedup_mode '{dedup_mode}', expected one of: {', '.join(DEDUP_MODES)}"
+        }), 400
+    if dedup_mode == 'merge' and write_disposition == 'WRITE_TRUNCATE':
+        return json.dumps({
+            'status': 'error',
+            'message': "dedup_mode 'merge' cannot be combined with WRITE_TRUNCATE"
+        }), 400
+    try:
+        max_parallel_jobs = int(request_json.get('max_parallel_jobs', DEFAULT_PARALLEL_JOBS))  # Optional: batch loads only
+    except (TypeError, ValueError):
+        max_parallel_jobs = 0
+    if max_parallel_jobs < 1:
+        return json.dumps({
+            'status': 'error',
+            'message': "'max_parallel_jobs' must be a positive integer"
+        }), 400
+    
+    # Sharded extract run: load every shard listed in its manifest in one job
+    manifest_uri = request_json.get('manifest_uri')
+    if manifest_uri:
+        try:
+            uris, manifest_format, manifest = read_manifest(manifest_uri)
+        except Exception as e:
+            return json.dumps({
+                'status': 'error',
+                'message': f"Could not read manifest {manifest_uri}: {str(e)}"
+            }), 400
+        if not manifest['complete'] and not request_json.get('allow_partial'):
+            missing = [shard['shard'] for shard in manifest['shards'] if shard['status'] != 'success']
+            return json.dumps({
+                'status': 'error',
+                'message': f"Manifest {manifest_uri} is missing shard(s) {missing}; "
+                           "re-run the extract or pass allow_partial"
+            }), 409
+        if not uris:
+            return json.dumps({
+                'status': 'error',
+                'message': f"Manifest {manifest_uri} lists no shard objects"
+            }), 400
+        return load_batch_response(uris, dataset_id, table_id, write_disposition, dedup_on,
+                                   source_format or manifest_format, dedup_mode, partition_by, cluster_by,
+                                   max_parallel_jobs)
+    
+    # Batch load: several URIs or a wildcard, one combined result with per-URI status
+    if gcs_uris or '*' in gcs_uri:
+        uris = (gcs_uris or []) + ([gcs_uri] if gcs_uri else [])
+        return load_batch_response(uris, dataset_id, table_id, write_disposition, dedup_on, source_format,
+                                   dedup_mode, partition_by, cluster_by, max_parallel_jobs)
     
     # Load to BigQuery
     print(f"Loading data from {gcs_uri} to BigQuery...")
+    timings = {}
     try:
-        rows_loaded = load_to_bigquery(gcs_uri, dataset_id, table_id, write_disposition, dedup_on)
+        rows_loaded = load_to_bigquery(gcs_uri, dataset_id, table_id, write_disposition, dedup_on, source_format,
+                                       dedup_mode, partition_by, cluster_by, timings=timings)
         print(f"Loaded {rows_loaded} rows to BigQuery table {dataset_id}.{table_id}")
+        ROWS_LOADED.inc(rows_loaded)
+        REQUESTS.inc(status='success')
+        metrics.log_event('load_complete', status='success', table=f"{dataset_id}.{table_id}",
+                          rows_loaded=rows_loaded, timings_ms=timings)
         
         return json.dumps({
             'status': 'success',
             'message': f"Loaded {rows_loaded} rows to BigQuery table {dataset_id}.{table_id}",
             'rows_loaded': rows_loaded,
-            'incremental': write_disposition != 'WRITE_TRUNCATE'
+            'incremental': write_disposition != 'WRITE_TRUNCATE',
+            'timings_ms': timings
         })
     except Exception as e:
+        REQUESTS.inc(status='error')
+        metrics.log_event('load_failed', severity='ERROR', gcs_uri=gcs_uri, error=str(e), timings_ms=timings)
         return json.dumps({
             'status': 'error',
-            'message': f"Failed to load data to BigQuery: {str(e)}"
+            'message': f"Failed to load data to BigQuery: {str(e)}",
+            'timings_ms': timings
         }), 500
 
 # For local testing
@@ -0,0 +1,66 @@
+"""Helpers shared by the tests: building requests and routers over the stand-ins"""
+import base64
+import json
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeLanguageClient, FakeSecretClient  # noqa: E402
+from sentiment_router import DEFAULT_SINKS, SentimentRouter, build_sinks, make_analyzer  # noqa: E402
+from token_cache import TokenCache, secret_fetcher  # noqa: E402
+
+
+async def asgi_request(app, method, path, body=b'', headers=None):
+    """Send one request straight to an ASGI app; returns (status, headers, body)"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode('ascii'), 'query_string': b'', 'root_path': '',
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in (headers or {}).items()],
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': None, 'headers': {}, 'body': b''}
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode('latin-1'): value.decode('latin-1')
+                                   for name, value in message.get('headers', [])}
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    return response['status'], response['headers'], response['body']
+
+
+def push_envelope(feedback, message_id=None):
+    """Pub/Sub push request body carrying `feedback` as base64 JSON"""
+    message = {'data': base64.b64encode(json.dumps(feedback).encode('utf-8')).decode('ascii')}
+    if message_id is not None:
+        message['messageId'] = message_id
+    return {'message': message}
+
+
+def slack_token_cache(secret_client=None):
+    """TokenCache for the Slack token, read from `secret_client` (a fresh FakeSecretClient by default)"""
+    return TokenCache(secret_fetcher(secret_client or FakeSecretClient(), 'test-project', 'SLACK_TOKEN'))
+
+
+def make_router(slack=None, language_client=None, config=None, sentiment_cache=None, secret_client=None):
+    """SentimentRouter over stand-in clients, with its Slack sinks posting through `slack`
+
+    Without `sentiment_cache` every analysis reaches `language_client`.
+    """
+    sinks = build_sinks(DEFAULT_SINKS if config is None else config, token_cache=slack_token_cache(secret_client))
+    if slack is not None:
+        for sink in sum(sinks.values(), []):
+            if hasattr(sink, 'post'):
+                sink.post = slack
+    return SentimentRouter(make_analyzer(language_client or FakeLanguageClient(), sentiment_cache), sinks)
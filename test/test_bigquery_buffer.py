@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeBigQueryClient, load_module  # noqa: E402
+from helpers import push_envelope  # noqa: E402
+from bigquery_buffer import BigQueryRowBuffer  # noqa: E402
+from sentiment_router import BigQuerySink, SentimentRouter, handle_push  # noqa: E402
+
+TABLE = 'feedback.analyzed'
+
+
+def test_routed_feedback_is_inserted_in_bounded_batches():
+    client = FakeBigQueryClient(job_latency=0.005)
+    row_buffer = BigQueryRowBuffer(client, max_rows=100, max_latency=0.05)
+    sink = BigQuerySink(TABLE, row_buffer=row_buffer)
+    router = SentimentRouter(lambda text: ('positive', 0.8), {'positive': [sink]})
+
+    deliveries = [push_envelope({'user_id': f'u{index}', 'message': f'great {index}'}, str(index))
+                  for index in range(1000)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        statuses = list(pool.map(lambda delivery: handle_push(delivery, router)[1], deliveries))
+    row_buffer.close(timeout=10)
+
+    assert statuses == [200] * 1000
+    sizes = [len(insert['rows']) for insert in client.inserts]
+    assert sum(sizes) == 1000
+    assert max(sizes) <= 100
+    # Batched, not one call per message
+    assert len(client.inserts) < 50
+    rows = [row for insert in client.inserts for row in insert['rows']]
+    assert sorted(int(row['message_id']) for row in rows) == list(range(1000))
+    assert client.inserts[0]['row_ids'] == [row['message_id'] for row in client.inserts[0]['rows']]
+    assert {(row['sentiment'], row['score']) for row in rows} == {('positive', 0.8)}
+    assert row_buffer.stats['inserted'] == 1000
+
+
+def test_partial_batch_is_flushed_after_max_latency():
+    client = FakeBigQueryClient()
+    row_buffer = BigQueryRowBuffer(client, max_rows=100, max_latency=0.05)
+    for index in range(3):
+        row_buffer.add(TABLE, {'user_id': f'u{index}'})
+
+    deadline = time.monotonic() + 2
+    while row_buffer.stats['inserted'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [len(insert['rows']) for insert in client.inserts] == [3]
+    row_buffer.close()
+
+
+def test_failed_inserts_are_retried_without_losing_rows():
+    client = FakeBigQueryClient(fail_inserts=2)
+    row_buffer = BigQueryRowBuffer(client, max_rows=4, max_latency=10, retry_backoff=0.01)
+    for index in range(10):
+        row_buffer.add(TABLE, {'user_id': f'u{index}'}, row_id=str(index))
+    row_buffer.close(timeout=10)
+
+    assert sorted(int(row_id) for insert in client.inserts for row_id in insert['row_ids']) == list(range(10))
+    assert row_buffer.stats['retries'] == 2
+    assert row_buffer.stats['dropped'] == 0
+
+
+def test_positive_service_alone_records_every_sentiment(monkeypatch, caplog):
+    monkeypatch.setenv('FEEDBACK_TABLE', TABLE)
+    positive = load_module('functions/positive-sentiment/main.py', 'feedback_table_positive')
+    with caplog.at_level(logging.WARNING, logger='sentiment_service'):
+        negative = load_module('functions/negative-sentiment/main.py', 'feedback_table_negative')
+    client = FakeBigQueryClient()
+    positive.bigquery_buffer._client = client
+    scores = {'great': ('positive', 0.8), 'awful': ('negative', -0.7), 'fine': ('neutral', 0.0)}
+    positive.router.analyze_sentiment = scores.get
+
+    for index, text in enumerate(scores):
+        assert handle_push(push_envelope({'user_id': 'u1', 'message': text}, str(index)), positive.router)[1] == 200
+    positive.bigquery_buffer.close(timeout=10)
+
+    rows = [row for insert in client.inserts for row in insert['rows']]
+    assert sorted(row['sentiment'] for row in rows) == ['negative', 'neutral', 'positive']
+    assert not any(isinstance(sink, BigQuerySink) for sinks in negative.router.sinks.values() for sink in sinks)
+    assert 'FEEDBACK_TABLE is set but negative-sentiment does not record feedback' in caplog.text
+
+
+def test_sigterm_drains_buffered_rows(tmp_path):
+    output = tmp_path / 'inserts.json'
+    script = textwrap.dedent(f"""
+        import atexit, json, sys, time
+        sys.path[:0] = [{os.path.join(TEST_DIR, '..', 'benchmarks')!r},
+                        {os.path.join(TEST_DIR, '..', 'functions', 'shared')!r}]
+        from stand_ins import FakeBigQueryClient
+        from bigquery_buffer import BigQueryRowBuffer, exit_on_sigterm
+
+        client = FakeBigQueryClient(job_latency=0.01)
+        atexit.register(lambda: json.dump([insert['row_ids'] for insert in client.inserts],
+                                          open({str(output)!r}, 'w')))
+        row_buffer = BigQueryRowBuffer(client, max_rows=100, max_latency=60)
+        atexit.register(row_buffer.close, timeout=10)
+        exit_on_sigterm()
+        for index in range(250):
+            row_buffer.add('feedback.analyzed', {{'user_id': str(index)}}, row_id=str(index))
+        print('ready', flush=True)
+        time.sleep(60)
+    """)
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True)
+    assert process.stdout.readline().strip() == 'ready'
+
+    process.send_signal(signal.SIGTERM)
+
+    assert process.wait(timeout=20) == 128 + signal.SIGTERM
+    batches = json.loads(output.read_text())
+    assert sorted(int(row_id) for batch in batches for row_id in batch) == list(range(250))
+    assert [len(batch) for batch in batches] == [100, 100, 50]
@@ -0,0 +1,112 @@
+import csv
+import io
+import os
+import sys
+
+import requests
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import BOOKS_PER_PAGE, CatalogueServer, FakeStorageClient, book_for, load_module  # noqa: E402
+
+extract_main = load_module('extract_function/main.py', 'crawler_extract')
+crawler = sys.modules['crawler']
+page_cache = sys.modules['page_cache']
+
+
+def listing_urls(catalogue, pages):
+    return [f"{catalogue.base_url}/page-{page}.html" for page in range(1, pages + 1)]
+
+
+def test_crawl_follows_each_product_once_and_enriches_records():
+    stats = {}
+    with CatalogueServer(num_pages=3) as catalogue:
+        # Page 2 is listed twice and every product is linked from its image and its title
+        urls = listing_urls(catalogue, 3) + [f"{catalogue.base_url}/page-2.html#top"]
+        records = list(crawler.crawl_books(urls, concurrency=4, stats=stats))
+
+    books = 3 * BOOKS_PER_PAGE
+    assert catalogue.detail_hits == books
+    assert stats['listing_pages'] == 3 and stats['detail_pages'] == books
+    assert stats['links'] == 2 * books and stats['duplicate_links'] == books
+    by_upc = {record['upc']: record for record in records}
+    assert len(by_upc) == books
+    book = book_for(7)
+    record = by_upc[book['upc']]
+    assert record['title'] == book['title'] and record['category'] == book['category']
+    assert record['availability'] == f"In stock ({book['stock']} available)"
+    assert record['url'].endswith(f"/{book['slug']}/index.html")
+
+
+def test_interrupted_crawl_resumes_without_refetching(tmp_path):
+    location = str(tmp_path / 'crawl.json')
+    with CatalogueServer(num_pages=3) as catalogue:
+        first = crawler.crawl_books(listing_urls(catalogue, 3), concurrency=2,
+                                    checkpoint=crawler.CrawlCheckpoint(page_cache.open_store(location), every=5))
+        seen = [next(first) for _ in range(25)]
+        first.close()
+        fetched = catalogue.detail_hits
+        listing_hits = catalogue.hits - fetched
+
+        stats = {}
+        rest = list(crawler.crawl_books(listing_urls(catalogue, 3), concurrency=2, stats=stats,
+                                        checkpoint=crawler.CrawlCheckpoint(page_cache.open_store(location))))
+
+    books = 3 * BOOKS_PER_PAGE
+    assert {record['upc'] for record in rest} == {book_for(index)['upc'] for index in range(books)}
+    assert len(rest) == books and stats['resumed'] >= len(seen)
+    # Every detail and listing page was requested once across both runs
+    assert catalogue.detail_hits == books
+    assert catalogue.hits - catalogue.detail_hits == listing_hits + stats['listing_pages'] == 3
+    assert page_cache.open_store(location).load()['complete']
+
+
+class TruncatingSession(requests.Session):
+    """Session that returns an empty body for one URL, as a dropped connection might"""
+
+    def __init__(self, broken_url):
+        super().__init__()
+        self.broken_url = broken_url
+
+    def get(self, url, **kwargs):
+        response = super().get(url, **kwargs)
+        if url == self.broken_url:
+            response._content = b''
+        return response
+
+
+def test_unparsable_page_fails_alone(tmp_path):
+    location = str(tmp_path / 'crawl.json')
+    stats = {}
+    with CatalogueServer(num_pages=2) as catalogue:
+        broken_url = f"{catalogue.base_url}/{book_for(3)['slug']}/index.html"
+        records = list(crawler.crawl_books(listing_urls(catalogue, 2), concurrency=4, parser='lxml', stats=stats,
+                                           session=TruncatingSession(broken_url),
+                                           checkpoint=crawler.CrawlCheckpoint(page_cache.open_store(location))))
+
+    assert len(records) == 2 * BOOKS_PER_PAGE - 1
+    assert book_for(3)['upc'] not in {record['upc'] for record in records}
+    assert stats['failed'] == 1 and stats['retried'] == 0
+    saved = page_cache.open_store(location).load()
+    assert saved['queued'] == [broken_url] and not saved['complete']
+
+
+def test_extract_with_detail_crawl_writes_detail_columns(monkeypatch):
+    storage_client = FakeStorageClient()
+    monkeypatch.setattr(extract_main.storage, 'Client', lambda *a, **k: storage_client)
+
+    with CatalogueServer(num_pages=2) as catalogue:
+        gcs_uri, books, page_stats, _, quality = extract_main.extract_pages(
+            1, 2, 'books.csv', 'csv', concurrency=4, base_url=catalogue.base_url, crawl='details')
+
+    assert books == quality['valid'] == page_stats['detail_pages'] == 2 * BOOKS_PER_PAGE
+    rows = list(csv.DictReader(io.StringIO(storage_client.read('giorgi', 'books.csv').decode('utf-8'))))
+    expected = {book['upc']: book for book in map(book_for, range(books))}
+    assert [name for name in rows[0]] == ['title', 'price', 'rating', 'scraped_date',
+                                          'upc', 'availability', 'stock', 'category']
+    for row in rows:
+        book = expected[row['upc']]
+        assert (row['title'], float(row['price']), row['category']) == (book['title'], book['price'],
+                                                                        book['category'])
+        assert row['availability'] == 'In stock' and int(row['stock']) == book['stock']
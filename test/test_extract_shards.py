@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import BOOKS_PER_PAGE, CatalogueServer, FakeBigQueryClient, FakeStorageClient, load_module  # noqa: E402
+
+extract_main = load_module('extract_function/main.py', 'shards_extract')
+load_main = load_module('load_function/main.py', 'shards_load')
+shards = sys.modules['shards']
+
+# Nothing listens here, so every attempt routed to it fails to connect
+DEAD_WORKER = 'http://127.0.0.1:9/'
+
+
+class Request:
+    def __init__(self, body):
+        self.body = body
+
+    def get_json(self, silent=False):
+        return self.body
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two extract workers running as local processes, sharing tmp_path as their bucket"""
+    storage_dir = str(tmp_path / 'gcs')
+    with CatalogueServer(num_pages=10) as catalogue:
+        env = dict(os.environ, CATALOGUE_BASE_URL=catalogue.base_url, METRICS_ENABLED='0')
+        processes = [subprocess.Popen([sys.executable, os.path.join(TEST_DIR, '..', 'benchmarks', 'extract_worker.py'),
+                                       '--storage-dir', storage_dir],
+                                      env=env, stdout=subprocess.PIPE, text=True)
+                     for _ in range(2)]
+        try:
+            urls = []
+            for process in processes:
+                urls.append(process.stdout.readline().split()[-1])
+                # Keep draining the worker's log so it never blocks on a full pipe
+                threading.Thread(target=process.stdout.read, daemon=True).start()
+            yield urls, storage_dir, catalogue
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+
+def test_plan_shards_covers_the_range_once():
+    plan = shards.plan_shards(1, 10, 4)
+
+    assert [(shard['start_page'], shard['end_page']) for shard in plan] == [(1, 3), (4, 6), (7, 8), (9, 10)]
+    assert len(shards.plan_shards(1, 2, 8)) == 2
+
+
+def test_failed_shard_is_retried_alone():
+    attempts = []
+
+    def invoke(shard, attempt):
+        attempts.append((shard['shard'], attempt))
+        if shard['shard'] == 1 and attempt < 2:
+            raise RuntimeError("worker timed out")
+        return {'gcs_uri': f"gs://bucket/shard-{shard['shard']}", 'books': 20}
+
+    results = shards.run_shards(shards.plan_shards(1, 3, 3), invoke, max_attempts=3, sleep=lambda seconds: None)
+
+    assert [result['status'] for result in results] == ['success'] * 3
+    assert [result['attempts'] for result in results] == [1, 3, 1]
+    assert sorted(attempts) == [(0, 0), (1, 0), (1, 1), (1, 2), (2, 0)]
+
+    results = shards.run_shards(shards.plan_shards(1, 3, 3), invoke, max_attempts=2, sleep=lambda seconds: None)
+    assert [result['status'] for result in results] == ['success', 'failed', 'success']
+    assert shards.build_manifest('run', 'csv', results)['complete'] is False
+
+
+def test_at_most_max_workers_shards_run_at_once():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def invoke(shard, attempt):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {'gcs_uri': f"gs://bucket/shard-{shard['shard']}"}
+
+    results = shards.run_shards(shards.plan_shards(1, 12, 12), invoke, max_workers=3)
+
+    assert [result['status'] for result in results] == ['success'] * 12
+    assert peak[0] == 3
+
+
+def test_coordinator_splits_the_rate_limit_between_shards_in_flight(monkeypatch):
+    payloads = []
+
+    def invoker(worker_urls):
+        def invoke(payload, attempt):
+            payloads.append(payload)
+            return {'gcs_uri': f"gs://giorgi/shard-{payload['shard']}.csv", 'books': 20}
+        return invoke
+
+    monkeypatch.setattr(extract_main, 'http_invoker', invoker)
+    monkeypatch.setattr(extract_main.storage, 'Client', lambda *a, **k: FakeStorageClient())
+    monkeypatch.setenv('SHARD_MAX_WORKERS', '4')
+
+    body, status = extract_main.extract_to_gcs(Request({'max_pages': 10, 'shards': 10, 'rate_limit': 2,
+                                                        'worker_urls': [DEAD_WORKER]}))
+
+    assert status == 200, body
+    assert len(payloads) == 10
+    assert {payload['rate_limit'] for payload in payloads} == {0.5}
+
+
+def test_coordinator_fans_out_to_local_workers_and_load_uses_one_job(workers, monkeypatch):
+    urls, storage_dir, catalogue = workers
+    storage_client = FakeStorageClient(root=storage_dir)
+    monkeypatch.setattr(extract_main.storage, 'Client', lambda *a, **k: storage_client)
+    monkeypatch.setenv('SHARD_RETRY_BACKOFF', '0')
+
+    # The dead worker is tried first for two of the shards; their retries move on to a live one
+    body, status = extract_main.extract_to_gcs(Request({'max_pages': 10, 'shards': 4,
+                                                        'worker_urls': [DEAD_WORKER] + urls}))
+    result = json.loads(body)
+
+    assert status == 200, result
+    assert result['status'] == 'success'
+    assert sorted(shard['attempts'] for shard in result['shards']) == [1, 1, 2, 2]
+    assert catalogue.hits == 10
+    shard_uris = [shard['gcs_uri'] for shard in result['shards']]
+    assert all('/shard-0000' in uri for uri in shard_uris)
+
+    bigquery_client = FakeBigQueryClient()
+    monkeypatch.setattr(load_main, '_clients', {('bigquery', None): bigquery_client, ('storage', None): storage_client})
+    uris, source_format, manifest = load_main.read_manifest(result['manifest_uri'])
+    assert manifest['complete'] and manifest['books'] == 10 * BOOKS_PER_PAGE
+    assert source_format == 'csv'
+
+    body, status = load_main.gcs_to_bigquery(Request({'manifest_uri': result['manifest_uri']}))
+
+    assert status == 200, body
+    assert len(bigquery_client.loads) == 1
+    assert sorted(bigquery_client.loads[0]['source_uris']) == sorted(uris) == sorted(shard_uris)
+
+
+def test_incomplete_manifest_is_not_loaded_without_allow_partial(monkeypatch):
+    storage_client = FakeStorageClient()
+    results = [dict(shard, status='success', attempts=1, gcs_uri=f"gs://giorgi/shard-{shard['shard']}.csv", books=20)
+               for shard in shards.plan_shards(1, 2, 2)]
+    results[1] = dict(results[1], status='failed', error='boom')
+    manifest_uri = shards.write_manifest(shards.build_manifest('run1', 'csv', results), 'giorgi', storage_client)
+    bigquery_client = FakeBigQueryClient()
+    monkeypatch.setattr(load_main, '_clients', {('bigquery', None): bigquery_client, ('storage', None): storage_client})
+
+    assert load_main.gcs_to_bigquery(Request({'manifest_uri': manifest_uri}))[1] == 409
+    assert load_main.gcs_to_bigquery(Request({'manifest_uri': manifest_uri, 'allow_partial': True}))[1] == 200
+    assert bigquery_client.loads[0]['source_uris'] == ['gs://giorgi/shard-0.csv']
@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakePublisherClient, FakeSecretClient, load_module  # noqa: E402
+from lazy_clients import LazyClient, warm_up  # noqa: E402
+from token_cache import secret_fetcher  # noqa: E402
+
+
+def test_client_is_built_once_under_concurrent_first_use():
+    built = []
+    lock = threading.Lock()
+
+    def factory():
+        time.sleep(0.05)
+        with lock:
+            built.append(1)
+        return FakeSecretClient(value='token')
+
+    client = LazyClient('secret_manager', factory)
+    fetch = secret_fetcher(client, 'p', 'SLACK_TOKEN')
+    assert not client.ready
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        tokens = list(pool.map(lambda _: fetch(), range(32)))
+
+    assert tokens == ['token'] * 32
+    assert len(built) == 1
+    assert client.ready and client.init_seconds >= 0.05
+    assert warm_up(client) == {'secret_manager': round(client.init_seconds * 1000, 3)}
+
+
+def test_receiver_loads_its_publisher_on_warmup_not_import(monkeypatch):
+    from google.cloud import pubsub_v1
+    publisher = FakePublisherClient()
+    monkeypatch.setattr(pubsub_v1, 'PublisherClient', lambda *a, **k: publisher)
+    receiver = load_module('functions/feedback-receiver/app.py', 'lazy_receiver')
+    assert not receiver.publisher.ready
+
+    response = receiver.app.test_client().get('/warmup')
+
+    assert response.status_code == 200
+    assert set(response.get_json()['init_ms']) == {'pubsub_publisher'}
+    assert receiver.publisher.get() is publisher
@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import FakeBigQueryClient, FakeStorageClient, load_module  # noqa: E402
+
+load_main = load_module('load_function/main.py', 'load_main')
+
+URIS = [f'gs://giorgi/books_2024011{day}_000000.csv' for day in range(5)]
+
+
+@pytest.fixture(autouse=True)
+def storage_client(monkeypatch):
+    """Stand-in bucket for the CSV headers load_batch reads"""
+    storage_client = FakeStorageClient()
+    monkeypatch.setitem(load_main._clients, ('storage', None), storage_client)
+    return storage_client
+
+
+class Request:
+    def __init__(self, body):
+        self.body = body
+
+    def get_json(self, silent=False):
+        return self.body
+
+
+def test_uris_of_one_format_load_in_a_single_job():
+    client = FakeBigQueryClient(rows_per_load=10)
+
+    batch = load_main.load_batch(URIS, 'books_dataset', 'books_data', dedup_on='title', client=client)
+
+    assert len(client.loads) == 1
+    assert client.loads[0]['source_uris'] == URIS
+    assert batch['rows_loaded'] == 50
+    assert [result['status'] for result in batch['results']] == ['loaded'] * 5
+    # Dedup runs once for the whole batch, not once per file
+    assert len(client.queries) == 1
+
+
+def test_failed_combined_job_is_retried_per_uri():
+    client = FakeBigQueryClient(rows_per_load=10, fail_uris=[URIS[2]])
+
+    batch = load_main.load_batch(URIS, 'books_dataset', 'books_data', client=client)
+
+    assert len(client.loads) == 1 + len(URIS)
+    statuses = {result['gcs_uri']: result['status'] for result in batch['results']}
+    assert statuses.pop(URIS[2]) == 'failed'
+    assert set(statuses.values()) == {'loaded'}
+    assert batch['rows_loaded'] == 40
+    assert 'Error while reading data' in batch['results'][2]['error']
+
+
+def test_wildcards_expand_and_formats_load_in_separate_jobs():
+    storage_client = FakeStorageClient()
+    for name in ['books_1.csv', 'books_2.csv', 'books_3.parquet', 'other.csv']:
+        storage_client.bucket('giorgi').blob(name).upload_from_string(b'data')
+    client = FakeBigQueryClient()
+
+    batch = load_main.load_batch(['gs://giorgi/books_*'], 'books_dataset', 'books_data',
+                                 client=client, storage_client=storage_client)
+
+    assert [result['gcs_uri'] for result in batch['results']] == [
+        'gs://giorgi/books_1.csv', 'gs://giorgi/books_2.csv', 'gs://giorgi/books_3.parquet']
+    formats = sorted(load['job_config'].source_format for load in client.loads)
+    assert formats == ['CSV', 'PARQUET']
+
+
+def test_listing_and_detail_csvs_load_in_separate_jobs_with_their_own_schema(storage_client):
+    bucket = storage_client.bucket('giorgi')
+    bucket.blob('books_1.csv').upload_from_string(b'title,price,rating,scraped_date\r\nA,1.0,One,2024-01-15\r\n')
+    bucket.blob('books_2.csv').upload_from_string(
+        b'"title","price","rating","scraped_date","upc","availability","stock","category"\n')
+    client = FakeBigQueryClient()
+
+    load_main.load_batch(['gs://giorgi/books_*'], 'books_dataset', 'books_data', client=client,
+                         storage_client=storage_client)
+
+    columns = {load['source_uris'][0]: len(load['job_config'].schema) for load in client.loads}
+    assert columns == {'gs://giorgi/books_1.csv': 4, 'gs://giorgi/books_2.csv': 8}
+
+
+def test_batch_endpoint_reports_partial_failure(monkeypatch):
+    client = FakeBigQueryClient(fail_uris=[URIS[0]])
+    monkeypatch.setattr(load_main, 'get_bigquery_client', lambda project=None: client)
+
+    body, status = load_main.gcs_to_bigquery(Request({'gcs_uris': URIS[:2]}))
+    response = json.loads(body)
+
+    assert status == 200
+    assert response['status'] == 'partial'
+    assert (response['uris_loaded'], response['uris_failed']) == (1, 1)
+    assert response['results'][1] == {'gcs_uri': URIS[1], 'status': 'loaded', 'rows': 20}
+
+
+@pytest.mark.parametrize('body, message', [
+    (None, "Missing 'gcs_uri'"),
+    ({'gcs_uris': None}, "Missing 'gcs_uri'"),
+    ({'gcs_uri': None}, "Missing 'gcs_uri'"),
+    ({'gcs_uri': ''}, "'gcs_uri' must be a non-empty string"),
+    ({'gcs_uri': ['gs://giorgi/books.csv']}, "'gcs_uri' must be a non-empty string"),
+    ({'gcs_uris': []}, "'gcs_uris' must be a non-empty list"),
+    ({'gcs_uris': ['gs://giorgi/books.csv', 7]}, "'gcs_uris' must be a non-empty list"),
+    ({'gcs_uris': URIS, 'max_parallel_jobs': 'four'}, "'max_parallel_jobs' must be a positive integer"),
+    ({'gcs_uris': URIS, 'max_parallel_jobs': None}, "'max_parallel_jobs' must be a positive integer"),
+    ({'gcs_uris': URIS, 'max_parallel_jobs': 0}, "'max_parallel_jobs' must be a positive integer"),
+    ({'manifest_uri': 'gs://giorgi/manifest.json', 'max_parallel_jobs': -2},
+     "'max_parallel_jobs' must be a positive integer"),
+])
+def test_missing_or_malformed_uris_are_rejected(body, message):
+    response, status = load_main.gcs_to_bigquery(Request(body))
+
+    assert status == 400
+    assert message in json.loads(response)['message']
@@ -0,0 +1,178 @@
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import FakeBigQueryClient, FakeStorageClient, load_module  # noqa: E402
+
+load_main = load_module('load_function/main.py', 'load_main')
+
+GCS_URI = 'gs://giorgi/books_20240115_000000.csv'
+LISTING_CSV = b'title,price,rating,scraped_date\r\nSharp Objects,47.82,Four,2024-01-15\r\n'
+DETAIL_CSV = (b'"title","price","rating","scraped_date","upc","availability","stock","category"\n'
+              b'"Sharp Objects",47.82,"Four",2024-01-15,"e00eb4fd7b871a48","In stock",20,"Mystery"\n')
+
+
+@pytest.fixture(autouse=True)
+def storage_client(monkeypatch):
+    """Serve the CSV headers load_to_bigquery reads from a stand-in bucket"""
+    storage_client = FakeStorageClient()
+    monkeypatch.setitem(load_main._clients, ('storage', None), storage_client)
+    return storage_client
+
+
+def test_merge_mode_stages_merges_and_drops_staging_table():
+    client = FakeBigQueryClient()
+
+    rows = load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title',
+                                      dedup_mode='merge', client=client)
+
+    methods = [call for call, _ in client.calls]
+    assert methods == ['create_table', 'create_table', 'load_table_from_uri', 'query', 'delete_table']
+    staging_id = client.calls[1][1]
+    assert staging_id.startswith('books_data_staging_')
+    assert client.calls[2] == ('load_table_from_uri', staging_id)
+    assert client.calls[4] == ('delete_table', staging_id)
+    assert client.last_load['job_config'].write_disposition == 'WRITE_APPEND'
+    assert rows == client.rows_per_load
+
+
+def test_merge_query_only_reads_the_staged_batch():
+    client = FakeBigQueryClient()
+
+    load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title',
+                               dedup_mode='merge', client=client)
+
+    sql = client.queries[0]
+    staging_id = client.calls[1][1]
+    assert 'CREATE OR REPLACE' not in sql
+    assert 'MERGE `books_dataset.books_data` T' in sql
+    assert f'FROM `books_dataset.{staging_id}`' in sql
+    assert 'FROM `books_dataset.books_data`' not in sql
+    assert 'ON T.title = S.title' in sql
+    assert 'UPDATE SET price = S.price, rating = S.rating, scraped_date = S.scraped_date' in sql
+    assert 'WHEN MATCHED AND S.scraped_date >= T.scraped_date' in sql
+
+
+def test_merge_on_composite_key():
+    sql = load_main.build_merge_query('ds', 'books', 'books_staging', ['title', 'rating'])
+
+    assert 'PARTITION BY title, rating' in sql
+    assert 'ON T.title = S.title AND T.rating = S.rating' in sql
+    assert 'UPDATE SET price = S.price, scraped_date = S.scraped_date' in sql
+
+
+def test_staging_table_dropped_when_merge_fails():
+    client = FakeBigQueryClient(fail_queries=True)
+
+    with pytest.raises(RuntimeError):
+        load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title',
+                                   dedup_mode='merge', client=client)
+
+    staging_id = client.calls[1][1]
+    assert client.calls[-1] == ('delete_table', staging_id)
+    assert staging_id not in client.tables
+
+
+def test_merge_creates_target_with_partitioning_and_clustering():
+    client = FakeBigQueryClient()
+
+    load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title', dedup_mode='merge',
+                               partition_by='scraped_date', cluster_by='rating,title', client=client)
+
+    target = client.tables['books_data']
+    assert target.time_partitioning.field == 'scraped_date'
+    assert target.clustering_fields == ['rating', 'title']
+
+
+def test_rewrite_mode_keeps_partitioning_and_clustering():
+    client = FakeBigQueryClient()
+
+    load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title',
+                               partition_by='scraped_date', cluster_by=['title'], client=client)
+
+    sql = client.queries[0]
+    assert 'CREATE OR REPLACE TABLE `books_dataset.books_data`' in sql
+    assert 'PARTITION BY scraped_date' in sql
+    assert 'CLUSTER BY title' in sql
+    job_config = client.last_load['job_config']
+    assert job_config.time_partitioning.field == 'scraped_date'
+    assert job_config.clustering_fields == ['title']
+
+
+@pytest.mark.parametrize('write_disposition, schema_update_options', [
+    (None, ['ALLOW_FIELD_ADDITION']),
+    ('WRITE_APPEND', ['ALLOW_FIELD_ADDITION']),
+    ('WRITE_TRUNCATE', []),
+    ('WRITE_EMPTY', []),
+])
+def test_field_addition_only_with_an_explicit_append(write_disposition, schema_update_options):
+    client = FakeBigQueryClient()
+
+    load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', write_disposition, client=client)
+
+    job_config = client.last_load['job_config']
+    assert job_config.write_disposition == (write_disposition or 'WRITE_APPEND')
+    assert (job_config.schema_update_options or []) == schema_update_options
+
+
+def test_merge_rejects_unknown_dedup_column():
+    with pytest.raises(ValueError):
+        load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title; DROP TABLE x',
+                                   dedup_mode='merge', client=FakeBigQueryClient())
+
+
+def test_rows_loaded_come_from_the_load_job_and_stages_are_timed():
+    client = FakeBigQueryClient(rows_per_load=37)
+    timings = {}
+
+    rows = load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title',
+                                      client=client, timings=timings)
+
+    assert rows == 37
+    assert 'get_table' not in [call for call, _ in client.calls]
+    assert set(timings) == {'client_init', 'format_detect', 'job_submit', 'job_wait', 'dedup'}
+
+
+def test_clients_and_job_configs_are_reused(monkeypatch):
+    created = []
+    monkeypatch.setattr(load_main, '_clients', {})
+    monkeypatch.setattr(load_main.bigquery, 'Client', lambda project=None: created.append(project) or object())
+
+    first = load_main.get_bigquery_client()
+    assert load_main.get_bigquery_client() is first
+    assert created == [None]
+
+    config = load_main.build_job_config('csv')
+    config.write_disposition = 'WRITE_TRUNCATE'
+    assert load_main.build_job_config('csv').write_disposition is None
+
+
+def test_listing_csv_loads_with_the_original_four_columns(storage_client):
+    # A file written before detail crawls existed, as already sits in the bucket
+    storage_client.bucket('giorgi').blob('books_20240115_000000.csv').upload_from_string(LISTING_CSV)
+    storage_client.bucket('giorgi').blob('books_details.csv').upload_from_string(DETAIL_CSV)
+    client = FakeBigQueryClient()
+
+    load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', client=client)
+    load_main.load_to_bigquery('gs://giorgi/books_details.csv', 'books_dataset', 'books_data', client=client)
+
+    listing, detail = (load['job_config'] for load in client.loads)
+    assert [field.name for field in listing.schema] == ['title', 'price', 'rating', 'scraped_date']
+    assert not listing.allow_jagged_rows
+    assert [field.name for field in detail.schema][4:] == load_main.DETAIL_COLUMNS
+
+
+def test_listing_csv_merge_leaves_detail_columns_alone(storage_client):
+    storage_client.bucket('giorgi').blob('books_20240115_000000.csv').upload_from_string(LISTING_CSV)
+    client = FakeBigQueryClient()
+
+    load_main.load_to_bigquery(GCS_URI, 'books_dataset', 'books_data', dedup_on='title', dedup_mode='merge',
+                               client=client)
+
+    target = client.tables['books_data']
+    assert [field.name for field in target.schema] == ['title', 'price', 'rating', 'scraped_date']
+    assert 'upc' not in client.queries[0]
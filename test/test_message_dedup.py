@@ -0,0 +1,130 @@
+import base64
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeLanguageClient, FakeMessage, FakeSlack, FakeSubscriberClient  # noqa: E402
+from helpers import make_router, push_envelope  # noqa: E402
+from message_dedup import DONE, IN_FLIGHT, NEW, FileClaimStore, MessageDeduplicator  # noqa: E402
+from sentiment_router import handle_pulled, handle_push  # noqa: E402
+
+
+class FailingRouter:
+    def __init__(self, failures):
+        self.failures = failures
+        self.routed = 0
+
+    def route(self, feedback):
+        self.routed += 1
+        if self.routed <= self.failures:
+            raise RuntimeError("NL API unavailable")
+
+
+def test_burst_with_duplicates_analyzes_and_alerts_once_per_message():
+    slack = FakeSlack(latency=0.002)
+    language_client = FakeLanguageClient(latency=0.005)
+    # No sentiment cache, so every analysis reaches the NL API
+    router = make_router(slack, language_client)
+    dedup = MessageDeduplicator()
+
+    words = ['love', 'terrible', 'arrived']
+    unique = [push_envelope({'user_id': f'u{index}', 'message': f'{words[index % 3]} order {index}'}, str(1000 + index))
+              for index in range(140)]
+    rng = random.Random(7)
+    # 60 of 200 deliveries (30%) are redeliveries of messages in the burst
+    deliveries = unique + [rng.choice(unique) for _ in range(60)]
+    rng.shuffle(deliveries)
+
+    # Like Pub/Sub push: anything but a 2xx is delivered again later
+    acked = []
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        while deliveries:
+            results = list(pool.map(lambda delivery: (delivery, handle_push(delivery, router, dedup)), deliveries))
+            deliveries = [delivery for delivery, (_, status) in results if status != 200]
+            acked.extend(delivery['message']['messageId'] for delivery, (_, status) in results if status == 200)
+
+    assert len(language_client.calls) == 140
+    assert sorted(language_client.calls) == sorted(json.loads(base64.b64decode(item['message']['data']))['message']
+                                                   for item in unique)
+    # Positive and negative messages alert once each; neutral ones do not alert
+    assert len(slack.posts) == sum(1 for index in range(140) if words[index % 3] != 'arrived')
+    assert set(acked) == {item['message']['messageId'] for item in unique}
+    stats = dedup.stats()
+    assert stats['claimed'] == 140
+    assert stats['duplicates_done'] + stats['duplicates_in_flight'] >= 60
+
+
+def test_in_flight_redelivery_is_deferred_and_failures_release_the_claim():
+    dedup = MessageDeduplicator()
+    router = FailingRouter(failures=1)
+    delivery = push_envelope({'user_id': 'u1', 'message': 'hello'}, '42')
+
+    assert dedup.claim('7')[0] == NEW
+    assert handle_push(push_envelope({'user_id': 'u1', 'message': 'hi'}, '7'), router, dedup)[1] == 429
+    assert router.routed == 0
+
+    assert handle_push(delivery, router, dedup)[1] == 500
+    assert handle_push(delivery, router, dedup) == ('Message processed successfully', 200)
+    assert handle_push(delivery, router, dedup) == ('Message already processed', 200)
+    assert router.routed == 2
+
+
+def test_window_is_bounded_and_shared_store_spans_instances(tmp_path):
+    local = MessageDeduplicator(window=2)
+    for message_id in ('1', '2', '3'):
+        local.claim(message_id)
+        local.complete(message_id)
+    assert local.stats()['entries'] == 2
+    assert local.claim('1')[0] == NEW
+
+    first = MessageDeduplicator(store=FileClaimStore(str(tmp_path)), namespace='positive-sentiment')
+    second = MessageDeduplicator(store=FileClaimStore(str(tmp_path)), namespace='positive-sentiment')
+    other_service = MessageDeduplicator(store=FileClaimStore(str(tmp_path)), namespace='negative-sentiment')
+    assert first.claim('99')[0] == NEW
+    assert second.claim('99') == (IN_FLIGHT, None)
+    first.complete('99')
+    assert second.claim('99') == (DONE, None)
+    assert other_service.claim('99')[0] == NEW
+
+
+def test_release_after_the_lease_ran_out_keeps_the_new_holders_claim(tmp_path):
+    now = [0.0]
+    dedup = MessageDeduplicator(lease=1, store=FileClaimStore(str(tmp_path), lease=0.05), clock=lambda: now[0])
+
+    state, stale_token = dedup.claim('8')
+    assert state == NEW
+    # The first holder stalls past its lease and the redelivery takes over
+    now[0] += 2
+    time.sleep(0.1)
+    state, token = dedup.claim('8')
+    assert state == NEW
+
+    dedup.release('8', stale_token)
+    assert dedup.claim('8') == (IN_FLIGHT, None)
+    assert MessageDeduplicator(store=FileClaimStore(str(tmp_path), lease=60)).claim('8') == (IN_FLIGHT, None)
+
+    dedup.release('8', token)
+    assert dedup.claim('8')[0] == NEW
+
+
+def test_pulled_duplicates_are_acked_without_routing_again():
+    subscriber = FakeSubscriberClient()
+    data = json.dumps({'user_id': 'u1', 'message': 'hi'}).encode('utf-8')
+    router = FailingRouter(failures=0)
+    dedup = MessageDeduplicator()
+
+    for delivery_attempt in (1, 2):
+        message = FakeMessage(subscriber, '5', data, delivery_attempt)
+        assert handle_pulled(message, router, dedup) is True
+    assert router.routed == 1
+
+    # A redelivery while the first is still being handled is nacked for later
+    dedup.claim('6')
+    assert handle_pulled(FakeMessage(subscriber, '6', data), router, dedup) is False
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+import metrics  # noqa: E402
+
+
+def test_counter_renders_labelled_series():
+    registry = metrics.Registry()
+    counter = registry.counter('feedback_total', 'Feedback by outcome', labels=('outcome',))
+    counter.inc(outcome='accepted')
+    counter.inc(2, outcome='accepted')
+    counter.inc(outcome='say "hi"\n')
+
+    text = registry.render()
+
+    assert '# TYPE feedback_total counter' in text
+    assert 'feedback_total{outcome="accepted"} 3' in text
+    assert 'feedback_total{outcome="say \\"hi\\"\\n"} 1' in text
+    assert counter.value(outcome='accepted') == 3
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    histogram = registry.histogram('stage_seconds', 'Stage time', labels=('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage='fetch')
+    with histogram.time(stage='parse'):
+        pass
+
+    lines = registry.render().splitlines()
+
+    assert 'stage_seconds_bucket{stage="fetch",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="fetch",le="1.0"} 3' in lines
+    assert 'stage_seconds_bucket{stage="fetch",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="fetch"} 4.05' in lines
+    assert 'stage_seconds_count{stage="fetch"} 4' in lines
+    assert histogram.count(stage='parse') == 1
+
+
+def test_same_name_returns_the_same_metric_and_kinds_cannot_clash():
+    registry = metrics.Registry()
+    assert registry.counter('requests_total', 'Requests') is registry.counter('requests_total', 'Requests')
+    with pytest.raises(ValueError):
+        registry.histogram('requests_total', 'Requests')
+
+
+def test_gauge_callbacks_report_numeric_stats_only():
+    registry = metrics.Registry()
+    registry.gauge_callback('cache_stats', 'Cache counters', lambda: {'hits': 4, 'hit_rate': 0.5, 'backend': 'redis'})
+    registry.gauge_callback('queue_depth', 'Queued items', lambda: 7)
+
+    text = registry.render()
+
+    assert 'cache_stats{key="hits"} 4' in text
+    assert 'cache_stats{key="hit_rate"} 0.5' in text
+    assert 'backend' not in text
+    assert 'queue_depth 7' in text
+
+
+def test_disabled_metrics_record_nothing(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    registry = metrics.Registry()
+    counter = registry.counter('ignored_total', 'Ignored')
+    histogram = registry.histogram('ignored_seconds', 'Ignored')
+    counter.inc()
+    histogram.observe(1.0)
+    metrics.log_event('ignored')
+
+    assert counter.value() == 0
+    assert histogram.count() == 0
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import BOOKS_PER_PAGE, CatalogueServer, FakeStorageClient, load_module  # noqa: E402
+
+extract_main = load_module('extract_function/main.py', 'page_cache_extract')
+page_cache = sys.modules['page_cache']
+
+PAGES = 3
+
+
+class FailingStorageClient(FakeStorageClient):
+    def commit(self, blob, parts):
+        raise ConnectionError("upload failed")
+
+
+def scrape(catalogue, location, stats):
+    cache = page_cache.PageCache(page_cache.open_store(location))
+    records = list(extract_main.iter_raw_books(1, PAGES, base_url=catalogue.base_url, cache=cache, stats=stats))
+    cache.save()
+    return records
+
+
+def test_validators_are_sent_back_and_304_reuses_cached_records(tmp_path):
+    location = str(tmp_path / 'pages.json')
+    first, second = {}, {}
+    with CatalogueServer(num_pages=PAGES, validators=True) as catalogue:
+        records = scrape(catalogue, location, first)
+        assert catalogue.conditional_requests == []
+        again = scrape(catalogue, location, second)
+
+    assert again == records and len(records) == PAGES * BOOKS_PER_PAGE
+    etags = {entry['etag'] for entry in page_cache.open_store(location).load()['pages'].values()}
+    assert len(catalogue.conditional_requests) == PAGES
+    assert {etag for etag, _ in catalogue.conditional_requests} == etags
+    assert {since for _, since in catalogue.conditional_requests} == {CatalogueServer.LAST_MODIFIED}
+    assert catalogue.not_modified == PAGES
+    assert first == {'fetched': PAGES, 'not_modified': 0, 'unchanged': 0, 'reparsed': PAGES, 'failed': 0}
+    assert second == {'fetched': 0, 'not_modified': PAGES, 'unchanged': 0, 'reparsed': 0, 'failed': 0}
+
+
+def test_unchanged_body_without_validators_is_not_parsed_again(tmp_path):
+    location = str(tmp_path / 'pages.json')
+    stats = {}
+    with CatalogueServer(num_pages=PAGES) as catalogue:
+        records = scrape(catalogue, location, {})
+        # Page PAGES + 1 does not exist, so one request fails
+        cache = page_cache.PageCache(page_cache.open_store(location))
+        again = list(extract_main.iter_raw_books(1, PAGES + 1, base_url=catalogue.base_url, cache=cache,
+                                                 stats=stats))
+
+    assert again == records
+    assert stats == {'fetched': PAGES, 'not_modified': 0, 'unchanged': PAGES, 'reparsed': 0, 'failed': 1}
+    assert stats['fetched'] + stats['not_modified'] + stats['failed'] == PAGES + 1
+    assert stats['unchanged'] + stats['reparsed'] == stats['fetched']
+
+
+def test_cache_is_saved_only_after_the_upload_succeeds(monkeypatch, tmp_path):
+    location = str(tmp_path / 'pages.json')
+    with CatalogueServer(num_pages=PAGES, validators=True) as catalogue:
+        monkeypatch.setattr(extract_main.storage, 'Client', lambda *a, **k: FailingStorageClient())
+        with pytest.raises(ConnectionError):
+            extract_main.extract_pages(1, PAGES, 'books.csv', base_url=catalogue.base_url,
+                                       cache=page_cache.PageCache(page_cache.open_store(location)))
+        assert page_cache.open_store(location).load() is None
+
+        storage_client = FakeStorageClient()
+        monkeypatch.setattr(extract_main.storage, 'Client', lambda *a, **k: storage_client)
+        _, books, stats, _, _ = extract_main.extract_pages(
+            1, PAGES, 'books.csv', base_url=catalogue.base_url,
+            cache=page_cache.PageCache(page_cache.open_store(location)))
+
+    # The retry after the failed upload scraped every page again
+    assert books == PAGES * BOOKS_PER_PAGE and stats['reparsed'] == PAGES
+    assert len(page_cache.open_store(location).load()['pages']) == PAGES
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'extract_function'))
+
+import parsers  # noqa: E402
+
+FIXTURE = os.path.join(TEST_DIR, 'fixtures', 'catalogue_page-1.html')
+
+
+def load_fixture():
+    with open(FIXTURE, 'rb') as page:
+        return page.read()
+
+
+def test_soup_parser_reads_catalogue_page():
+    records = parsers.parse_books_soup(load_fixture())
+
+    assert len(records) == 20
+    assert records[0] == {'title': "A Light in the Attic", 'price': 51.77, 'rating': 'Three'}
+    assert records[11]['title'] == "Shakespeare's Sonnets"
+
+
+@pytest.mark.skipif(parsers.lxml_html is None, reason="lxml not installed")
+def test_lxml_parser_matches_soup_parser():
+    content = load_fixture()
+
+    assert parsers.parse_books_lxml(content) == parsers.parse_books_soup(content)
+
+
+def test_get_parser_falls_back_to_soup_without_lxml(monkeypatch):
+    monkeypatch.setattr(parsers, 'lxml_html', None)
+
+    assert parsers.get_parser('auto') is parsers.parse_books_soup
+    assert parsers.get_parser('lxml') is parsers.parse_books_soup
+    assert parsers.available_parsers() == ['bs4']
+
+
+def test_get_parser_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        parsers.get_parser('regex')
@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeSubscriberClient  # noqa: E402
+from pull_worker import BatchWorker, run_subscriber  # noqa: E402
+from sentiment_router import LogSink, SentimentRouter, handle_pulled  # noqa: E402
+
+
+class Message:
+    def __init__(self, data):
+        self.data = data
+        self.settled = threading.Event()
+        self.acked = None
+
+    def ack(self):
+        self.acked = True
+        self.settled.set()
+
+    def nack(self):
+        self.acked = False
+        self.settled.set()
+
+
+def test_batches_are_cut_by_size_then_by_time():
+    batches = []
+    worker = BatchWorker(lambda message: True, max_batch_size=4, max_batch_latency=0.2)
+    worker._process = lambda batch, process=worker._process: batches.append(len(batch)) or process(batch)
+
+    messages = [Message(b'x') for _ in range(6)]
+    for message in messages:
+        worker(message)
+    time.sleep(0.05)
+    assert batches == [4]
+    assert messages[5].settled.wait(1)
+    assert batches == [4, 2]
+    worker.close()
+    assert worker.stats == {'batches': 2, 'acked': 6, 'nacked': 0}
+
+
+def test_each_message_is_acked_or_nacked_on_its_own():
+    router = SentimentRouter(lambda text: ('neutral', 0.0), {'neutral': [LogSink()]})
+
+    def handle(message):
+        if message.data == b'{"user_id": "u", "message": "api down"}':
+            raise RuntimeError('NL API unavailable')
+        return handle_pulled(message, router)
+
+    worker = BatchWorker(handle, max_batch_size=3, max_batch_latency=0.05)
+    good = Message(json.dumps({'user_id': 'u', 'message': 'fine'}).encode())
+    malformed = Message(b'not json')
+    transient = Message(b'{"user_id": "u", "message": "api down"}')
+    for message in (good, malformed, transient):
+        worker(message)
+    worker.close()
+
+    # Malformed messages are acked (dropped); transient failures are retried
+    assert (good.acked, malformed.acked, transient.acked) == (True, True, False)
+
+
+def test_subscriber_drains_backlog_with_flow_control():
+    subscriber = FakeSubscriberClient()
+    for index in range(200):
+        subscriber.enqueue(json.dumps({'user_id': f'u{index}', 'message': 'hello'}).encode())
+    seen = []
+    worker = BatchWorker(lambda message: seen.append(message.message_id) or True,
+                         max_batch_size=50, max_batch_latency=0.05, max_workers=8)
+    stop = threading.Event()
+    runner = threading.Thread(target=run_subscriber, args=(subscriber, 'sub', worker),
+                              kwargs={'max_messages': 64, 'stop_event': stop})
+    runner.start()
+
+    subscriber.wait_for_acks(200, timeout=10)
+    stop.set()
+    runner.join(5)
+
+    assert sorted(seen, key=int) == [str(index) for index in range(1, 201)]
+    assert worker.stats['acked'] == 200
+    assert worker._closed
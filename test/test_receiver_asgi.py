@@ -0,0 +1,140 @@
+import asyncio
+import gc
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import FakePublisherClient, load_module  # noqa: E402
+from helpers import asgi_request  # noqa: E402
+
+asgi = load_module('functions/feedback-receiver/asgi.py', 'receiver_asgi')
+receiver = asgi.receiver
+
+VALID = json.dumps({'user_id': 'a', 'message': 'great'}).encode('utf-8')
+CASES = [
+    ('application/json', VALID),
+    ('text/plain', VALID),
+    ('application/json', json.dumps({'user_id': 'a'}).encode('utf-8')),
+    ('application/json', b'{not json'),
+]
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    publisher = FakePublisherClient(rpc_latency=0.01)
+    monkeypatch.setattr(receiver, 'publisher', publisher)
+    monkeypatch.setattr(receiver, 'topic_path', 'projects/test/topics/feedback')
+    monkeypatch.setattr(asgi, '_slots', None)
+    return publisher
+
+
+def shape(body):
+    """Response JSON with the generated IDs masked"""
+    data = json.loads(body)
+    return {key: (value if key in ('error', 'status') else type(value).__name__) for key, value in data.items()}
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_asgi_matches_flask_responses(publisher, monkeypatch, mode):
+    monkeypatch.setattr(receiver, 'PUBLISH_MODE', mode)
+    flask_client = receiver.app.test_client()
+
+    for content_type, body in CASES:
+        expected = flask_client.post('/', data=body, headers={'Content-Type': content_type})
+        status, _, asgi_body = asyncio.run(asgi_request(asgi.app, 'POST', '/', body, {'Content-Type': content_type}))
+        assert (status, shape(asgi_body)) == (expected.status_code, shape(expected.get_data())), content_type
+
+    status, _, body = asyncio.run(asgi_request(asgi.app, 'GET', '/health'))
+    assert (status, json.loads(body)) == (200, {'status': 'healthy'})
+
+
+def test_thousands_of_concurrent_requests_share_one_thread(publisher):
+    async def burst():
+        threads_before = threading.active_count()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(asgi_request(asgi.app, 'POST', '/', VALID, {'Content-Type': 'application/json'})
+                                         for _ in range(3000)))
+        return results, time.perf_counter() - started, threading.active_count() - threads_before
+
+    results, elapsed, extra_threads = asyncio.run(burst())
+
+    assert [status for status, _, _ in results] == [200] * 3000
+    assert len({json.loads(body)['message'] for _, _, body in results}) == 3000
+    assert len(publisher.published) == 3000
+    # Waiting requests are coroutines, not threads: only the fake's sender threads
+    # and the publish pool are added
+    assert extra_threads <= 8 + asgi.PUBLISH_THREADS
+    assert elapsed < 10
+
+
+def test_backpressure_suspends_then_rejects(publisher, monkeypatch):
+    monkeypatch.setattr(asgi, 'BACKPRESSURE_TIMEOUT', 0.05)
+
+    async def saturated():
+        asgi._slots = asyncio.Semaphore(0)
+        return await asgi_request(asgi.app, 'POST', '/', VALID, {'Content-Type': 'application/json'})
+
+    status, headers, body = asyncio.run(saturated())
+
+    assert status == 503
+    assert headers['retry-after'] == '1'
+    assert json.loads(body) == receiver.BACKPRESSURE
+
+
+def test_blocking_publish_call_does_not_stall_the_loop(publisher, monkeypatch):
+    publish = publisher.publish
+
+    def slow_publish(*args, **kwargs):
+        time.sleep(0.2)
+        return publish(*args, **kwargs)
+
+    monkeypatch.setattr(publisher, 'publish', slow_publish)
+
+    async def request_and_tick():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.ensure_future(ticker())
+        response = await asgi_request(asgi.app, 'POST', '/', VALID, {'Content-Type': 'application/json'})
+        tick_task.cancel()
+        return response, ticks
+
+    (status, _, _), ticks = asyncio.run(request_and_tick())
+
+    assert status == 200
+    assert ticks >= 10
+
+
+def test_async_mode_retrieves_failed_publishes(publisher, monkeypatch):
+    monkeypatch.setattr(receiver, 'PUBLISH_MODE', 'async')
+
+    def failing_publish(*args, **kwargs):
+        future = Future()
+        threading.Timer(0.05, future.set_exception, [RuntimeError('topic not found')]).start()
+        return future
+
+    monkeypatch.setattr(publisher, 'publish', failing_publish)
+    unhandled = []
+
+    async def failing():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        status, _, _ = await asgi_request(asgi.app, 'POST', '/', VALID, {'Content-Type': 'application/json'})
+        await asyncio.sleep(0.2)
+        gc.collect()
+        return status
+
+    assert asyncio.run(failing()) == 202
+    assert unhandled == []
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import FakePublisherClient, load_module  # noqa: E402
+
+receiver = load_module('functions/feedback-receiver/app.py', 'receiver')
+
+
+def post_batch(monkeypatch, body, mode='sync', content_type='application/x-ndjson'):
+    monkeypatch.setattr(receiver, 'publisher', FakePublisherClient(), raising=False)
+    monkeypatch.setattr(receiver, 'topic_path', 'projects/test/topics/feedback', raising=False)
+    monkeypatch.setattr(receiver, 'PUBLISH_MODE', mode)
+    response = receiver.app.test_client().post('/batch', data=body, content_type=content_type)
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return response, lines
+
+
+def test_batch_reports_each_line_in_order(monkeypatch):
+    body = (b'{"user_id": "a", "message": "great"}\n'
+            b'\n'
+            b'not json\n'
+            b'{"user_id": "b"}\n'
+            b'{"user_id": "c", "message": "bad"}')
+
+    response, lines = post_batch(monkeypatch, body)
+
+    assert response.status_code == 200
+    assert [(line['line'], line['status']) for line in lines[:-1]] == [
+        (1, 'published'), (3, 'error'), (4, 'error'), (5, 'published')]
+    assert lines[-1] == {'summary': {'lines': 4, 'published': 2, 'accepted': 0, 'failed': 2}}
+    assert len(receiver.publisher.published) == 2
+
+
+def test_oversized_line_is_rejected_without_breaking_the_stream(monkeypatch):
+    huge = b'{"user_id": "a", "message": "' + b'x' * (receiver.MAX_LINE_BYTES * 2) + b'"}\n'
+
+    _, lines = post_batch(monkeypatch, huge + b'{"user_id": "b", "message": "ok"}\n', mode='async')
+
+    assert lines[0] == {'line': 1, 'status': 'error', 'error': f'Line exceeds {receiver.MAX_LINE_BYTES} bytes'}
+    assert lines[1]['status'] == 'accepted' and lines[1]['client_id']
+    assert lines[-1]['summary']['accepted'] == 1
+
+
+def test_batch_requires_ndjson_content_type(monkeypatch):
+    response, _ = post_batch(monkeypatch, b'{}', content_type='application/json')
+
+    assert response.status_code == 415
+
+
+def test_metrics_endpoint_reports_publishes(monkeypatch):
+    post_batch(monkeypatch, b'{"user_id": "a", "message": "great"}\nnot json\n')
+
+    response = receiver.app.test_client().get('/metrics')
+
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert 'receiver_feedback_total{outcome="invalid"}' in text
+    assert 'receiver_publish_seconds_count{outcome="published"}' in text
@@ -0,0 +1,136 @@
+import os
+import sys
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from sentiment_cache import FileBackend, LRUCache, SentimentCache, cache_key  # noqa: E402
+
+
+class Scorer:
+    def __init__(self, score=0.8):
+        self.score = score
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return self.score
+
+
+def test_repeats_are_scored_once_and_counted():
+    cache = SentimentCache()
+    scorer = Scorer()
+
+    scores = [cache.get_or_compute(text, scorer) for text in ['Great product!', '  great   PRODUCT! ', 'Broken']]
+
+    assert scores == [0.8, 0.8, 0.8]
+    assert scorer.calls == ['Great product!', 'Broken']
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+    assert stats['hit_rate'] == 1 / 3
+
+
+def test_normalization_ignores_case_whitespace_and_unicode_form():
+    assert cache_key('Café  is\tGREAT') == cache_key('café is great')
+    assert cache_key('great') != cache_key('not great')
+
+
+def test_lru_evicts_least_recently_used_and_expires_entries():
+    now = [0.0]
+    lru = LRUCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+
+    now[0] = 10.0
+    assert lru.get('a') is None
+
+
+def test_file_backend_shares_scores_between_services(tmp_path):
+    positive = SentimentCache(backend=FileBackend(str(tmp_path)))
+    negative = SentimentCache(backend=FileBackend(str(tmp_path)))
+    scorer = Scorer(-0.6)
+
+    assert positive.get_or_compute('Terrible support', scorer) == -0.6
+    assert negative.get_or_compute('terrible support', scorer) == -0.6
+
+    assert len(scorer.calls) == 1
+    assert negative.stats()['shared_hits'] == 1
+
+
+def test_broken_backend_falls_back_to_scoring():
+    class BrokenBackend:
+        def get(self, key):
+            raise ConnectionError('down')
+
+        def set(self, key, value):
+            raise ConnectionError('down')
+
+    cache = SentimentCache(backend=BrokenBackend())
+
+    assert cache.get_or_compute('hello', Scorer(0.1)) == 0.1
+    assert cache.stats()['errors'] == 2
+
+
+def test_concurrent_misses_on_a_shared_backend_score_once(tmp_path):
+    services = [SentimentCache(backend=FileBackend(str(tmp_path))) for _ in range(2)]
+    started = threading.Barrier(2)
+    calls = []
+
+    def slow_score(text):
+        calls.append(text)
+        time.sleep(0.3)
+        return 0.9
+
+    def handle(cache, results):
+        started.wait()
+        results.append(cache.get_or_compute('Amazing service', slow_score))
+
+    results = []
+    threads = [threading.Thread(target=handle, args=(cache, results)) for cache in services]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [0.9, 0.9]
+    assert len(calls) == 1
+    assert sum(cache.stats()['waits'] for cache in services) == 1
+    assert not list(tmp_path.glob('*.lock'))
+
+
+def test_failed_scorer_hands_the_claim_to_a_waiting_caller(tmp_path):
+    backend = FileBackend(str(tmp_path))
+    key = cache_key('Slow day')
+    token = backend.claim(key)
+    cache = SentimentCache(backend=FileBackend(str(tmp_path)))
+    threading.Timer(0.2, backend.release, args=(key, token)).start()
+
+    assert cache.get_or_compute('Slow day', Scorer(0.2)) == 0.2
+    assert cache.stats()['waits'] == 1
+
+
+def test_abandoned_claim_is_taken_over(tmp_path):
+    backend = FileBackend(str(tmp_path), claim_ttl=0.1)
+    assert backend.claim('k') is not None
+    assert backend.claim('k') is None
+
+    time.sleep(0.15)
+    assert backend.claim('k') is not None
+
+
+def test_file_backend_sweeps_expired_entries(tmp_path):
+    backend = FileBackend(str(tmp_path), ttl=0.1, claim_ttl=0.1, sweep_interval=0)
+    backend.set('old', 1)
+    backend.claim('abandoned')
+    time.sleep(0.15)
+
+    backend.set('new', 2)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['new.json']
+    assert backend.get('new') == 2
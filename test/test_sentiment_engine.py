@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeLanguageClient  # noqa: E402
+from sentiment_engine import LexiconScorer, SentimentEngine, categorize  # noqa: E402
+from sentiment_router import make_analyzer  # noqa: E402
+
+scorer = LexiconScorer()
+
+
+def label(text):
+    return categorize(scorer.score(text)[0])
+
+
+def test_lexicon_handles_negation_boosters_and_contrast():
+    assert label('I love this app') == 'positive'
+    assert label('The app keeps crashing') == 'negative'
+    assert scorer.score('not good')[0] < 0
+    assert scorer.score('very slow')[0] < scorer.score('slow')[0]
+    assert label('Nice design but totally broken') == 'negative'
+    assert scorer.score('Delivered on Tuesday') == (0.0, 0)
+
+
+def test_batch_scores_match_single_scores():
+    texts = ['Great!!!', '', 'not bad', 'slow but reliable', 'I hate it', 'order 123']
+    scores, hits = scorer.score_batch(texts)
+
+    assert [scorer.score(text) for text in texts] == list(zip(scores.tolist(), hits.tolist()))
+
+
+def test_hybrid_escalates_only_ambiguous_messages():
+    calls = []
+    engine = SentimentEngine(remote=lambda text: calls.append(text) or 0.1, mode='hybrid', band=0.3)
+
+    assert categorize(engine.score('Absolutely fantastic service, thank you')) == 'positive'
+    assert categorize(engine.score('Terrible, the worst app ever')) == 'negative'
+    assert engine.score('It is okay I guess') == 0.1
+    assert engine.score('How do I reset my password?') == 0.1
+
+    assert calls == ['It is okay I guess', 'How do I reset my password?']
+    assert engine.stats()['api_calls_avoided'] == 0.5
+
+
+def test_wider_band_sends_more_to_the_api():
+    texts = ['I love it', 'Good app', 'Pretty slow', 'Terrible', 'not great']
+    avoided = []
+    for band in (0.0, 0.3, 0.6):
+        engine = SentimentEngine(remote=lambda text: 0.0, mode='hybrid', band=band)
+        engine.score_batch(texts)
+        avoided.append(engine.local_scored)
+
+    assert avoided == sorted(avoided, reverse=True)
+    assert avoided[0] > avoided[-1]
+
+
+def test_analyzer_uses_configured_engine(monkeypatch):
+    monkeypatch.setenv('SENTIMENT_ENGINE', 'hybrid')
+    monkeypatch.setenv('SENTIMENT_LOCAL_BAND', '0.2')
+    language_client = FakeLanguageClient()
+    analyze_sentiment = make_analyzer(language_client)
+
+    assert analyze_sentiment('I love it, amazing work')[0] == 'positive'
+    assert analyze_sentiment('Where is my order?') == ('neutral', 0.0)
+    assert language_client.calls == ['Where is my order?']
+    assert analyze_sentiment.engine.band == 0.2
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError):
+        SentimentEngine(remote=lambda text: 0.0, mode='magic')
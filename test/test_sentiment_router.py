@@ -0,0 +1,73 @@
+import base64
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeLanguageClient, FakeSecretClient, FakeSlack  # noqa: E402
+from helpers import make_router, push_envelope  # noqa: E402
+from sentiment_cache import SentimentCache  # noqa: E402
+from sentiment_router import LogSink, SentimentRouter, build_sinks, handle_push  # noqa: E402
+
+
+def test_each_message_is_analyzed_once_and_routed_by_sentiment():
+    slack = FakeSlack()
+    language_client = FakeLanguageClient()
+    secret_client = FakeSecretClient()
+    router = make_router(slack, language_client, sentiment_cache=SentimentCache(), secret_client=secret_client)
+
+    for message in ['I love it', 'Totally broken', 'It arrived on Tuesday']:
+        assert handle_push(push_envelope({'user_id': 'u1', 'message': message}), router) == \
+            ('Message processed successfully', 200)
+
+    assert language_client.calls == ['I love it', 'Totally broken', 'It arrived on Tuesday']
+    assert [post['json']['channel'] for post in slack.posts] == ['#followup', '#support']
+    assert slack.posts[1]['json']['attachments'][0]['footer'] == 'Please follow up with this user promptly'
+    assert len(secret_client.accesses) == 1
+
+
+def test_failing_sink_does_not_block_the_others():
+    class BrokenSink:
+        def deliver(self, feedback, sentiment, score):
+            raise RuntimeError('sink down')
+
+        def __str__(self):
+            return 'broken'
+
+    router = SentimentRouter(lambda text: ('negative', -0.9), {'negative': [BrokenSink(), LogSink()]})
+
+    result = router.route({'user_id': 'u1', 'message': 'awful'})
+
+    assert result['deliveries'] == [{'sink': 'broken', 'ok': False}, {'sink': 'log', 'ok': True}]
+
+
+def test_slack_sink_refreshes_token_on_invalid_auth():
+    slack = FakeSlack(responses=[{'ok': False, 'error': 'invalid_auth'}])
+    secret_client = FakeSecretClient()
+    router = make_router(slack, secret_client=secret_client)
+
+    result = router.route({'user_id': 'u1', 'message': 'great service'})
+
+    assert result['deliveries'] == [{'sink': 'slack:#followup', 'ok': True}]
+    assert len(slack.posts) == 2
+    assert len(secret_client.accesses) == 2
+
+
+def test_sink_config_is_validated():
+    assert str(build_sinks({'neutral': [{'type': 'log'}]})['neutral'][0]) == 'log'
+    with pytest.raises(ValueError):
+        build_sinks({'angry': [{'type': 'log'}]})
+    with pytest.raises(ValueError):
+        build_sinks({'positive': [{'type': 'email'}]})
+
+
+def test_bad_envelopes_are_rejected():
+    router = make_router()
+
+    assert handle_push({}, router)[1] == 400
+    assert handle_push(push_envelope({'user_id': 'u1'}), router)[1] == 400
+    assert handle_push({'message': {'data': base64.b64encode(b'not json').decode()}}, router)[1] == 400
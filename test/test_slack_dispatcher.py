@@ -0,0 +1,110 @@
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeSlack, load_module  # noqa: E402
+from helpers import slack_token_cache  # noqa: E402
+from sentiment_router import DEFAULT_SINKS, build_sinks  # noqa: E402
+from slack_dispatcher import AlertJournal, SlackDispatcher  # noqa: E402
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_burst_is_coalesced_into_one_digest_per_channel():
+    slack = FakeSlack()
+    dispatcher = SlackDispatcher(slack_token_cache(), session=slack, digest_window=0.3)
+
+    dispatcher.enqueue('#support', {'text': 'alert 0'})
+    wait_until(lambda: len(slack.posts) == 1)
+    for index in range(1, 10):
+        dispatcher.enqueue('#support', {'text': f'alert {index}'})
+    dispatcher.enqueue('#followup', {'text': 'thanks'})
+    wait_until(lambda: dispatcher.stats['delivered'] == 11)
+    dispatcher.close()
+
+    support = [post['json'] for post in slack.posts if post['json']['channel'] == '#support']
+    assert [len(payload['attachments']) for payload in support] == [1, 9]
+    assert support[1]['text'] == '9 new alerts'
+    assert dispatcher.stats['digests'] == 1
+    assert dispatcher.stats['posts'] == 3
+
+
+def test_enqueue_returns_before_slack_answers():
+    slack = FakeSlack(latency=0.5)
+    sinks = build_sinks(DEFAULT_SINKS, token_cache=slack_token_cache(),
+                        dispatcher=SlackDispatcher(slack_token_cache(), session=slack, digest_window=0))
+    sink = sinks['negative'][0]
+
+    start = time.perf_counter()
+    result = sink.deliver({'user_id': 'u1', 'message': 'broken'}, 'negative', -0.8)
+
+    assert time.perf_counter() - start < 0.1
+    assert result['ok'] and result['queued']
+    sink.dispatcher.close()
+    assert slack.posts[0]['json']['attachments'][0]['text'] == 'broken'
+
+
+def test_rate_limit_waits_for_retry_after():
+    slack = FakeSlack(responses=[(429, {'Retry-After': '0.3'}, {'ok': False, 'error': 'ratelimited'})])
+    dispatcher = SlackDispatcher(slack_token_cache(), session=slack, digest_window=0)
+
+    dispatcher.enqueue('#support', {'text': 'first'})
+    wait_until(lambda: dispatcher.stats['delivered'] == 1)
+    dispatcher.close()
+
+    assert len(slack.posts) == 2
+    assert dispatcher.stats['rate_limited'] == 1
+
+
+def test_queued_alerts_survive_a_restart(tmp_path):
+    journal = AlertJournal(str(tmp_path / 'alerts.jsonl'))
+    crashed = SlackDispatcher(slack_token_cache(), session=FakeSlack(), journal=journal, start=False)
+    crashed.enqueue('#support', {'text': 'one'})
+    crashed.enqueue('#support', {'text': 'two'})
+
+    slack = FakeSlack()
+    restarted = SlackDispatcher(slack_token_cache(), session=slack, journal=journal, digest_window=0)
+    restarted.close()
+
+    assert [post['json']['attachments'] for post in slack.posts] == [[{'text': 'one'}, {'text': 'two'}]]
+    assert journal.pending() == []
+    assert os.path.getsize(journal.path) == 0
+
+
+def test_undeliverable_alerts_are_dropped():
+    slack = FakeSlack(responses=[{'ok': False, 'error': 'channel_not_found'}])
+    dispatcher = SlackDispatcher(slack_token_cache(), session=slack, digest_window=0)
+
+    dispatcher.enqueue('#missing', {'text': 'lost'})
+    dispatcher.close()
+
+    assert dispatcher.stats['dropped'] == 1
+    assert dispatcher.pending_count() == 0
+
+
+@pytest.mark.parametrize('service', ['positive-sentiment', 'negative-sentiment', 'sentiment-router'])
+def test_services_post_inline_unless_async_is_turned_on(monkeypatch, caplog, service):
+    monkeypatch.delenv('SLACK_ASYNC', raising=False)
+    monkeypatch.delenv('SLACK_ALERT_JOURNAL', raising=False)
+    module_name = service.replace('-', '_')
+    assert load_module(f'functions/{service}/main.py', f'inline_{module_name}').slack_dispatcher is None
+
+    monkeypatch.setenv('SLACK_ASYNC', 'true')
+    with caplog.at_level(logging.WARNING, logger='slack_dispatcher'):
+        dispatcher = load_module(f'functions/{service}/main.py', f'async_{module_name}').slack_dispatcher
+    dispatcher.close(timeout=1)
+
+    assert dispatcher.journal is None
+    assert 'SLACK_ALERT_JOURNAL is not set' in caplog.text
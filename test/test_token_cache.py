@@ -0,0 +1,92 @@
+import itertools
+import os
+import sys
+import threading
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'functions', 'shared'))
+
+from stand_ins import FakeSecretClient  # noqa: E402
+from token_cache import TokenCache, secret_fetcher  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def hammer(cache, threads=16, calls=50):
+    tokens = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(calls):
+            token = cache.get()
+            with lock:
+                tokens.append(token)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return tokens
+
+
+def make_cache(latency=0.01):
+    counter = itertools.count(1)
+    client = FakeSecretClient(value=lambda: f"token-{next(counter)}", latency=latency)
+    clock = Clock()
+    cache = TokenCache(secret_fetcher(client, 'test-project', 'SLACK_TOKEN'), ttl=300, clock=clock)
+    return client, clock, cache
+
+
+def test_one_fetch_per_ttl_window_under_concurrent_load():
+    client, clock, cache = make_cache()
+
+    assert set(hammer(cache)) == {'token-1'}
+    assert client.accesses == ['projects/test-project/secrets/SLACK_TOKEN/versions/latest']
+
+    clock.now = 299.0
+    hammer(cache)
+    assert len(client.accesses) == 1
+
+    # Past the TTL callers keep the old token while one background refresh runs
+    clock.now = 300.0
+    assert set(hammer(cache)) <= {'token-1', 'token-2'}
+    cache.wait_for_refresh()
+    assert len(client.accesses) == 2
+    assert set(hammer(cache)) == {'token-2'}
+
+
+def test_invalidated_token_is_refetched_once():
+    client, _, cache = make_cache()
+    rejected = cache.get()
+
+    # Every thread saw Slack reject the same token
+    for _ in range(8):
+        cache.invalidate(rejected)
+    assert set(hammer(cache)) == {'token-2'}
+    cache.invalidate(rejected)
+
+    assert cache.get() == 'token-2'
+    assert len(client.accesses) == 2
+
+
+def test_failed_background_refresh_keeps_serving_the_old_token():
+    client, clock, cache = make_cache(latency=0)
+    cache.get()
+
+    def unavailable():
+        raise ConnectionError('secret manager down')
+    client.value = unavailable
+    clock.now = 300.0
+
+    assert cache.get() == 'token-1'
+    cache.wait_for_refresh()
+    assert cache.get() == 'token-1'
+    assert cache.fetches == 1
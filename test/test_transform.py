@@ -0,0 +1,88 @@
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import BOOKS_PER_PAGE, CatalogueServer, FakeStorageClient, load_module  # noqa: E402
+
+extract_main = load_module('extract_function/main.py', 'transform_extract')
+transform = sys.modules['transform']
+
+DAY = datetime.date(2024, 1, 15)
+BAD_RECORDS = [
+    {'title': 7, 'price': '£1.00', 'rating': 'One'},
+    {'title': '  ', 'price': '£1.00', 'rating': 'One'},
+    {'title': 'No price', 'price': None, 'rating': 'Two'},
+    {'title': 'Mis-decoded', 'price': 'Â£12.50', 'rating': 'Two'},
+    {'title': 'Too dear', 'price': '£99999', 'rating': 'Three'},
+    {'title': 'No rating', 'price': '£5'},
+    {'title': 'Six stars', 'price': '£5', 'rating': 'Six'},
+]
+GOOD_RECORDS = [
+    {'title': 'A Light in the Attic', 'price': '£51.77', 'rating': 'Three'},
+    {'title': 'Sharp Objects', 'price': ' £0 ', 'rating': 'Four'},
+    {'title': 'Soumission', 'price': '£50.10', 'rating': 'One'},
+]
+
+
+def test_arrow_and_row_transforms_agree():
+    records = GOOD_RECORDS[:1] + BAD_RECORDS[1:] + GOOD_RECORDS[1:]
+
+    rows, row_rejects, row_stats = transform.transform_batch_rows(records, DAY)
+    table, arrow_rejects, arrow_stats = transform.transform_batch_arrow(records, DAY)
+
+    assert table.to_pylist() == [dict(row, scraped_date=DAY) for row in rows]
+    assert [row['price'] for row in rows] == [51.77, 0.0, 50.1]
+    assert arrow_rejects == row_rejects
+    assert [reject['reason'] for reject in row_rejects] == list(transform.REJECT_REASONS[1:])
+    assert arrow_stats == row_stats
+    assert row_stats['ratings'] == {3: 1, 4: 1, 1: 1} and row_stats['rejected'] == len(BAD_RECORDS) - 1
+
+    # A non-string title cannot be a string column, so the batch takes the row path
+    table, rejects, _ = transform.transform_batch_arrow(BAD_RECORDS[:1] + GOOD_RECORDS, DAY)
+    assert table.num_rows == len(GOOD_RECORDS)
+    assert [reject['reason'] for reject in rejects] == ['invalid_title']
+
+
+@pytest.mark.parametrize('name', ['arrow', 'rows'])
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_extract_writes_valid_rows_and_a_rejects_side_file(monkeypatch, name, output_format):
+    storage_client = FakeStorageClient()
+    monkeypatch.setattr(extract_main.storage, 'Client', lambda *a, **k: storage_client)
+    monkeypatch.setattr(extract_main, 'TRANSFORM_BATCH_ROWS', 16)
+    scrape = extract_main.iter_raw_books
+
+    def with_bad_records(*args, **kwargs):
+        yield from BAD_RECORDS
+        yield from scrape(*args, **kwargs)
+    monkeypatch.setattr(extract_main, 'iter_raw_books', with_bad_records)
+
+    with CatalogueServer(num_pages=3) as catalogue:
+        gcs_uri, books, _, _, quality = extract_main.extract_pages(1, 3, f'books.{output_format}', output_format,
+                                                                   base_url=catalogue.base_url, transform=name)
+
+    assert gcs_uri == f'gs://giorgi/books.{output_format}'
+    assert books == quality['valid'] == 3 * BOOKS_PER_PAGE
+    assert quality['rejected'] == len(BAD_RECORDS)
+    assert quality['batches'] == -(-(books + len(BAD_RECORDS)) // 16)
+    data = storage_client.read('giorgi', f'books.{output_format}')
+    if output_format == 'csv':
+        rows = list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+        assert len(rows) == books
+        assert {row['rating'] for row in rows} <= set(transform.RATINGS)
+        assert all(float(row['price']) > 0 for row in rows)
+    else:
+        table = transform.pyarrow.parquet.read_table(io.BytesIO(data))
+        assert table.num_rows == books and table.schema.field('price').type == transform.pyarrow.float64()
+
+    assert quality['rejects_uri'] == f'gs://giorgi/books.{output_format}.rejects.jsonl'
+    rejects = [json.loads(line) for line in storage_client.read('giorgi', f'books.{output_format}.rejects.jsonl')
+               .decode('utf-8').splitlines()]
+    assert [reject['reason'] for reject in rejects] == list(transform.REJECT_REASONS)
@@ -0,0 +1,101 @@
+import csv
+import datetime
+import io
+import os
+import sys
+
+import fastavro
+import pyarrow
+import pyarrow.parquet
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, '..', 'benchmarks'))
+
+from stand_ins import FakeStorageClient, load_module  # noqa: E402
+
+load_module('extract_function/main.py', 'writers_extract')
+writers = sys.modules['writers']
+load_main = load_module('load_function/main.py', 'writers_load')
+
+CHUNK = 256 * 1024  # Resumable uploads send multiples of 256 KiB
+ROWS = [
+    {'title': 'A Light in the Attic', 'price': 51.77, 'rating': 'Three', 'scraped_date': '2024-01-15'},
+    {'title': 'Sharp Objects', 'price': 47.82, 'rating': 'Four', 'scraped_date': '2024-01-15'},
+]
+
+
+def test_failed_producer_leaves_no_object():
+    client = FakeStorageClient()
+
+    def chunks():
+        yield b'x' * (2 * CHUNK)
+        raise ConnectionError("catalogue went away")
+
+    with pytest.raises(ConnectionError):
+        writers.upload_chunks(chunks(), 'giorgi', 'books.csv', storage_client=client, chunk_size=CHUNK)
+
+    # Neither the final object nor the temporary one under PARTIAL_PREFIX is left
+    assert client.sizes == {}
+
+
+def test_completed_upload_is_copied_to_its_name():
+    client = FakeStorageClient()
+
+    uri = writers.upload_chunks(iter([b'x' * CHUNK, b'tail']), 'giorgi', 'books.csv', storage_client=client,
+                                chunk_size=CHUNK)
+
+    assert uri == 'gs://giorgi/books.csv'
+    assert client.objects == {('giorgi', 'books.csv'): b'x' * CHUNK + b'tail'}
+
+
+def encode(output_format):
+    return b''.join(writers.iter_chunks(iter(ROWS), output_format, chunk_size=64))
+
+
+def test_parquet_writer_keeps_column_types():
+    table = pyarrow.parquet.read_table(io.BytesIO(encode('parquet')))
+
+    assert table.schema.field('price').type == pyarrow.float64()
+    assert table.schema.field('scraped_date').type == pyarrow.date32()
+    assert table.to_pylist() == [dict(row, scraped_date=datetime.date(2024, 1, 15)) for row in ROWS]
+
+
+def test_avro_writer_keeps_column_types():
+    reader = fastavro.reader(io.BytesIO(encode('avro')))
+    fields = {field['name']: field['type'] for field in reader.writer_schema['fields']}
+
+    assert fields['price'] == 'double'
+    assert fields['scraped_date'] == {'type': 'int', 'logicalType': 'date'}
+    assert list(reader) == [dict(row, scraped_date=datetime.date(2024, 1, 15)) for row in ROWS]
+
+
+def test_listing_csv_keeps_the_four_listing_columns():
+    table = pyarrow.Table.from_pylist([dict(row, scraped_date=datetime.date(2024, 1, 15)) for row in ROWS],
+                                      schema=writers._book_schema(detail=False))
+    from_records = encode('csv')
+    from_tables = b''.join(writers.iter_table_chunks(iter([table]), 'csv'))
+
+    for data in (from_records, from_tables):
+        rows = list(csv.reader(io.StringIO(data.decode('utf-8'))))
+        assert rows[0] == writers.FIELDNAMES
+        assert len(rows) == len(ROWS) + 1 and {len(row) for row in rows} == {4}
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('books.parquet', 'parquet'),
+    ('books.AVRO', 'avro'),
+    ('books.csv', 'csv'),
+    ('books_*', 'csv'),
+])
+def test_source_format_comes_from_the_extension(name, expected):
+    # The object does not exist, so the extension alone must decide
+    assert load_main.detect_source_format(f'gs://giorgi/{name}', storage_client=FakeStorageClient()) == expected
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'avro', 'csv'])
+def test_source_format_without_extension_comes_from_magic_bytes(output_format):
+    storage_client = FakeStorageClient()
+    storage_client.bucket('giorgi').blob('books').upload_from_string(encode(output_format))
+
+    assert load_main.detect_source_format('gs://giorgi/books', storage_client=storage_client) == output_format